@@ -0,0 +1,135 @@
+import json
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from urllib.parse import parse_qs, urlsplit
+
+# The most registers one range may ask for, as for a Modbus read.
+MAX_COUNT = 125
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """The registers each inverter's last poll read, as JSON.
+
+    GET /<topic_prefix>/registers gives every block the poll read. With
+    ?address=3004&count=2 it gives that range alone, from input registers unless
+    function_code=3 asks for holding ones. Served from the snapshot query_modbus
+    keeps, so a dashboard or a script reading here puts no load on the datalogger,
+    and a snapshot older than max_age is refused rather than passed off as current.
+    """
+
+    def do_GET(self):
+        try:
+            status, body = 200, self.route()
+        except ApiError as e:
+            status, body = e.status, {"error": str(e)}
+
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def route(self) -> dict:
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+
+        if not parts:
+            return {"inverters": sorted(self.server.apps)}
+
+        if len(parts) < 2 or parts[-1] != "registers":
+            raise ApiError(404, f"No such resource: {url.path}")
+
+        # Everything before registers: a topic_prefix may have slashes of its own.
+        prefix = "/".join(parts[:-1])
+        app = self.server.apps.get(prefix)
+
+        if app is None:
+            raise ApiError(404, f"No inverter publishes under {prefix}")
+
+        snapshot, age = app.snapshot, app.snapshot_age()
+
+        if snapshot.taken_at is None:
+            raise ApiError(503, "Nothing has been read yet")
+
+        if age > self.server.max_age:
+            raise ApiError(503, f"The last poll that read anything was {age:.0f}s ago")
+
+        body = {
+            "inverter": prefix,
+            "taken_at": snapshot.taken_at.isoformat(),
+            "age": round(age, 1),
+        }
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        if not query:
+            return body | {
+                "tables": {
+                    str(function_code): [
+                        {"address": start, "values": list(block)}
+                        for start, block in table.blocks
+                    ]
+                    for function_code, table in sorted(snapshot.registers.items())
+                }
+            }
+
+        function_code, address, count = range_asked_for(query)
+        values = snapshot.read(function_code, address, count)
+
+        if values is None:
+            raise ApiError(
+                404,
+                f"Registers {address} to {address + count - 1} were not read "
+                "by the last poll",
+            )
+
+        return body | {
+            "function_code": function_code,
+            "address": address,
+            "values": values,
+        }
+
+    def log_message(self, format, *args):
+        # A dashboard refreshing every few seconds is not worth a line in the log each.
+        pass
+
+
+def range_asked_for(query: dict[str, str]) -> tuple[int, int, int]:
+    try:
+        function_code = int(query.get("function_code", 4))
+        address = int(query["address"])
+        count = int(query.get("count", 1))
+    except KeyError, ValueError:
+        raise ApiError(400, "address is required, and it and count are numbers")
+
+    if function_code not in (3, 4):
+        raise ApiError(400, "function_code is 3 for holding or 4 for input registers")
+
+    if not 1 <= count <= MAX_COUNT:
+        raise ApiError(400, f"count is 1 to {MAX_COUNT}")
+
+    return function_code, address, count
+
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], apps, max_age: float):
+        super().__init__(address, ApiHandler)
+        # By topic_prefix, which is what tells a fleet's inverters apart everywhere.
+        self.apps = {app.config["mqtt"]["topic_prefix"]: app for app in apps}
+        self.max_age = max_age
+
+
+def serve(apps, host: str, port: int, max_age: float) -> ApiServer:
+    server = ApiServer((host, port), apps, max_age)
+    Thread(target=server.serve_forever, name="api", daemon=True).start()
+    logging.info(f"Serving registers on http://{host}:{port}/")
+    return server
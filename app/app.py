@@ -1,22 +1,37 @@
 #!/usr/bin/python3
 
 import yaml
+import hashlib
+import json
 import logging
-import arrow
-import requests
+import os
 import socket
+import sys
 
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import cache, partial
+from operator import itemgetter
+from importlib.util import LazyLoader, find_spec, module_from_spec
 from typing import Any, Callable, NamedTuple
 from config import AppConfig
 from sensors import Sensor
 
-from time import monotonic, sleep
+from threading import RLock, Thread
+from time import monotonic, perf_counter, sleep, time
 from datetime import datetime
 
 from environs import Env
 
+import metrics
+from capture import open_capture
+import sensor_cache
+from chunk_size import ChunkSize
 from mqtt import Mqtt, ONLINE, OFFLINE
-from mqtt_discovery import DiscoverMsgSensor, DiscoverMsgBinary
+from mqtt_discovery import DiscoverMsgSensor, DiscoverMsgBinary, DiscoverMsgDevice
+from registers import Registers
+from reload import FileWatcher, diff_sensors, hold_back
+from state import NoState, RetainedState, SqliteState, open_state
 
 from pymodbus import pymodbus_apply_logging_config
 from pymodbus.client import ModbusTcpClient
@@ -24,6 +39,36 @@ from pymodbus.exceptions import ModbusException
 
 VERSION = "3.0.0"
 
+
+def lazy_import(name: str):
+    # The module, executed on first use rather than now. requests and the urllib3
+    # and certifi under it are a third of what importing this module costs, and they
+    # are only ever used for the CGIs, which are off in most setups and are read on
+    # their own worker when they are on. Every restart of the container is a gap in
+    # the readings, and this is the part of it that buys nothing.
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = find_spec(name)
+    spec.loader = LazyLoader(spec.loader)
+    module = module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+requests = lazy_import("requests")
+# The servers, each behind a setting that is off unless asked for. api and proxy
+# would bring http.server and socketserver in with them at every start.
+api = lazy_import("api")
+proxy = lazy_import("proxy")
+
+
+def local_timezone_offset() -> str:
+    # +HH:MM, as the datetime sensor's ISO 8601 string ends.
+    return datetime.now().astimezone().isoformat()[-6:]
+
+
 # A local date is YYYY-MM-DD, so the period a date belongs to is a prefix of it.
 PERIOD_LENGTH = {"daily": 10, "monthly": 7, "yearly": 4}
 
@@ -61,6 +106,12 @@ KEEPALIVE_IDLE = 30
 KEEPALIVE_INTERVAL = 5
 KEEPALIVE_PROBES = 3
 
+# How early, in seconds, a poll may start and still serve the slot it was waiting
+# for. sleep() can wake a hair before the grid line it was asked to sleep until,
+# and a poll that counted itself into the slot before would get only that hair to
+# run in, and then be followed at once by a second one.
+SLOT_TOLERANCE = 1.0
+
 # How many polls a finished period's total has to hold a new value before it is
 # believed. A rollover happens once a day at most and then persists, so a value that
 # appears for one poll and vanishes is the datalogger, not the inverter.
@@ -116,41 +167,218 @@ HTTP_PADDING = "\x00 \t\r\n\v\f"
 #
 # query_http only runs on the transition back to online, which is the moment the
 # datalogger is least likely to be fully awake and most likely to accept a connection
-# it cannot answer.
+# it cannot answer. It runs on a thread of its own for the same reason, see
+# refresh_http, so what these bound is the refresh and not the poll.
 HTTP_TIMEOUT = (5, 10)
 
+# The modbus functions a sensor can be read with, by the function_code sensors.yaml
+# gives it, and the client call that makes the request. Holding and input registers
+# are two tables that share their addresses, so a poll keeps what it read from each
+# apart. app/sensors.py refuses any code that is not here.
+FUNCTION_CODES = {3: "read_holding_registers", 4: "read_input_registers"}
+
 
 class ReadType(NamedTuple):
     """One kind of modbus reading: how wide it is, and how to turn it into a value."""
 
-    # How many registers the reading spans. The span polled each cycle is derived from
-    # this, so a read type that claims fewer registers than it uses truncates the poll.
+    # How many registers the reading spans. The read plan is derived from this, so a
+    # read type that claims fewer registers than it uses truncates the poll.
     width: int
     # Takes the App, the sensor and the registers the reading spans; returns the value
     # to publish, or None if this reading cannot be made from them.
     decode: Callable[["App", dict[str, Any], list[int]], Any]
+    # Whether modbus.scale and modbus.decimals apply to what decode returns. Only a
+    # plain register has ever been scaled; a long carries scale: 1 in sensors.yaml,
+    # and scaling it would turn every integer it publishes into a float.
+    scaled: bool = False
+
+
+class Decoding(NamedTuple):
+    """One active modbus sensor, compiled once into what every poll does with it.
+
+    publish_readings used to work this out from the sensor's nested dicts on every
+    poll, for every sensor: whether it was active, whether it had a modbus block,
+    which read type it named, its scale, its decimals and its topic. None of that
+    changes between polls, so it is looked up once, in compile_sensor.
+
+    That alone bought no measurable time, as the lookups it saved were a small part
+    of decoding one sensor at a time. What it gives is a fixed place, width and
+    scale for every reading, which is what lets DecodePlan decode a poll a block at
+    a time.
+    """
+
+    sensor: dict[str, Any]
+    name: str
+    function_code: int
+    register: int
+    width: int
+    # Seconds between reads, 0 for every poll.
+    poll_every: int
+    # Takes the registers the reading spans, already bound to the App and the sensor.
+    decode: Callable[[list[int]], Any]
+    scale: float | None
+    decimals: int | None
+    topic: str
+    # How far a number has to move before it is published again, see value_changed.
+    # 0 and 0 for any change at all.
+    absolute_deadband: float
+    relative_deadband: float
+
+
+class DecodePlan(NamedTuple):
+    """Where each sensor's reading sits in a poll's blocks, worked out once per layout.
+
+    Decoding a poll one sensor at a time searched the blocks for each reading,
+    sliced it out and called its decoder, for what is, for most of the map, one word
+    times a scale. A poll's blocks come back in the same layout poll after poll, so
+    where every reading sits is worked out once: the plain registers of each block
+    are then taken in one call and scaled in one pass, and only the read types that
+    need their own decoder are decoded one by one.
+    """
+
+    # Per block holding plain registers: its function code, its index in the table,
+    # and the position in the sensor list, scale and decimals of each register, with
+    # the one call that takes all of their words out of the block.
+    scaled: list[
+        tuple[int, int, list[int], Callable[[Any], tuple[int, ...]], list, list]
+    ]
+    # The rest, one each: position, function code, block index, offset.
+    decoded: list[tuple[int, int, int, int]]
+    # Positions of the sensors no block holds.
+    missing: list[int]
+    # Keeps the sensors the plan was made for alive, and so their ids unique.
+    sensors: tuple["Decoding", ...]
+
+
+class Read(NamedTuple):
+    """One request to the datalogger: a run of registers fetched in a single call."""
+
+    function_code: int
+    address: int
+    count: int
+
+
+class Snapshot(NamedTuple):
+    """What one poll read, kept for the proxy and the API to serve again."""
+
+    registers: dict[int, Registers]
+    # When, on the monotonic clock for its age and on the wall clock for a reader.
+    taken: float
+    taken_at: datetime | None
+
+    def read(self, function_code: int, address: int, count: int) -> list[int] | None:
+        # The count registers from address on, or None unless the poll read them all.
+        table = self.registers.get(function_code)
+
+        if table is None or not table.covers(address, count):
+            return None
+
+        return list(table.span(address, count))
+
+
+NO_SNAPSHOT = Snapshot({}, float("-inf"), None)
+
+
+def plan_requests(
+    readings: list[tuple[int, int, int]], chunk_size: int, request_cost: int
+) -> list[Read]:
+    # The fewest requests that cover every reading, given as its function code, first
+    # and last register. The span used to run from the lowest register to the highest,
+    # so a map with registers at 3004 and 3300 asked for nearly three hundred nobody
+    # reads, every poll, in chunks of register_chunks.
+    #
+    # Two neighbours share a request only when the registers between them cost less
+    # than asking again. request_cost is that price in registers: a round trip to
+    # this datalogger is most of a second, where one more register in an answer is
+    # two bytes, so the default bridges any hole of a few dozen. A request also
+    # never grows past chunk_size, and never splits a reading: a long or a datetime
+    # arriving in halves from two answers is one that may straddle a failed request.
+    #
+    # Holding and input registers are separate tables that happen to share addresses,
+    # so each function code is planned on its own and no request mixes the two.
+    #
+    # Greedy from the lowest register is enough. Extending the current request as far
+    # as it is allowed to go can never make a later reading need more of them.
+    plan: list[Read] = []
+    current = None
+
+    for function_code, first, last in sorted(readings):
+        if current is not None:
+            code, start, end = current
+
+            if code == function_code:
+                if last <= end:
+                    continue
+
+                if first - end - 1 < request_cost and last - start + 1 <= chunk_size:
+                    current = (code, start, last)
+                    continue
+
+            plan.append(Read(code, start, end - start + 1))
+
+        current = (function_code, first, last)
+
+    if current is not None:
+        code, start, end = current
+        plan.append(Read(code, start, end - start + 1))
+
+    return plan
+
+
+def as_number(payload: str | None) -> float | None:
+    # A retained payload read back as the number it was published as. None for a
+    # topic with nothing retained, or with something on it that is not a number.
+    try:
+        return float(payload)
+    except TypeError, ValueError:
+        return None
 
 
 class App:
-    def __init__(self):
+    def __init__(
+        self,
+        config: dict[str, Any],
+        sensors_config: list[dict[str, Any]],
+        mqtt: Mqtt | None = None,
+        state: RetainedState | NoState | SqliteState | None = None,
+    ):
+        # One inverter, behind one datalogger. The config is that inverter's, see
+        # device_configs; the sensor map, the MQTT connection and the state store are
+        # whatever the caller hands in, which with a fleet is the same ones for every
+        # inverter.
+        self.config = config
+        self.sensors_config = sensors_config
         self.datalogger_offline = False
         self.datalogger_unreachable = True
         # What was last put on the availability topic, so the same answer is not sent
         # again. None until the first poll decides, which is what makes that first
         # publish happen whichever way it goes.
         self.availability_published = None
-        self.init_config()
-        self.load_sensors_config()
         self.retries_done = 0
 
-        self.register_span_start = 0
-        self.register_span_end = 0
+        self.read_plan: list[Read] = []
+        self.read_plans: dict[frozenset[str], list[Read]] = {}
+        self.chunk_size = ChunkSize(self.config["datalogger"]["register_chunks"])
+        # When each modbus sensor was last read by a poll that worked, for poll_every.
+        self.last_polled: dict[str, float] = {}
+        # When the poll in progress has to give up, on the monotonic clock: the start
+        # of the next one. No deadline until main starts polling.
+        self.poll_deadline = float("inf")
 
         # The connection is the app's, not the poll's. None means the next poll has to
         # dial one, which is every poll unless datalogger.persistent_connection is on.
         self.client = None
         self.connections_opened = 0
         self.connection_closed_reason = "nothing has been connected yet"
+        # Held for each request over that connection and whatever it does to it. The
+        # poll is the only user unless the proxy is on, whose clients share it.
+        self.modbus_lock = RLock()
+        # What the last poll read, for the proxy and the API.
+        self.snapshot = NO_SNAPSHOT
+
+        # One thread for the CGIs, and the refresh it is running if there is one.
+        self.http_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="http")
+        self.http_refresh: Future | None = None
 
         self.last_accepted_value = {}
         self.current_day = None
@@ -158,60 +386,63 @@ class App:
         self.awaiting_new_period = {}
         self.settled_value = {}
         self.pending_value = {}
+        # What was last put on each retained topic and when, for publish on change.
+        self.last_published: dict[str, tuple[Any, float]] = {}
+        # A digest of each discovery config retained on the broker, by topic. None
+        # until the first announcement reads them back.
+        self.discovery_digests: dict[str, str] | None = None
+        # Components taken out of the device config, by name, with their platform.
+        # Announced once with nothing but the platform, which is how Home Assistant
+        # is told to remove the entity, and then left out.
+        self.departing_components: dict[str, str] = {}
+        # config.yaml and sensors.yaml, looked at between polls. None until start_up
+        # sets one up, so an App built any other way never reloads.
+        self.watcher: FileWatcher | None = None
+        # The topic_prefix of every inverter config.yaml listed at startup, in order.
+        # Inverters are started and stopped only by a restart.
+        self.fleet: list[str] = []
 
         if self.config["mqtt"]["enabled"]:
-            self.mqtt = Mqtt(self.config["mqtt"])
-
-        log_level = logging.DEBUG if self.config["debug"] else logging.INFO
-        logging.getLogger().setLevel(log_level)
-        pymodbus_apply_logging_config(logging.INFO)
-
-        self.timezone_offset = arrow.now("local").format("ZZ")
+            self.mqtt = mqtt or Mqtt(self.config["mqtt"])
 
-    def init_config(self) -> None:
-        env = Env()
-        env.read_env()
-
-        # Load config from file
-        config_file = env("CONFIG_FILE", "./config.yaml")
-        with open(config_file) as f:
-            raw_config = f.read()
-
-        config = yaml.load(raw_config, yaml.Loader)
-
-        # Load config from env vars
-        with env.prefixed("MQTT_"):
-            mqtt_user = env("USER", None)
-            mqtt_password = env("PASSWORD", None)
-
-        if mqtt_user is not None:
-            config["mqtt"]["user"] = mqtt_user
-
-        if mqtt_password is not None:
-            config["mqtt"]["password"] = mqtt_password
+        self.state = state or open_state(
+            self.config.get("state", {"backend": "mqtt"}),
+            self.mqtt if self.config["mqtt"]["enabled"] else None,
+        )
 
-        # Load config
-        self.config = AppConfig().load(config)
+        # Every poll's raw registers and every CGI refresh, for replay.py, if asked.
+        self.capture = open_capture(
+            self.config.get("capture"), self.config["mqtt"]["topic_prefix"]
+        )
 
-    def load_sensors_config(self) -> None:
-        env = Env()
-        env.read_env()
+        self.timezone_offset = local_timezone_offset()
 
-        sensors_file = env("SENSORS_FILE", "./sensors.yaml")
+        self.compile_sensors()
 
-        with open(sensors_file, "r") as file:
-            yaml_data = yaml.safe_load(file)
+    def publish(self, topic: str, payload: Any, retain: bool = False) -> None:
+        # Every retained publish is remembered, not only the readings: a counter reset
+        # to 0 at midnight or a power reading zeroed while the datalogger was away is
+        # what the topic holds now, and the next reading has to be compared with that
+        # rather than with whatever the last poll published.
+        if retain:
+            self.last_published[topic] = (payload, monotonic())
 
-        self.sensors_config = Sensor(many=True).load(yaml_data)
+        metrics.PUBLISHED.inc(**self.metric_labels())
+        self.send(topic, payload, retain=retain)
 
-    def publish(self, topic: str, payload: Any, retain: bool = False) -> None:
+    def send(self, topic: str, payload: Any, retain: bool = False) -> None:
         if not self.config["mqtt"]["enabled"]:
             return
 
-        self.mqtt.publish(topic, payload, retain=retain)
+        self.mqtt.send(topic, payload, retain=retain)
+
+    def metric_labels(self, **labels):
+        # Every metric is labelled with the inverter it is about, so that a fleet is
+        # one scrape and a single inverter looks no different.
+        return {"inverter": self.config["mqtt"]["topic_prefix"], **labels}
 
     def local_date(self):
-        return arrow.now("local").format("YYYY-MM-DD")
+        return datetime.now().strftime("%Y-%m-%d")
 
     def device_class(self, sensor: dict[str, Any]) -> str | None:
         return sensor.get("homeassistant", {}).get("device_class")
@@ -221,13 +452,20 @@ class App:
         # alive is the broker's business, via the will. The datalogger being reachable
         # is this app's, and only the readings that cannot be faked as 0 care about it.
         prefix = self.config["mqtt"]["topic_prefix"]
-        topics = [f"{prefix}/availability"]
+        topics = [
+            self.config["mqtt"].get("availability_topic", f"{prefix}/availability")
+        ]
 
         if self.device_class(sensor) in OFFLINE_UNAVAILABLE:
             topics.append(f"{prefix}/datalogger_availability")
 
         return topics
 
+    def device_identifier(self):
+        # What Home Assistant groups this inverter's entities by. The one a single
+        # inverter has always had unless device_configs gave it its own.
+        return self.config["mqtt"].get("device_identifier", "tcpsolis2mqtt")
+
     def is_counter(self, sensor):
         # A cumulative energy counter, which is the only kind of reading whose value
         # can be sanity checked: it can only climb, and only as fast as the inverter
@@ -275,34 +513,55 @@ class App:
             [self.config["mqtt"]["topic_prefix"], "_state", *[str(p) for p in parts]]
         )
 
+    def save_state(self, topic, value):
+        # Into the store first, then onto the retained topic, which is the store
+        # itself with the mqtt backend and a mirror with any other.
+        self.state.save(topic, value)
+        self.publish(topic, value, retain=True)
+
     def load_state(self):
         # Which day the published counters belong to, and what each of them read before
         # the last reset, both have to survive a restart. Without the day a restart
         # would replay the midnight reset and double count everything generated earlier
         # the same day, and without the previous total the first reading of the morning
         # is unguarded.
-        if not self.config["mqtt"]["enabled"]:
-            self.current_day = self.local_date()
-            return
+        #
+        # All of it in one read of the state store, keyed by the topics it is
+        # published on: everything under _state, and the value of each lifetime
+        # counter.
+        lifetime_topics = {
+            sensor["name"]: f"{self.config['mqtt']['topic_prefix']}/{sensor['name']}"
+            for sensor in self.counters()
+            if self.reset_period(sensor) is None
+        }
+        stored_state = self.state.load(
+            [self.state_topic("#"), *lifetime_topics.values()]
+        )
 
         # Assume the current day when nothing is stored, so a first ever start does not
         # reset a counter that may already hold generation from earlier today.
         self.current_day = (
-            self.mqtt.read_retained(self.state_topic("current_day"))
-            or self.local_date()
+            stored_state.get(self.state_topic("current_day")) or self.local_date()
         )
         logging.info(f"Counters belong to {self.current_day}")
 
+        chunk_size = as_number(stored_state.get(self.state_topic("chunk_size")))
+
+        if chunk_size is not None and self.config["datalogger"]["adaptive_chunks"]:
+            self.chunk_size.restore(int(chunk_size))
+            self.read_plans.clear()
+            logging.info(f"Reading up to {self.chunk_size.size} registers at once")
+
         for sensor in self.counters():
             name = sensor["name"]
 
-            if self.reset_period(sensor) is None:
+            if name in lifetime_topics:
                 # A lifetime counter has no reset to recover from, but it must never
                 # be allowed to go backwards, and the value Home Assistant is still
                 # showing is the only record of where it stood before the restart.
                 # The timestamp is left empty on purpose: how long the container was
                 # down is unknown, so there is nothing to measure an increase against.
-                published = self.published_value(sensor)
+                published = as_number(stored_state.get(lifetime_topics[name]))
 
                 if published is not None:
                     self.last_accepted_value[name] = (published, None)
@@ -310,12 +569,14 @@ class App:
 
                 continue
 
-            stored = self.mqtt.read_retained(self.state_topic(name, "previous_total"))
+            stored = as_number(
+                stored_state.get(self.state_topic(name, "previous_total"))
+            )
 
             if stored is None:
                 continue
 
-            self.previous_period_total[name] = float(stored)
+            self.previous_period_total[name] = stored
             self.awaiting_new_period[name] = True
             logging.info(f"{name} read {stored} before the last reset")
 
@@ -346,10 +607,8 @@ class App:
             if previous_total is not None:
                 self.previous_period_total[name] = previous_total
                 self.awaiting_new_period[name] = True
-                self.publish(
-                    self.state_topic(name, "previous_total"),
-                    previous_total,
-                    retain=True,
+                self.save_state(
+                    self.state_topic(name, "previous_total"), previous_total
                 )
 
             # Move the plausibility baseline with it, the counter starts from zero now.
@@ -362,7 +621,7 @@ class App:
             )
 
         self.current_day = today
-        self.publish(self.state_topic("current_day"), today, retain=True)
+        self.save_state(self.state_topic("current_day"), today)
 
     def period_rolled_over(self, period, today):
         # Nothing known about where the counters stand, so treat every period as
@@ -388,76 +647,366 @@ class App:
         if not self.config["mqtt"]["enabled"]:
             return None
 
-        try:
-            return float(
-                self.mqtt.read_retained(
-                    f"{self.config['mqtt']['topic_prefix']}/{sensor['name']}"
+        return as_number(
+            self.mqtt.read_retained(
+                f"{self.config['mqtt']['topic_prefix']}/{sensor['name']}"
+            )
+        )
+
+    def discovery_topic(self, sensor):
+        return (
+            f"homeassistant/{sensor['homeassistant']['device']}/"
+            f"{self.config['mqtt']['topic_prefix']}/{sensor['name']}/config"
+        )
+
+    def device_discovery_topic(self):
+        return f"homeassistant/device/{self.device_identifier()}/config"
+
+    def discovers_device(self) -> bool:
+        # One message for the inverter and all its sensors, rather than one each.
+        return self.config["mqtt"].get("discovery", "sensor") == "device"
+
+    def discovery_message(self, sensor) -> DiscoverMsgSensor | DiscoverMsgBinary | None:
+        # What Home Assistant is told about the sensor, None for a device type it
+        # is not told about.
+        if sensor["homeassistant"]["device"] == "sensor":
+            return DiscoverMsgSensor(
+                self.config["mqtt"]["topic_prefix"],
+                sensor["description"],
+                sensor["name"],
+                sensor["unit"],
+                sensor["homeassistant"]["device_class"],
+                sensor["homeassistant"]["state_class"],
+                self.availability_topics(sensor),
+                self.config["inverter"]["name"],
+                self.config["inverter"]["model"],
+                self.config["inverter"]["manufacturer"],
+                "http://" + self.config["datalogger"]["host"],
+                VERSION,
+                self.device_identifier(),
+            )
+
+        if sensor["homeassistant"]["device"] == "binary_sensor":
+            return DiscoverMsgBinary(
+                self.config["mqtt"]["topic_prefix"],
+                sensor["description"],
+                sensor["name"],
+                sensor["homeassistant"]["payload_on"],
+                sensor["homeassistant"]["payload_off"],
+                sensor["homeassistant"]["device_class"],
+                sensor["homeassistant"]["state_class"],
+                self.availability_topics(sensor),
+                self.config["inverter"]["name"],
+                self.config["inverter"]["model"],
+                self.config["inverter"]["manufacturer"],
+                "http://" + self.config["datalogger"]["host"],
+                VERSION,
+                self.device_identifier(),
+            )
+
+        logging.error(
+            "Unknown homeassistant device type: " + sensor["homeassistant"]["device"]
+        )
+        return None
+
+    def discovered_sensors(self):
+        for sensor in self.sensors_config:
+            if sensor["active"] and "homeassistant" in sensor:
+                yield sensor
+
+    def retained_discovery(self) -> dict[str, str]:
+        # Every discovery config retained for this inverter, in one read.
+        return self.mqtt.read_retained_many(
+            [
+                f"homeassistant/+/{self.config['mqtt']['topic_prefix']}/+/config",
+                self.device_discovery_topic(),
+            ]
+        )
+
+    def generate_ha_discovery_topics(self, sensors=None):
+        # Every active sensor's, or only those given. Each is published only if it
+        # differs from what the broker already holds: all of them on every start
+        # was a retained write per sensor per inverter, and Home Assistant processes
+        # each one again as if the entity were new. With a fleet that is hundreds of
+        # them for nothing, since a restart rarely changes a word of any.
+        if not self.config["mqtt"]["enabled"]:
+            return
+
+        stale = [] if self.discovery_digests is not None else self.load_discovery()
+
+        if self.discovers_device():
+            self.announce_device(stale)
+        else:
+            self.announce_sensors(
+                self.discovered_sensors() if sensors is None else sensors
+            )
+
+        for topic in stale:
+            self.clear_discovery(topic)
+
+    def announce_sensors(self, sensors) -> None:
+        published = 0
+
+        for sensor in sensors:
+            if not sensor["active"] or "homeassistant" not in sensor:
+                continue
+
+            message = self.discovery_message(sensor)
+
+            if message is None:
+                continue
+
+            logging.debug(f"Generating discovery topic for sensor: {sensor['name']}")
+            published += self.publish_discovery(self.discovery_topic(sensor), message)
+
+        logging.info(f"Published {published} discovery topics that had changed")
+
+    def announce_device(self, stale: list[str]) -> None:
+        # The whole inverter in one message, whichever sensors changed. It is the one
+        # retained write per inverter either way, where the per-sensor format is one
+        # per sensor, and Home Assistant takes the device in at once.
+        components = {}
+
+        for sensor in self.discovered_sensors():
+            message = self.discovery_message(sensor)
+
+            if message is not None:
+                components[sensor["name"]] = (
+                    sensor["homeassistant"]["device"],
+                    message,
                 )
+
+        # A sensor simply left out of the config leaves its entity behind, orphaned
+        # and unavailable for ever.
+        departing = {
+            name: platform
+            for name, platform in self.departing_components.items()
+            if name not in components
+        }
+        self.departing_components = {}
+
+        # Sensors announced one by one before are handed over rather than removed,
+        # as Home Assistant asks: each old config says it is migrating, the device
+        # takes its entity over, and only then is the old config cleared. Removed
+        # and announced again, they would lose their settings and history.
+        moving = {self.discovery_topic(sensor) for sensor in self.discovered_sensors()}
+
+        for topic in stale:
+            if topic in moving:
+                self.publish(topic, MIGRATE_DISCOVERY, retain=True)
+
+        if self.publish_discovery(
+            self.device_discovery_topic(),
+            DiscoverMsgDevice(components, VERSION, departing),
+        ):
+            logging.info(
+                f"Published discovery for {len(components)} sensors at once, "
+                f"removing {len(departing)}"
             )
-        except TypeError, ValueError:
-            return None
 
-    def generate_ha_discovery_topics(self):
+    def publish_discovery(self, topic: str, message) -> bool:
+        # Whether it went out, which it does only if the broker holds something else.
+        payload = str(message)
+        digest = hashlib.sha256(payload.encode()).hexdigest()
+
+        if self.discovery_digests.get(topic) == digest:
+            return False
+
+        self.publish(topic, payload, retain=True)
+        self.discovery_digests[topic] = digest
+        return True
+
+    def load_discovery(self) -> list[str]:
+        # What the broker holds, read back once, and which of it is stale. A config
+        # there for no active sensor is one that was deactivated, renamed or given
+        # another device type while the app was down, and is cleared so that Home
+        # Assistant drops the entity rather than showing it unavailable for ever.
+        # With the other discovery format, every config of the one in use before.
+        retained = self.retained_discovery()
+        self.discovery_digests = {
+            topic: hashlib.sha256(payload.encode()).hexdigest()
+            for topic, payload in retained.items()
+        }
+
+        if self.discovers_device():
+            wanted = {self.device_discovery_topic()}
+            self.departing_components |= self.removed_components(
+                retained.get(self.device_discovery_topic())
+            )
+        else:
+            wanted = {
+                self.discovery_topic(sensor) for sensor in self.discovered_sensors()
+            }
+
+        return sorted(set(retained) - wanted)
+
+    def removed_components(self, payload: str | None) -> dict[str, str]:
+        # The components of a retained device config whose sensors are no longer
+        # active, by name, with their platform. One already announced as removed,
+        # platform and nothing else, is not announced again.
+        try:
+            components = json.loads(payload)["components"]
+        except TypeError, ValueError, KeyError:
+            return {}
+
+        active = {sensor["name"] for sensor in self.discovered_sensors()}
+
+        return {
+            name: component["platform"]
+            for name, component in components.items()
+            if name not in active
+            and isinstance(component, dict)
+            and "platform" in component
+            and len(component) > 1
+        }
+
+    def clear_discovery(self, topic: str) -> None:
+        # An empty retained config is how Home Assistant is told an entity is gone.
+        logging.debug(f"Removing discovery topic {topic}")
+        self.publish(topic, "", retain=True)
+
+        if self.discovery_digests is not None:
+            self.discovery_digests.pop(topic, None)
+
+    def remove_ha_discovery_topics(self, sensors):
+        # With device discovery, they go out with the device's next announcement.
         if not self.config["mqtt"]["enabled"]:
             return
 
-        for sensor in self.sensors_config:
-            if sensor["active"] and "homeassistant" in sensor:
-                if sensor["homeassistant"]["device"] == "sensor":
-                    logging.debug(
-                        "Generating discovery topic for sensor: " + sensor["name"]
-                    )
-                    self.publish(
-                        f"homeassistant/sensor/{self.config['mqtt']['topic_prefix']}/{sensor['name']}/config",
-                        str(
-                            DiscoverMsgSensor(
-                                self.config["mqtt"]["topic_prefix"],
-                                sensor["description"],
-                                sensor["name"],
-                                sensor["unit"],
-                                sensor["homeassistant"]["device_class"],
-                                sensor["homeassistant"]["state_class"],
-                                self.availability_topics(sensor),
-                                self.config["inverter"]["name"],
-                                self.config["inverter"]["model"],
-                                self.config["inverter"]["manufacturer"],
-                                "http://" + self.config["datalogger"]["host"],
-                                VERSION,
-                            )
-                        ),
-                        retain=True,
-                    )
-                elif sensor["homeassistant"]["device"] == "binary_sensor":
-                    logging.debug(
-                        "Generating discovery topic for binary sensor: "
-                        + sensor["name"]
-                    )
-                    self.publish(
-                        f"homeassistant/binary_sensor/{self.config['mqtt']['topic_prefix']}/{sensor['name']}/config",
-                        str(
-                            DiscoverMsgBinary(
-                                self.config["mqtt"]["topic_prefix"],
-                                sensor["description"],
-                                sensor["name"],
-                                sensor["homeassistant"]["payload_on"],
-                                sensor["homeassistant"]["payload_off"],
-                                sensor["homeassistant"]["device_class"],
-                                sensor["homeassistant"]["state_class"],
-                                self.availability_topics(sensor),
-                                self.config["inverter"]["name"],
-                                self.config["inverter"]["model"],
-                                self.config["inverter"]["manufacturer"],
-                                "http://" + self.config["datalogger"]["host"],
-                                VERSION,
-                            )
-                        ),
-                        retain=True,
-                    )
-                else:
-                    logging.error(
-                        "Unknown homeassistant device type: "
-                        + sensor["homeassistant"]["device"]
-                    )
+        for sensor in sensors:
+            if "homeassistant" not in sensor:
+                continue
+
+            if self.discovers_device():
+                self.departing_components[sensor["name"]] = sensor["homeassistant"][
+                    "device"
+                ]
+            else:
+                self.clear_discovery(self.discovery_topic(sensor))
+
+    def reload_if_changed(self) -> None:
+        # Between polls, so a poll never sees half of one sensors.yaml and half of
+        # another. A file that does not load is a mistake in an edit that is likely
+        # still going on; the app carries on as it was and tries again on the next
+        # change.
+        if self.watcher is None or not self.watcher.changed():
+            return
+
+        prefix = self.config["mqtt"]["topic_prefix"]
+
+        try:
+            configs = device_configs(load_config())
+            sensors_config = load_sensors_config()
+        except Exception as e:
+            logging.error(f"Not reloading, the changed files do not load: {e}")
+            return
+
+        fleet = [c["mqtt"]["topic_prefix"] for c in configs]
+
+        if fleet != self.fleet:
+            logging.warning("inverters changed, which takes effect after a restart")
+            self.fleet = fleet
+
+        config = next((c for c in configs if c["mqtt"]["topic_prefix"] == prefix), None)
+
+        if config is None:
+            logging.warning(
+                f"{prefix} is no longer in config.yaml, it stops after a restart"
+            )
+            return
+
+        self.reload(config, sensors_config)
+
+    def reload(
+        self, config: dict[str, Any], sensors_config: list[dict[str, Any]]
+    ) -> None:
+        # Take up an edited config.yaml and sensors.yaml without the restart that
+        # would replay discovery and the state restore, and redial a datalogger
+        # that takes one connection at a time. Only what changed is redone: the read
+        # plans, discovery for the sensors that were added or altered, and removal
+        # from Home Assistant of those that are gone.
+        for held in hold_back(self.config, config):
+            logging.warning(f"{held} changed, which takes effect after a restart")
+
+        old_config, self.config = self.config, config
+        datalogger, old_datalogger = config["datalogger"], old_config["datalogger"]
+
+        if any(
+            datalogger[key] != old_datalogger[key]
+            for key in ("host", "port", "device_id")
+        ):
+            with self.modbus_lock:
+                self.drop_connection("the datalogger's address changed")
+
+        if any(
+            datalogger[key] != old_datalogger[key]
+            for key in ("register_chunks", "adaptive_chunks")
+        ):
+            learned = self.chunk_size.size
+            self.chunk_size = ChunkSize(datalogger["register_chunks"])
+
+            # As a restart would have it: while adaptive_chunks stays on, the size
+            # learned so far, which is the one stored, carries on within the new
+            # bounds, rather than being learned again from register_chunks.
+            if datalogger["adaptive_chunks"] and old_datalogger["adaptive_chunks"]:
+                self.chunk_size.restore(learned)
+
+        changes = diff_sensors(self.sensors_config, sensors_config)
+        self.sensors_config = sensors_config
+        self.compile_sensors()
+        self.read_plans.clear()
+
+        for sensor in changes.changed + changes.removed:
+            # Read, and published, on the next poll whatever the schedule and the
+            # deadband would have said about the sensor as it was.
+            self.last_polled.pop(sensor["name"], None)
+            self.last_published.pop(
+                f"{config['mqtt']['topic_prefix']}/{sensor['name']}", None
+            )
+
+        # Removed first, so that with device discovery they are in the announcement.
+        self.remove_ha_discovery_topics(changes.removed)
+
+        # What every discovery message says about the device, as opposed to about
+        # its sensor.
+        if config["inverter"] != old_config["inverter"] or (
+            datalogger["host"] != old_datalogger["host"]
+        ):
+            self.generate_ha_discovery_topics()
+        else:
+            self.generate_ha_discovery_topics(changes.added + changes.changed)
+
+        logging.info(
+            f"Reloaded the config and sensors: {len(changes.added)} added, "
+            f"{len(changes.changed)} changed, {len(changes.removed)} removed"
+        )
+
+    def refresh_http(self) -> None:
+        # Read the CGIs without holding up the poll that asked for them. query_http
+        # used to run inline, in the middle of the register loop, so a datalogger that
+        # answered modbus but dawdled over HTTP -- which is how it behaves while it is
+        # waking up, the only time this runs -- held the rest of the span, and the
+        # poll after it, for up to both HTTP_TIMEOUTs in full. The values it publishes
+        # have nothing to do with the registers, so nothing waits for them.
+        #
+        # One refresh at a time. A datalogger that comes back, drops out and comes
+        # back again inside one slow refresh gets nothing from a second request but a
+        # second connection it cannot serve.
+        if not self.config["datalogger"]["http"]["enabled"]:
+            return
+
+        if self.http_refresh is not None and not self.http_refresh.done():
+            logging.info("Still reading the HTTP endpoints, not asking again")
+            return
+
+        self.http_refresh = self.http_worker.submit(self.query_http)
+        self.http_refresh.add_done_callback(self.http_refresh_done)
+
+    def http_refresh_done(self, refresh: Future) -> None:
+        # An exception on the worker goes nowhere unless something asks for it, and
+        # inline it would at least have reached the log on its way out of main.
+        if refresh.exception() is not None:
+            logging.error(f"Reading the HTTP endpoints failed: {refresh.exception()}")
 
     def query_http(self):
         # Check if http is enabled
@@ -492,12 +1041,17 @@ class App:
             logging.error("HTTP endpoints did not return 200")
             return
 
+        bodies = {"inverter": ir.text, "moniter": mr.text}
+
+        if self.capture is not None:
+            self.capture.http(time(), bodies)
+
+        self.publish_http(bodies)
+
+    def publish_http(self, bodies: dict[str, str]) -> None:
         # The sensor schema allows no endpoint other than these two, so every sensor
         # below finds its response here.
-        registers = {
-            "inverter": ir.text.split(";"),
-            "moniter": mr.text.split(";"),
-        }
+        registers = {endpoint: body.split(";") for endpoint, body in bodies.items()}
 
         asleep = {
             endpoint
@@ -657,7 +1211,7 @@ class App:
         if not (self.datalogger_offline or self.datalogger_unreachable):
             return
 
-        self.query_http()
+        self.refresh_http()
         self.retries_done = 0
         self.datalogger_unreachable = False
 
@@ -734,45 +1288,175 @@ class App:
         else:
             return default_value
 
-    def get_register_interval(self) -> None:
-        # Check if we already have a first and last register
-        if self.register_span_start > 0 and self.register_span_end > 0:
+    def compile_sensor(self, sensor: dict[str, Any]) -> Decoding | None:
+        # None for a read type there is no decoder for. The schema refuses those, so
+        # this is for a sensor that did not come through it.
+        modbus = sensor["modbus"]
+        read_type = READ_TYPES.get(modbus.get("read_type"))
+
+        if read_type is None:
+            logging.error(f"modbus.readtype of {modbus.get('read_type')} not supported")
+            return None
+
+        return Decoding(
+            sensor=sensor,
+            name=sensor["name"],
+            function_code=modbus["function_code"],
+            register=modbus["register"],
+            width=read_type.width,
+            poll_every=modbus.get("poll_every", 0),
+            decode=partial(read_type.decode, self, sensor),
+            scale=modbus.get("scale") if read_type.scaled else None,
+            decimals=modbus.get("decimals"),
+            topic=f"{self.config['mqtt']['topic_prefix']}/{sensor['name']}",
+            absolute_deadband=sensor.get("deadband", {}).get("absolute", 0),
+            relative_deadband=sensor.get("deadband", {}).get("relative", 0),
+        )
+
+    def compile_sensors(self) -> None:
+        # The decode plan: every active modbus sensor, in sensors.yaml order. The
+        # scheduler, the read planner and publish_readings all work from this.
+        self.decode_plans: dict[tuple, DecodePlan] = {}
+        self.decodings = [
+            decoding
+            for sensor in self.sensors_config
+            if sensor["active"] and "modbus" in sensor
+            if (decoding := self.compile_sensor(sensor)) is not None
+        ]
+
+    def sensors_due(self, now: float) -> list[Decoding]:
+        # The modbus sensors this poll should read. Without modbus.poll_every that is
+        # every poll; with it, once that many seconds have passed since the last poll
+        # that read the sensor. A serial number or last year's total read every 30
+        # seconds is register traffic on a stick that can barely keep up with the
+        # readings that do move, and it is what stood between active_power and a
+        # shorter poll_interval.
+        #
+        # Half an interval of slack, because polls start on the interval and not on
+        # the second: a poll_every of 300 at a 30 second interval should be every
+        # tenth poll, not every eleventh because the tenth came a fraction early.
+        slack = self.config["datalogger"]["poll_interval"] / 2
+
+        return [
+            decoding
+            for decoding in self.decodings
+            if decoding.name not in self.last_polled
+            or now - self.last_polled[decoding.name] >= decoding.poll_every - slack
+        ]
+
+    def sensors_covered(self, due: list[Decoding]) -> list[Decoding]:
+        # The sensors the planned requests read, due or not. A slow sensor whose
+        # registers sit inside a request made for the others anyway is decoded too:
+        # reading it cost nothing, and poll_every is there to save requests, not to
+        # leave a value stale that came in with the rest.
+        due_names = {decoding.name for decoding in due}
+
+        return [
+            decoding
+            for decoding in self.decodings
+            if decoding.name in due_names
+            or any(
+                read.function_code == decoding.function_code
+                and read.address <= decoding.register
+                and decoding.register + decoding.width <= read.address + read.count
+                for read in self.read_plan
+            )
+        ]
+
+    def plan_reads(self, sensors: list[Decoding] | None = None) -> None:
+        # Which requests a poll makes for these sensors, every active one if none are
+        # given. Each reading is the run of registers its read type spans, not just
+        # its first. Worked out once per set of sensors: with poll_every the set due
+        # changes from poll to poll, but only between a handful of combinations.
+        if sensors is None:
+            sensors = self.decodings
+
+        key = frozenset(decoding.name for decoding in sensors)
+
+        if key in self.read_plans:
+            self.read_plan = self.read_plans[key]
             return
 
-        for sensor in self.sensors_config:
-            # Check if sensor is active and has a modbus read type, also check if the datalogger is online
-            if not sensor["active"] or "modbus" not in sensor:
-                continue
+        self.read_plan = plan_requests(
+            self.readings(sensors),
+            self.chunk_size.size,
+            self.config["datalogger"]["request_cost"],
+        )
 
-            register = sensor["modbus"]["register"]
+        spans = ", ".join(
+            f"{read.address} to {read.address + read.count - 1} "
+            f"({FUNCTION_CODES[read.function_code]})"
+            for read in self.read_plan
+        )
+        logging.info(
+            f"Reading {spans} for {len(sensors)} sensors, "
+            f"{len(self.read_plan)} requests"
+        )
+        self.read_plans[key] = self.read_plan
+
+    def readings(self, sensors: list[Decoding]) -> list[tuple[int, int, int]]:
+        # Each reading is the run of registers its read type spans, not just its first.
+        return [
+            (d.function_code, d.register, d.register + d.width - 1) for d in sensors
+        ]
+
+    def adapt_chunk_size(self) -> None:
+        # After every poll, see whether the datalogger has shown it wants smaller
+        # requests, or has earned larger ones. Larger ones only while the sensor map
+        # has requests left to save, judged at the most Modbus allows rather than at
+        # the next step: the holes in the map mean one step often saves nothing on
+        # its own, while the one after it does.
+        if not self.config["datalogger"]["adaptive_chunks"]:
+            return
+
+        was = self.chunk_size.size
+        self.chunk_size.end_poll()
 
-            if self.register_span_start == 0 or register < self.register_span_start:
-                self.register_span_start = register
+        if self.chunk_size.ready_to_grow():
+            readings = self.readings(self.decodings)
+            request_cost = self.config["datalogger"]["request_cost"]
+            now = plan_requests(readings, self.chunk_size.size, request_cost)
+            grown = plan_requests(readings, self.chunk_size.ceiling, request_cost)
 
-            if register > self.register_span_end:
-                # The last register of the reading, not its first. The widths live in
-                # READ_TYPES, where the decoder that consumes them is, so the span
-                # cannot fall behind a read type the loop already knows how to read.
-                width = READ_TYPES[sensor["modbus"]["read_type"]].width
+            if len(grown) < len(now):
+                self.chunk_size.grow()
 
-                self.register_span_end = register + width - 1
+        if self.chunk_size.size == was:
+            return
 
         logging.info(
-            f"First register: {self.register_span_start}, Last register: {self.register_span_end}"
+            f"Reading up to {self.chunk_size.size} registers at once, was {was}"
         )
 
+        # Every cached plan was made for the old size, and the new one is kept across
+        # restarts with the rest of the state.
+        self.read_plans.clear()
+        self.save_state(self.state_topic("chunk_size"), self.chunk_size.size)
+
     def value_is_publishable(self, sensor, value):
         # An energy register is either a counter, which can be checked against what
         # the inverter could have generated, or a finished period's total, which can
         # only be checked against itself. Everything else is published as it arrives.
         if self.is_counter(sensor):
-            return self.value_is_plausible(sensor, value)
+            return self.guarded(
+                sensor, "plausible", self.value_is_plausible(sensor, value)
+            )
 
         if self.is_finished_period_total(sensor):
-            return self.value_is_settled(sensor, value)
+            return self.guarded(sensor, "settled", self.value_is_settled(sensor, value))
 
         return True
 
+    def guarded(self, sensor, guard, accepted):
+        # How often each guard holds a reading back, which is how a guard that has
+        # started refusing real readings shows up before anyone notices a flat line.
+        if not accepted:
+            metrics.REJECTED.inc(
+                **self.metric_labels(sensor=sensor["name"], guard=guard)
+            )
+
+        return accepted
+
     def value_is_settled(self, sensor, value):
         # A plausibility check is the wrong tool here, the value legitimately jumps by
         # a whole day's generation once a day. A debounce fits: on 2026-07-28
@@ -804,6 +1488,17 @@ class App:
         self.settled_value[name] = value
         return True
 
+    def accept_value(self, sensor, value, now):
+        # The baseline the next reading is measured against. A lifetime counter's is
+        # also its floor across a restart, so it goes to the state store as it moves;
+        # with the mqtt backend that is a no-op, the reading's own publish stores it.
+        self.last_accepted_value[sensor["name"]] = (value, now)
+
+        if self.reset_period(sensor) is None:
+            self.state.save(
+                f"{self.config['mqtt']['topic_prefix']}/{sensor['name']}", value
+            )
+
     def value_is_plausible(self, sensor, value):
         # A cumulative energy counter cannot climb faster than the inverter is able to
         # generate. The datalogger intermittently serves a value belonging to a previous
@@ -832,7 +1527,7 @@ class App:
         previous = self.last_accepted_value.get(name)
 
         if previous is None:
-            self.last_accepted_value[name] = (value, now)
+            self.accept_value(sensor, value, now)
             return True
 
         last_value, last_time = previous
@@ -849,14 +1544,14 @@ class App:
                 )
                 return False
 
-            self.last_accepted_value[name] = (value, now)
+            self.accept_value(sensor, value, now)
             return True
 
         if last_time is None:
             # Restored from the retained topic after a restart, with no idea how long
             # the container was down, so there is no allowance to measure against.
             # Adopt the reading and guard every one after it.
-            self.last_accepted_value[name] = (value, now)
+            self.accept_value(sensor, value, now)
             return True
 
         # The resolution of the register is allowed on top of what the inverter could
@@ -874,21 +1569,24 @@ class App:
             )
             return False
 
-        self.last_accepted_value[name] = (value, now)
+        self.accept_value(sensor, value, now)
         return True
 
-    def response_is_dead(self, registers: dict[int, int]) -> bool:
+    def response_is_dead(self, registers: dict[int, Registers]) -> bool:
         # The datalogger sometimes answers with a complete, well formed block of
         # registers where every single value is zero, usually while the inverter itself
         # is asleep. A live inverter cannot produce that: AC voltage alone reads about
         # 2300, and the lifetime counter is in the tens of thousands.
-        if any(registers.values()):
+        #
+        # Judged on everything the poll read, holding registers included. A zero in
+        # every one of them is the same nothing whichever table it came from.
+        if any(any(table.values()) for table in registers.values()):
             return False
 
         logging.info("Validation failed, every register in the response is zero")
         return True
 
-    def read_chunk(self, address: int, count: int) -> list[int] | None:
+    def read_chunk(self, read: Read) -> list[int] | None:
         # One chunk of registers, or None if the datalogger would not give it up.
         # Bounded attempts with a pause between them: the loop this replaces never
         # advanced and never slept, so a chunk that kept failing was retried as fast
@@ -896,51 +1594,88 @@ class App:
         # 73, 433, 447, 405 and 473 attempts, roughly two requests a second sustained
         # for minutes, concentrated in the 05:30-05:45 window when the datalogger was
         # already struggling to stay up.
+        function_code, address, count = read
+        started = monotonic()
+        labels = self.metric_labels(function_code=function_code)
+
         for attempt in range(1, CHUNK_ATTEMPTS + 1):
-            # Per attempt, because an attempt can end by throwing the connection away.
-            # Cheap when there already is one: this hands back the client the app is
-            # holding, whether that was dialled a moment ago or three polls back.
-            client = self.ensure_connected()
+            # The proxy's clients wait for this attempt, not for the whole chunk.
+            with self.modbus_lock:
+                # Per attempt, because an attempt can end by throwing the connection
+                # away. Cheap when there already is one: this hands back the client the
+                # app is holding, whether that was dialled a moment ago or three polls
+                # back.
+                client = self.ensure_connected()
+
+                if client is not None:
+                    attempt_started = monotonic()
+
+                    try:
+                        message = getattr(client, FUNCTION_CODES[function_code])(
+                            device_id=self.config["datalogger"]["device_id"],
+                            address=address,
+                            count=count,
+                        )
+                    except Exception as e:
+                        # The socket cannot be trusted after this, and pymodbus will
+                        # not notice: its connect() returns true whenever it still
+                        # holds a socket object, without testing whether anything is at
+                        # the other end. So a broken pipe left every later request
+                        # writing into the same dead socket, which is why this used to
+                        # kill the process and let the container restart.
+                        #
+                        # Dropping it means the attempt after this one dials a new
+                        # connection, and the poll can still succeed -- where a restart
+                        # lost the in-memory half of the energy guards with it: the
+                        # plausibility timestamps and the debounce counts are not in the
+                        # retained topics load_state reads back.
+                        #
+                        # Only for a raised error. A response that says isError is the
+                        # datalogger declining to answer, not a dead socket -- that is
+                        # what it does every morning while the inverter wakes up, and
+                        # reconnecting each time would be pure churn.
+                        logging.error(f"Error occured while querying modbus: {e}")
+                        self.drop_connection(f"a read raised {type(e).__name__}: {e}")
+                        self.chunk_size.failed(count)
+                    else:
+                        if not message.isError():
+                            self.chunk_size.succeeded(
+                                monotonic() - attempt_started,
+                                first_attempt=attempt == 1,
+                            )
 
-            if client is not None:
-                try:
-                    message = client.read_input_registers(
-                        device_id=self.config["datalogger"]["device_id"],
-                        address=address,
-                        count=count,
-                    )
-                except Exception as e:
-                    # The socket cannot be trusted after this, and pymodbus will not
-                    # notice: its connect() returns true whenever it still holds a
-                    # socket object, without testing whether anything is at the other
-                    # end. So a broken pipe left every later request writing into the
-                    # same dead socket, which is why this used to kill the process and
-                    # let the container restart.
-                    #
-                    # Dropping it means the attempt after this one dials a new
-                    # connection, and the poll can still succeed -- where a restart
-                    # lost the in-memory half of the energy guards with it: the
-                    # plausibility timestamps and the debounce counts are not in the
-                    # retained topics load_state reads back.
-                    #
-                    # Only for a raised error. A response that says isError is the
-                    # datalogger declining to answer, not a dead socket -- that is what
-                    # it does every morning while the inverter wakes up, and
-                    # reconnecting each time would be pure churn.
-                    logging.error(f"Error occured while querying modbus: {e}")
-                    self.drop_connection(f"a read raised {type(e).__name__}: {e}")
-                else:
-                    if not message.isError():
-                        return message.registers
-
-                    logging.error(
-                        f"Could not read registers {address} to {address + count - 1} "
-                        f"on attempt {attempt}, might have lost connection"
-                    )
+                            metrics.READ_SECONDS.observe(
+                                monotonic() - started, **labels
+                            )
+                            return message.registers
+
+                        self.chunk_size.failed(count)
+
+                        logging.error(
+                            f"Could not read registers {address} to "
+                            f"{address + count - 1} on attempt {attempt}, might have "
+                            "lost connection"
+                        )
 
             if attempt < CHUNK_ATTEMPTS:
+                # A retry that would run into the next poll's slot is not made. The
+                # next poll asks for the same registers, on time, where this one
+                # finishing late pushed every poll after it later too.
+                if monotonic() + CHUNK_RETRY_DELAY >= self.poll_deadline:
+                    logging.warning(
+                        f"Not retrying registers {address} to {address + count - 1}, "
+                        "the next poll is due"
+                    )
+                    break
+
+                metrics.READ_RETRIES.inc(**self.metric_labels())
+                metrics.SLEEP_SECONDS.inc(
+                    CHUNK_RETRY_DELAY, **self.metric_labels(reason="retry")
+                )
                 sleep(CHUNK_RETRY_DELAY)
 
+        metrics.READ_SECONDS.observe(monotonic() - started, **labels)
+        metrics.READ_FAILURES.inc(**self.metric_labels())
         return None
 
     def keepalive_options(self) -> list[tuple[int, int, int]]:
@@ -1036,6 +1771,7 @@ class App:
 
         self.client = client
         self.connections_opened += 1
+        metrics.CONNECTIONS.inc(**self.metric_labels())
 
         # "The setting is on" and "the connection is actually surviving" look the same
         # in the logs otherwise, and this line is how the question the setting exists
@@ -1069,66 +1805,84 @@ class App:
         self.client.close()
         self.client = None
 
+    def keeps_connection(self) -> bool:
+        # The proxy is other clients' way to the datalogger, so it keeps the
+        # connection whatever persistent_connection says.
+        proxy_config = self.config["datalogger"].get("proxy", {})
+
+        return self.config["datalogger"]["persistent_connection"] or (
+            proxy_config.get("enabled", False) and proxy_config.get("forward", True)
+        )
+
     def release_connection(self) -> None:
         # End of a poll that worked. Holding on to the connection is the entire point
         # of the setting; hanging up is what this app has always done, and what leaves
         # the datalogger free for whatever else wants to talk to it -- it accepts one
         # connection at a time.
-        if self.config["datalogger"]["persistent_connection"]:
+        if self.keeps_connection():
             return
 
         self.drop_connection("the connection is not kept between polls")
 
-    def read_span(self) -> tuple[dict[int, int], int]:
-        # The whole register span, chunk by chunk, with the number of registers that
-        # were asked for. The two together are what the caller judges the poll on: a
-        # short answer is a failed poll, however well formed each chunk was.
-        registers: dict[int, int] = {}
-        chunk_size = self.config["datalogger"]["register_chunks"]
-        expected_registers = 0
-
-        # register_span_end is the last register wanted, not one past it, so the range
-        # has to reach it. It did not, and a chunk size that happened to land exactly
-        # on the end silently lost that register: with the span 3004 to 3077 a
-        # register_chunks of 73 read 3004 to 3076 and stopped. The length check below
-        # passed, because 73 were asked for and 73 arrived, so the poll was kept and
-        # only the sensor needing the missing register failed -- as a KeyError caught
-        # up in main, logged once a poll, forever.
+    def read_span(self) -> tuple[dict[int, Registers], int]:
+        # Every request in the read plan, with the number of registers that were asked
+        # for. The two together are what the caller judges the poll on.
         #
-        # The count is clamped for the same reason the range moved. Reading whole
-        # chunks past the end covered that bug by accident, six registers past 3077 at
-        # the default chunk size, and asking a datalogger this fragile for registers
-        # nothing is mapped to is not a habit worth keeping.
-        for address in range(
-            self.register_span_start, self.register_span_end + 1, chunk_size
-        ):
-            count = min(chunk_size, self.register_span_end - address + 1)
+        # What arrives is kept by function code, each answer as the block it came in.
+        # Holding and input registers come over the same connection in the same poll,
+        # but register 3004 of one table says nothing about 3004 of the other.
+        registers: dict[int, Registers] = {}
+        expected: set[tuple[int, int]] = set()
+        failed: list[Read] = []
+
+        for read in self.read_plan:
+            function_code, address, count = read
 
             logging.info(f"Querying register {address} to {address + count - 1}")
 
-            # Count each chunk once, not once per attempt. Counting per attempt
+            # Count each register once, not once per attempt. Counting per attempt
             # inflated the expected total to thousands and threw away five complete
-            # 80 register responses on 2026-07-29 alone.
-            expected_registers += count
+            # 80 register responses on 2026-07-29 alone. A set rather than a sum,
+            # because a reading too wide for the end of one request starts the next
+            # one inside it, and the overlap arrives twice but is only one register.
+            expected.update((function_code, a) for a in range(address, address + count))
+
+            # Out of time: what is left waits for the next poll, whose slot this is.
+            if monotonic() >= self.poll_deadline:
+                logging.warning(
+                    f"Not querying register {address} to {address + count - 1}, "
+                    "the next poll is due"
+                )
+                failed.append(read)
+                break
 
-            values = self.read_chunk(address, count)
+            values = self.read_chunk(read)
 
             if values is None:
-                # Nothing to gain from asking a datalogger that just refused three
-                # times for the rest of the span, and the length check on the way out
-                # will discard this poll anyway.
-                if not self.datalogger_offline:
-                    self.datalogger_is_offline(offline=True)
-                break
+                failed.append(read)
+
+                # One request the datalogger would not answer says nothing about the
+                # next one: a flaky chunk near 3070 used to cost active_power at 3004
+                # as well. One it cannot even be dialled for does, and asking on
+                # would only spend every remaining request's attempts on nothing.
+                if self.ensure_connected() is None:
+                    break
+
+                continue
 
             logging.info(f"Result: {values}")
-            registers.update(dict(enumerate(values, start=address)))
+            registers.setdefault(function_code, Registers()).add(address, values)
 
             self.datalogger_is_offline(offline=False)
 
-        return registers, expected_registers
+        # Offline only when nothing at all came back. A datalogger that answered
+        # some of the poll is there, however flaky the link to it.
+        if failed and not registers and not self.datalogger_offline:
+            self.datalogger_is_offline(offline=True)
+
+        return registers, len(expected)
 
-    def query_modbus(self) -> dict[int, int]:
+    def query_modbus(self) -> dict[int, Registers]:
         logging.info("Querying modbus")
 
         if self.ensure_connected() is None:
@@ -1137,38 +1891,110 @@ class App:
             # attempts failing is still the same single failure to the retry budget.
             if not self.datalogger_offline:
                 self.datalogger_is_offline(offline=True)
+
+            # Nothing read is a record too: an outage is what a replay most needs
+            # to go through.
+            if self.capture is not None:
+                self.capture.poll(time(), {})
             return {}
 
         registers, expected_registers = self.read_span()
 
-        # Sometimes we get a response with almost all values being 0, usually also multiple registers
-        # are missing. In that case we just return an empty dictionary. This validation is not perfect
-        # but it should be good enough for now.
-        if len(registers) != expected_registers:
+        # As read, before anything is judged, so a replay judges it the same way.
+        if self.capture is not None:
+            self.capture.poll(time(), registers)
+        self.adapt_chunk_size()
+        received_registers = sum(len(table) for table in registers.values())
+
+        # Whatever did arrive is kept, and publish_readings publishes every sensor
+        # whose registers are all in it. A short poll used to be thrown away whole,
+        # which under a marginal link turned one flaky request into an empty poll.
+        # The read plan never splits a reading between requests, so a reading is
+        # either all there or not there at all.
+        if received_registers != expected_registers:
             logging.info(
-                f"Validation of number of queried registers failed. "
-                f"Queried: {expected_registers}, received: {len(registers)}"
+                f"Only part of the span was read. "
+                f"Queried: {expected_registers}, received: {received_registers}"
             )
             # A poll that could not read the span it asked for leaves a connection
             # there is no reason to trust, so the next poll starts from a fresh one.
             # That is also what every poll did before a connection could be kept, so
             # turning the setting on cannot make a bad morning worse than it was.
             self.drop_connection("the register span could not be read in full")
-            return {}
-
-        self.release_connection()
+        else:
+            self.release_connection()
 
         if self.response_is_dead(registers):
             return {}
 
+        # Replaced whole, never changed in place, so the proxy and API threads
+        # reading it need no lock.
+        self.snapshot = Snapshot(registers, monotonic(), datetime.now().astimezone())
         return registers
 
-    def pick_from_registers(
-        self, registers: dict[int, int], start: int, count: int
-    ) -> list[int]:
-        return [registers[i] for i in range(start, start + count)]
+    def snapshot_age(self) -> float:
+        return monotonic() - self.snapshot.taken
+
+    def cached_read(self, function_code: int, address: int, count: int, max_age: float):
+        # The registers asked for, from the last poll if it read all of them and is
+        # at most max_age seconds old. None sends the caller to the datalogger.
+        if self.snapshot_age() > max_age:
+            return None
+
+        return self.snapshot.read(function_code, address, count)
+
+    def forward_read(self, function_code: int, address: int, count: int):
+        # One request on behalf of a proxy client, over the app's connection and
+        # between the poll's own requests. One attempt: the client has its own retry
+        # policy, and a retry here would hold the connection from the poll.
+        with self.modbus_lock:
+            client = self.ensure_connected()
+
+            if client is None:
+                return None
+
+            try:
+                message = getattr(client, FUNCTION_CODES[function_code])(
+                    device_id=self.config["datalogger"]["device_id"],
+                    address=address,
+                    count=count,
+                )
+            except Exception as e:
+                logging.error(f"Error occured while forwarding a modbus read: {e}")
+                self.drop_connection(f"a forwarded read raised {type(e).__name__}: {e}")
+                return None
+
+            return None if message.isError() else message.registers
+
+    def poll_interval(self) -> int:
+        return (
+            self.config["datalogger"]["poll_interval"]
+            if not self.datalogger_offline
+            else self.config["datalogger"]["poll_interval_if_off"]
+        )
+
+    def poll_slot(self) -> float:
+        # The start, on the wall clock, of the slot a poll starting now serves: the
+        # grid line just gone, or one just ahead that sleep() woke a little early for.
+        interval = self.poll_interval()
+        return (time() + SLOT_TOLERANCE) // interval * interval
+
+    def seconds_until_next_poll(self, started: float, slot: float | None = None):
+        # With align_polls, polls start on the wall clock's grid of the interval: at
+        # :00 and :30 for 30 seconds, whenever the app was started and however long
+        # the last poll took. Every inverter of a fleet, and every install, then reads
+        # at the same instants, which is what lines their readings up downstream. A
+        # poll that overran waits for the next slot rather than starting late.
+        #
+        # Counted from the slot the poll serves, taken once as it starts, rather
+        # than from the clock: a poll that started a hair before its grid line still
+        # has until the end of that slot.
+        if self.config["datalogger"].get("align_polls"):
+            interval = self.poll_interval()
+            now = time()
+            after = now if slot is None else max(now, slot)
+            return (after // interval + 1) * interval - now
 
-    def seconds_until_next_poll(self, started: float) -> float:
         # The interval is the gap between the starts of two polls, not the gap
         # between the end of one and the start of the next. Sleeping the whole
         # interval after the work added the length of the poll to every cycle, which
@@ -1179,30 +2005,33 @@ class App:
         # A poll that overran its own interval is not made up for, it just starts the
         # next one immediately. Measuring from the start each time means a slow poll
         # cannot leave a debt behind for the ones after it.
-        interval = (
-            self.config["datalogger"]["poll_interval"]
-            if not self.datalogger_offline
-            else self.config["datalogger"]["poll_interval_if_off"]
-        )
+        return max(0, self.poll_interval() - (monotonic() - started))
 
-        return max(0, interval - (monotonic() - started))
+    def missed_slots(self, started: float, slot: float | None = None) -> int:
+        # Whole intervals a poll ran past its own, each one a poll that should have
+        # started and did not. On the grid, the slots that went by unpolled after the
+        # one the poll served.
+        interval = self.poll_interval()
+        elapsed = monotonic() - started
 
-    def decode_register(self, sensor: dict[str, Any], values: list[int]) -> Any:
-        value = values[0]
-
-        if "scale" in sensor["modbus"]:
-            value = float(value) * sensor["modbus"]["scale"]
+        if self.config["datalogger"].get("align_polls"):
+            now = time()
+            served = now - elapsed if slot is None else slot
+            return max(0, int(now // interval - served // interval))
 
-            if "decimals" in sensor["modbus"]:
-                value = round(value, sensor["modbus"]["decimals"])
+        return int(elapsed // interval)
 
-        return value
+    def decode_register(self, sensor: dict[str, Any], values: list[int]) -> Any:
+        # Scaled afterwards, from the scale and decimals compiled into its Decoding.
+        return values[0]
 
     def decode_long(self, sensor: dict[str, Any], values: list[int]) -> Any:
-        return ModbusTcpClient.convert_from_registers(
-            values,
-            data_type=ModbusTcpClient.DATATYPE.INT32,
-        )
+        # INT32, high word first, and signed: a power register that reads all ones is
+        # -1. Two shifts rather than pymodbus's convert_from_registers, which packs the
+        # words into bytes and unpacks them again through struct on every call.
+        value = values[0] << 16 | values[1]
+
+        return value - 0x100000000 if value & 0x80000000 else value
 
     def decode_composed_datetime(
         self, sensor: dict[str, Any], values: list[int]
@@ -1231,106 +2060,324 @@ class App:
             bin(value),
         )
 
-    def decode_sensor(self, sensor: dict[str, Any], registers: dict[int, int]) -> Any:
+    def decode_sensor(
+        self, sensor: dict[str, Any], registers: dict[int, int] | Registers
+    ) -> Any:
         # One sensor's reading out of the registers this poll returned, or None if it
         # could not be made. This whole chain used to sit inline in the poll loop, so
         # a decode could not be exercised without running a poll, and a new read type
         # meant another branch in the middle of it.
-        try:
-            # Verify that we have the register needed
-            if sensor["modbus"]["register"] not in registers:
-                raise Exception(f"Register {sensor['modbus']['register']} not found")
+        decoding = self.compile_sensor(sensor)
 
-            read_type = READ_TYPES.get(sensor["modbus"]["read_type"])
+        if decoding is None:
+            return None
 
-            if read_type is None:
-                logging.error(
-                    f"modbus.readtype of {sensor['modbus']['read_type']} not supported"
-                )
-                return None
+        if not isinstance(registers, Registers):
+            registers = Registers.from_dict(registers)
 
-            values = self.pick_from_registers(
-                registers,
-                sensor["modbus"]["register"],
-                read_type.width,
-            )
+        return self.decode_reading(decoding, registers)
 
-            return read_type.decode(self, sensor, values)
+    def decode_reading(self, decoding: Decoding, registers: Registers) -> Any:
+        try:
+            values = registers.span(decoding.register, decoding.width)
+        except KeyError as e:
+            logging.error(f"Register {e} not found for {decoding.name}")
+            return None
 
+        try:
+            value = decoding.decode(values)
         except Exception as e:
             logging.error(f"Error occured {e}")
             return None
 
-    def publish_readings(self, registers: dict[int, int]) -> None:
-        for sensor in self.sensors_config:
-            # Check if sensor is active and has a modbus read type
-            if (
-                not sensor["active"]
-                or "modbus" not in sensor
-                or "read_type" not in sensor["modbus"]
+        if value is None or decoding.scale is None:
+            return value
+
+        value = float(value) * decoding.scale
+
+        if decoding.decimals is not None:
+            value = round(value, decoding.decimals)
+
+        return value
+
+    def decode_plan(
+        self, registers: dict[int, Registers], sensors: list[Decoding]
+    ) -> DecodePlan:
+        # Kept per set of sensors and layout of blocks, which between them settle
+        # where every reading is. By identity: a sensor compiled again is another.
+        layout = tuple(
+            (function_code, table.layout())
+            for function_code, table in registers.items()
+        )
+        key = (tuple(map(id, sensors)), layout)
+        plan = self.decode_plans.get(key)
+
+        if plan is not None:
+            return plan
+
+        blocks: dict[tuple[int, int], tuple[list, list, list, list]] = {}
+        decoded, missing = [], []
+
+        for position, decoding in enumerate(sensors):
+            table = registers.get(decoding.function_code, EMPTY)
+            found = table.locate(decoding.register, decoding.width)
+
+            if found is None:
+                missing.append(position)
+                continue
+
+            index, offset = found
+
+            # A scale is only ever compiled in for a plain register, whose value is
+            # its one word as it stands.
+            if decoding.scale is None:
+                decoded.append((position, decoding.function_code, index, offset))
+                continue
+
+            positions, offsets, scales, decimals = blocks.setdefault(
+                (decoding.function_code, index), ([], [], [], [])
+            )
+            positions.append(position)
+            offsets.append(offset)
+            scales.append(decoding.scale)
+            decimals.append(decoding.decimals)
+
+        scaled = [
+            (
+                function_code,
+                index,
+                positions,
+                # itemgetter of one item gives the item rather than a tuple of it.
+                itemgetter(*offsets)
+                if len(offsets) > 1
+                else partial(words_at, offsets[0]),
+                scales,
+                decimals,
+            )
+            for (function_code, index), (
+                positions,
+                offsets,
+                scales,
+                decimals,
+            ) in blocks.items()
+        ]
+        plan = DecodePlan(scaled, decoded, missing, tuple(sensors))
+        self.decode_plans[key] = plan
+        return plan
+
+    def decode_readings(
+        self, registers: dict[int, Registers], sensors: list[Decoding]
+    ) -> tuple[list[Any], list[int]]:
+        # Every sensor's value, None for one that could not be decoded, in the order
+        # of sensors, and the positions of those whose registers were not read.
+        plan = self.decode_plan(registers, sensors)
+        values: list[Any] = [None] * len(sensors)
+
+        for function_code, index, positions, take, scales, decimals in plan.scaled:
+            words = take(registers[function_code].blocks[index][1])
+
+            for position, word, scale, places in zip(
+                positions, words, scales, decimals
             ):
+                value = word * scale
+                values[position] = value if places is None else round(value, places)
+
+        for position, function_code, index, offset in plan.decoded:
+            decoding = sensors[position]
+            block = registers[function_code].blocks[index][1]
+
+            try:
+                values[position] = decoding.decode(
+                    block[offset : offset + decoding.width]
+                )
+            except Exception as e:
+                logging.error(f"Error occured {e}")
+
+        return values, plan.missing
+
+    def value_changed(self, decoding: Decoding, value: Any) -> bool:
+        # Whether a reading is worth publishing. Every topic is retained, so the same
+        # value again tells a subscriber nothing it does not already hold, and yet it
+        # is a write the broker persists and hands to every subscriber, and a row in
+        # Home Assistant's recorder: seventy of them a minute per inverter, nearly all
+        # of them saying nothing. So a reading goes out when it differs from what the
+        # topic holds, by more than the sensor's deadband if it has one, or when the
+        # topic has been quiet for mqtt.heartbeat seconds, which is what keeps a flat
+        # line looking alive rather than stuck. A heartbeat of 0 publishes every poll.
+        heartbeat = self.config["mqtt"]["heartbeat"]
+        last = self.last_published.get(decoding.topic)
+
+        if not heartbeat or last is None:
+            return True
+
+        previous, published_at = last
+
+        if monotonic() - published_at >= heartbeat:
+            return True
+
+        if value == previous:
+            return False
+
+        # A deadband only makes sense between two numbers. A bit map or a timestamp
+        # that changed has changed. bool is an int, but not a number anyone measures.
+        numbers = all(
+            isinstance(v, (int, float)) and not isinstance(v, bool)
+            for v in (value, previous)
+        )
+
+        if not numbers:
+            return True
+
+        # The wider of the two bands, so relative: 0.02 with absolute: 5 ignores the
+        # jitter of a small reading and two percent of a big one.
+        band = max(
+            decoding.absolute_deadband, decoding.relative_deadband * abs(previous)
+        )
+
+        return abs(value - previous) > band
+
+    def publish_readings(
+        self,
+        registers: dict[int, Registers],
+        sensors: list[Decoding] | None = None,
+    ) -> list[Decoding]:
+        # The sensors this poll read, every active modbus sensor if not told. One that
+        # was not due had no registers asked for, and decoding it would only log that
+        # they are missing.
+        #
+        # Returns the ones whose registers were all there. A poll can come back with
+        # part of the span, and the rest are said once, here, as not read this time,
+        # rather than as a missing register each.
+        if sensors is None:
+            sensors = self.decodings
+
+        values, missing = self.decode_readings(registers, sensors)
+        not_read = set(missing)
+        read = []
+
+        for position, (decoding, value) in enumerate(zip(sensors, values)):
+            if position in not_read:
                 continue
 
-            value = self.decode_sensor(sensor, registers)
+            read.append(decoding)
 
             # None is not a reading. Nothing publishable decodes to it, so it is free
             # to mean "this one could not be read", which is what the log lines in
-            # decode_sensor have already said.
+            # decode_readings have already said.
             if value is None:
                 continue
 
-            if not self.value_is_publishable(sensor, value):
+            if not self.value_is_publishable(decoding.sensor, value):
+                continue
+
+            if not self.value_changed(decoding, value):
+                logging.debug("Sensor %s unchanged: %s", decoding.name, value)
                 continue
 
-            logging.info("Publishing sensor %s: %s", sensor["name"], value)
+            logging.info("Publishing sensor %s: %s", decoding.name, value)
 
-            self.publish(
-                f"{self.config['mqtt']['topic_prefix']}/{sensor['name']}",
-                value,
-                retain=True,
-            )
+            self.publish(decoding.topic, value, retain=True)
+
+        if missing:
+            names = ", ".join(sensors[position].name for position in missing)
+            logging.info(f"Not read this poll: {names}")
+
+        return read
 
     def main(self) -> None:
         # Generate Home assistant MQTT discovery topics
         self.generate_ha_discovery_topics()
 
-        # Get register interval, find lowest and higest register numbers
-        self.get_register_interval()
-
         # Find out which day the counters currently published to MQTT belong to
         self.load_state()
 
         while True:
+            self.reload_if_changed()
+
             logging.debug("Datalogger scan start at " + datetime.now().isoformat())
             poll_started = monotonic()
+            slot = self.poll_slot()
+
+            # The poll has until the next one is due. Retries and requests that would
+            # run past it are left for that poll, so a slow poll cannot push every
+            # later one back with it.
+            self.poll_deadline = poll_started + self.seconds_until_next_poll(
+                poll_started, slot
+            )
 
             # Reset the counters on the wall clock, the datalogger is unreachable
             # at midnight so this cannot wait for a successful poll
             self.reset_counters()
 
+            # Work out which registers to ask for this time, and in how many requests
+            due = self.sensors_due(poll_started)
+            self.plan_reads(due)
+            due = self.sensors_covered(due)
+
             registers = self.query_modbus()
 
             # An empty answer is a failed poll, and a failed poll publishes nothing:
             # query_modbus has already dealt with the availability topic and with
-            # whatever has to be said on the sensors themselves.
+            # whatever has to be said on the sensors themselves. Nor does it count as
+            # having read anything, so a slow sensor stays due until a poll works.
             if registers:
-                self.publish_readings(registers)
+                decode_started = monotonic()
+                read = self.publish_readings(registers, due)
+                metrics.DECODE_SECONDS.observe(
+                    monotonic() - decode_started, **self.metric_labels()
+                )
+
+                # Only the sensors that were read. One whose request failed stays
+                # due, so the next poll asks for it again.
+                for decoding in read:
+                    self.last_polled[decoding.name] = poll_started
+
+            # Failed polls included: one that spent its budget on retries is exactly
+            # the one worth seeing.
+            metrics.POLL_SECONDS.observe(
+                monotonic() - poll_started, **self.metric_labels()
+            )
+
+            missed = self.missed_slots(poll_started, slot)
+
+            if missed:
+                logging.warning(
+                    f"Poll took {monotonic() - poll_started:.1f} seconds, "
+                    f"{missed} poll slot(s) missed"
+                )
+                metrics.MISSED_POLLS.inc(missed, **self.metric_labels())
 
             # Wait until the next poll is due, which is the configured interval after
             # this one started, or the longer interval if the datalogger is not
             # answering.
-            sleep_duration = self.seconds_until_next_poll(poll_started)
+            sleep_duration = self.seconds_until_next_poll(poll_started, slot)
 
             logging.debug(f"Datalogger scanning paused for {sleep_duration} seconds")
+            metrics.SLEEP_SECONDS.inc(
+                sleep_duration, **self.metric_labels(reason="poll_interval")
+            )
             sleep(sleep_duration)
 
 
+# The payload that tells Home Assistant a per-sensor config is moving into a device
+# config, rather than going away with its entity.
+MIGRATE_DISCOVERY = '{"migrate_discovery": true}'
+
+# What publish_readings decodes from when a poll read nothing from a table.
+EMPTY = Registers()
+
+
 # Every modbus read type there is, and the only place any of them is named. The poll
 # loop and the polled register span both come from this table, so a new read type is
 # an entry here and a decoder above rather than another branch in each of them. The
 # names are the ones sensors.yaml is allowed to use; app/sensors.py is the gate.
+def words_at(offset: int, block: array) -> tuple[int]:
+    # The one word at offset, as the tuple itemgetter gives for several.
+    return (block[offset],)
+
+
 READ_TYPES = {
-    "register": ReadType(1, App.decode_register),
+    "register": ReadType(1, App.decode_register, scaled=True),
     "long": ReadType(2, App.decode_long),
     "composed_datetime": ReadType(6, App.decode_composed_datetime),
     "alarm": ReadType(4, App.decode_alarm),
@@ -1338,16 +2385,240 @@ READ_TYPES = {
 }
 
 
+@cache
+def environment() -> Env:
+    # The environment, with a .env file if there is one. Finding that file walks up
+    # from the working directory, so it is done once rather than for each file read.
+    env = Env()
+    env.read_env()
+    return env
+
+
+def config_file() -> str:
+    return environment()("CONFIG_FILE", "./config.yaml")
+
+
+def sensors_file() -> str:
+    return environment()("SENSORS_FILE", "./sensors.yaml")
+
+
+def load_config() -> dict[str, Any]:
+    env = environment()
+
+    # Load config from file
+    with open(config_file()) as f:
+        raw_config = f.read()
+
+    config = yaml.load(raw_config, yaml.Loader)
+
+    # Load config from env vars
+    with env.prefixed("MQTT_"):
+        mqtt_user = env("USER", None)
+        mqtt_password = env("PASSWORD", None)
+
+    if mqtt_user is not None:
+        config["mqtt"]["user"] = mqtt_user
+
+    if mqtt_password is not None:
+        config["mqtt"]["password"] = mqtt_password
+
+    # Load config
+    return AppConfig().load(config)
+
+
+def load_sensors_config() -> list[dict[str, Any]]:
+    env = environment()
+
+    with open(sensors_file(), "rb") as file:
+        source = file.read()
+
+    # Empty turns the cache off.
+    cache_file = env("SENSORS_CACHE", "./sensors.cache")
+
+    return sensor_cache.load_sensors(source, cache_file, parse_sensors_config)
+
+
+def parse_sensors_config(source: bytes) -> list[dict[str, Any]]:
+    return Sensor(many=True).load(yaml.safe_load(source))
+
+
+def device_configs(config: dict[str, Any]) -> list[dict[str, Any]]:
+    # One config per inverter, each in the shape App has always been given. A single
+    # inverter's config is that already. A fleet's entries each get the shared MQTT
+    # settings under their own topic_prefix, and two things that stay the app's rather
+    # than the inverter's: the availability topic the will is on, since one MQTT
+    # connection has one will, and a Home Assistant device of their own.
+    if not config.get("inverters"):
+        return [config]
+
+    app_availability = f"{config['mqtt']['topic_prefix']}/availability"
+
+    return [
+        {
+            "debug": config["debug"],
+            "datalogger": device["datalogger"],
+            "inverter": device["inverter"],
+            "capture": config["capture"],
+            "mqtt": config["mqtt"]
+            | {
+                "topic_prefix": device["topic_prefix"],
+                "availability_topic": app_availability,
+                "device_identifier": device["topic_prefix"],
+            },
+        }
+        for device in config["inverters"]
+    ]
+
+
+def process_age() -> float | None:
+    # Wall-clock seconds since the process started, from the kernel's record of when
+    # it did, to the clock tick. None without a /proc to read it from.
+    try:
+        with open("/proc/self/stat") as file:
+            stat = file.read()
+
+        with open("/proc/uptime") as file:
+            uptime = float(file.read().split()[0])
+    except OSError:
+        return None
+
+    # starttime, the 22nd field, counted past the command name: that is in
+    # parentheses and may itself hold spaces.
+    started = int(stat[stat.rindex(")") + 2 :].split()[19])
+    return uptime - started / os.sysconf("SC_CLK_TCK")
+
+
+class Stopwatch:
+    """Where startup's time went, step by step, for the line logged before polling.
+
+    A restart is a gap in every reading, so what it costs is worth seeing each time
+    rather than guessing at. The interpreter and the imports come before anything
+    here can time them, and are given as the time since the process started, where
+    the system says when that was.
+    """
+
+    def __init__(self):
+        self.imports = process_age()
+        self.started = self.lap_started = perf_counter()
+        self.steps: list[tuple[str, float]] = []
+
+    def lap(self, step: str) -> None:
+        now = perf_counter()
+        self.steps.append((step, now - self.lap_started))
+        self.lap_started = now
+
+    def report(self) -> str:
+        steps = ", ".join(
+            f"{step} {seconds * 1000:.0f} ms" for step, seconds in self.steps
+        )
+        total = self.lap_started - self.started
+
+        if self.imports is None:
+            return f"Started in {total * 1000:.0f} ms: {steps}"
+
+        return (
+            f"Started in {total * 1000:.0f} ms after {self.imports * 1000:.0f} ms "
+            f"of interpreter start-up and imports: {steps}"
+        )
+
+
+def run_fleet(apps: list[App]) -> None:
+    # A thread per inverter. Each one blocks on its own datalogger for as long as
+    # that datalogger takes, which is exactly what must not hold up the others, and
+    # the work between those waits is small enough that one process keeps up with
+    # any site that fits on a LAN.
+    threads = [
+        Thread(target=app.main, name=app.config["mqtt"]["topic_prefix"], daemon=True)
+        for app in apps
+    ]
+
+    for thread in threads:
+        thread.start()
+
+    # An inverter whose loop died has stopped publishing while the process, and so
+    # the will, stays alive. Exiting is what a single inverter has always done on an
+    # unhandled error, and it lets the container restart put all of them back.
+    while all(thread.is_alive() for thread in threads):
+        sleep(5)
+
+    dead = [thread.name for thread in threads if not thread.is_alive()]
+    logging.error(f"Polling stopped for {', '.join(dead)}, exiting")
+    sys.exit(1)
+
+
 if __name__ == "__main__":
 
     def start_up():
+        stopwatch = Stopwatch()
+        config = load_config()
+        # With a fleet the log lines would be indistinguishable without the inverter
+        # they came from, which is the name of the thread polling it.
+        fleet = bool(config.get("inverters"))
+
         handler = logging.StreamHandler()
         logging.basicConfig(
             level=logging.INFO,
-            format="%(asctime)s - %(name)s - %(message)s",
+            format="%(asctime)s - %(threadName)s - %(message)s"
+            if fleet
+            else "%(asctime)s - %(name)s - %(message)s",
             handlers=[handler],
         )
         logging.info("Starting up...")
-        App().main()
+
+        log_level = logging.DEBUG if config["debug"] else logging.INFO
+        logging.getLogger().setLevel(log_level)
+        pymodbus_apply_logging_config(logging.INFO)
+
+        stopwatch.lap("config")
+
+        # Parsed once, and one connection to the broker, however many inverters.
+        sensors_config = load_sensors_config()
+        stopwatch.lap("sensors")
+        mqtt = Mqtt(config["mqtt"]) if config["mqtt"]["enabled"] else None
+        state = open_state(config["state"], mqtt)
+        stopwatch.lap("broker and state")
+
+        if config["metrics"]["enabled"]:
+            metrics.serve(config["metrics"]["host"], config["metrics"]["port"])
+
+        apps = [
+            App(device, sensors_config, mqtt, state)
+            for device in device_configs(config)
+        ]
+
+        if config["reload"]:
+            for app in apps:
+                app.watcher = FileWatcher([config_file(), sensors_file()])
+                app.fleet = [other.config["mqtt"]["topic_prefix"] for other in apps]
+        stopwatch.lap("inverters")
+
+        for app in apps:
+            proxy_config = app.config["datalogger"]["proxy"]
+
+            if proxy_config["enabled"]:
+                proxy.serve(
+                    app,
+                    proxy_config["host"],
+                    proxy_config["port"],
+                    proxy_config["max_age"],
+                    proxy_config["forward"],
+                )
+
+        if config["api"]["enabled"]:
+            api.serve(
+                apps,
+                config["api"]["host"],
+                config["api"]["port"],
+                config["api"]["max_age"],
+            )
+
+        stopwatch.lap("servers")
+        logging.info(stopwatch.report())
+
+        if not fleet:
+            apps[0].main()
+            return
+
+        run_fleet(apps)
 
     start_up()
@@ -0,0 +1,201 @@
+import logging
+import os
+import re
+import struct
+from datetime import datetime
+from threading import Lock
+from typing import Iterator, NamedTuple
+
+from registers import Registers
+
+# At the start of every capture file, with the version of what follows.
+MAGIC = b"TS2MCAP"
+VERSION = 1
+
+# A record: its kind, when it was made (seconds since the epoch), payload length.
+RECORD = struct.Struct(">cdI")
+POLL = b"P"
+HTTP = b"H"
+
+
+class PollRecord(NamedTuple):
+    """What one poll read, as read_span returned it. Empty for a poll that failed."""
+
+    at: float
+    registers: dict[int, Registers]
+
+
+class HttpRecord(NamedTuple):
+    """The CGI bodies one HTTP refresh read, by endpoint."""
+
+    at: float
+    bodies: dict[str, str]
+
+
+def encode_registers(registers: dict[int, Registers]) -> bytes:
+    # Per table its function code and block count, per block its start and length,
+    # then the registers themselves, two bytes each. With its record header a poll
+    # of the shipped map is about 170 bytes, 15 MB a month at a 30 second interval.
+    parts = [struct.pack(">B", len(registers))]
+
+    for function_code, table in sorted(registers.items()):
+        parts.append(struct.pack(">BH", function_code, len(table.blocks)))
+
+        for start, block in table.blocks:
+            parts.append(struct.pack(">HH", start, len(block)))
+            parts.append(struct.pack(f">{len(block)}H", *block))
+
+    return b"".join(parts)
+
+
+def decode_registers(payload: bytes) -> dict[int, Registers]:
+    registers: dict[int, Registers] = {}
+    (tables,), offset = struct.unpack_from(">B", payload), 1
+
+    for _ in range(tables):
+        function_code, blocks = struct.unpack_from(">BH", payload, offset)
+        offset += 3
+        table = registers.setdefault(function_code, Registers())
+
+        for _ in range(blocks):
+            start, count = struct.unpack_from(">HH", payload, offset)
+            offset += 4
+            table.add(start, struct.unpack_from(f">{count}H", payload, offset))
+            offset += 2 * count
+
+    return registers
+
+
+def encode_bodies(bodies: dict[str, str]) -> bytes:
+    parts = [struct.pack(">B", len(bodies))]
+
+    for endpoint, body in sorted(bodies.items()):
+        name, text = endpoint.encode(), body.encode()
+        parts += [
+            struct.pack(">B", len(name)),
+            name,
+            struct.pack(">I", len(text)),
+            text,
+        ]
+
+    return b"".join(parts)
+
+
+def decode_bodies(payload: bytes) -> dict[str, str]:
+    bodies = {}
+    (count,), offset = struct.unpack_from(">B", payload), 1
+
+    for _ in range(count):
+        (length,) = struct.unpack_from(">B", payload, offset)
+        name = payload[offset + 1 : offset + 1 + length].decode()
+        offset += 1 + length
+        (length,) = struct.unpack_from(">I", payload, offset)
+        bodies[name] = payload[offset + 4 : offset + 4 + length].decode()
+        offset += 4 + length
+
+    return bodies
+
+
+class Capture:
+    """Every poll's raw registers and every CGI refresh, appended to a binary log.
+
+    The tests hand-craft what the datalogger answers, which is how a bug gets pinned
+    down once it is understood and no help in finding it. A capture is the real
+    sequence, timestamps and all, and replay.py feeds it back through the decoding,
+    the guards and discovery at full speed: weeks of traffic in seconds, and the same
+    result every time.
+
+    One file per inverter per local day, named after both, so old captures can be
+    removed a day at a time. Written from the poll thread and the HTTP worker, hence
+    the lock, and flushed after each record so a crash loses at most the one it was
+    writing.
+    """
+
+    def __init__(self, path: str, name: str):
+        self.path = path
+        # The inverter's topic_prefix, which may have a / in it or anything else MQTT
+        # allows. Only what is safe in a file name is kept of it.
+        self.name = re.sub(r"[^\w.-]", "_", name)
+        self.lock = Lock()
+        self.file = None
+        self.day = None
+        os.makedirs(path, exist_ok=True)
+
+    def file_for(self, at: float):
+        day = datetime.fromtimestamp(at).strftime("%Y-%m-%d")
+
+        if day != self.day:
+            self.close()
+            file_name = os.path.join(self.path, f"{self.name}-{day}.cap")
+            self.file = open(file_name, "ab")
+
+            if self.file.tell() == 0:
+                self.file.write(MAGIC + bytes((VERSION,)))
+
+            self.day = day
+            logging.info(f"Capturing to {file_name}")
+
+        return self.file
+
+    def write(self, kind: bytes, at: float, payload: bytes) -> None:
+        # Written from the poll thread, where an error would end the polling. A
+        # capture that cannot be written is a capture missing a record, no more.
+        with self.lock:
+            try:
+                file = self.file_for(at)
+                file.write(RECORD.pack(kind, at, len(payload)) + payload)
+                file.flush()
+            except OSError as e:
+                logging.error(f"Unable to write to the capture: {e}")
+                self.close()
+
+    def poll(self, at: float, registers: dict[int, Registers]) -> None:
+        self.write(POLL, at, encode_registers(registers))
+
+    def http(self, at: float, bodies: dict[str, str]) -> None:
+        self.write(HTTP, at, encode_bodies(bodies))
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.day = None
+
+
+def open_capture(config: dict | None, name: str) -> Capture | None:
+    if not config or not config.get("enabled"):
+        return None
+
+    return Capture(config["path"], name)
+
+
+def read_capture(file_name: str) -> Iterator[PollRecord | HttpRecord]:
+    # The records in the order they were written. A last record cut short, by a
+    # crash or by copying the file while it was being written, ends the capture
+    # rather than failing it.
+    with open(file_name, "rb") as file:
+        header = file.read(len(MAGIC) + 1)
+
+        if header[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{file_name} is not a capture")
+
+        if header[len(MAGIC)] != VERSION:
+            raise ValueError(f"{file_name} is capture version {header[len(MAGIC)]}")
+
+        while True:
+            head = file.read(RECORD.size)
+
+            if len(head) < RECORD.size:
+                return
+
+            kind, at, length = RECORD.unpack(head)
+            payload = file.read(length)
+
+            if len(payload) < length:
+                logging.warning(f"{file_name} ends in a record cut short")
+                return
+
+            if kind == POLL:
+                yield PollRecord(at, decode_registers(payload))
+            elif kind == HTTP:
+                yield HttpRecord(at, decode_bodies(payload))
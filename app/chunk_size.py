@@ -0,0 +1,106 @@
+# The most registers one Modbus read may ask for, function codes 3 and 4 alike.
+MODBUS_MAX_REGISTERS = 125
+
+
+class ChunkSize:
+    """How many registers to ask the datalogger for in one request, learned per stick.
+
+    register_chunks used to be the answer, and everyone guessed it: too large and
+    some sticks time out every poll, too small and every poll spends round trips it
+    did not need to. It is now only where this starts.
+
+    A request the datalogger refuses or times out on shrinks the size by a quarter at
+    the end of the poll, if the datalogger answered anything else in it. A poll that
+    read nothing is no verdict: the stick refuses every read while the inverter
+    sleeps, and a night of those used to shrink the size to the floor, saved, for the
+    morning to earn back one step at a time. Growing is slow and has to be earned:
+    grow_after polls in a row that read everything on the first attempt, with
+    request latency no worse than tolerance times its running average, and then
+    only by step. The caller also checks that the larger size would actually save a
+    request before taking it.
+    """
+
+    def __init__(
+        self,
+        start: int,
+        floor: int = 10,
+        ceiling: int = MODBUS_MAX_REGISTERS,
+        grow_after: int = 10,
+        step: int = 10,
+        tolerance: float = 1.5,
+    ):
+        self.floor = min(floor, start)
+        self.ceiling = ceiling
+        self.grow_after = grow_after
+        self.step = step
+        self.tolerance = tolerance
+        self.size = self.clamp(start)
+
+        # Seconds per request, a running average over the polls that went well.
+        self.baseline: float | None = None
+        self.good_polls = 0
+
+        # What the poll in progress has seen so far.
+        self.latencies: list[float] = []
+        self.refused = False
+        self.answered = False
+
+    def clamp(self, size: int) -> int:
+        return max(self.floor, min(size, self.ceiling))
+
+    def restore(self, size: int) -> None:
+        # A size learned by an earlier run. Starting over from register_chunks would
+        # mean relearning it, shrinking through timeouts on the way, every restart.
+        self.size = self.clamp(size)
+
+    def succeeded(self, seconds: float, first_attempt: bool = True) -> None:
+        # A request answered, and how long that took. Only a first attempt says how
+        # quick the datalogger is; a retry's answer just says it is there.
+        self.answered = True
+
+        if first_attempt:
+            self.latencies.append(seconds)
+
+    def failed(self, count: int) -> None:
+        # A request the datalogger refused or timed out on. One no wider than the
+        # floor says nothing about the size; shrinking cannot make it smaller.
+        if count > self.floor:
+            self.refused = True
+
+    def end_poll(self) -> None:
+        latencies, refused, answered = self.latencies, self.refused, self.answered
+        self.latencies, self.refused, self.answered = [], False, False
+
+        # Nothing was read: the datalogger is away or the inverter asleep, whatever
+        # it said to the requests. Not a verdict on the size.
+        if not answered:
+            return
+
+        if refused:
+            self.size = self.clamp(self.size * 3 // 4)
+            self.good_polls = 0
+            self.baseline = None
+            return
+
+        # Answered only on retries. Not slow, but no evidence of being quick either.
+        if not latencies:
+            return
+
+        mean = sum(latencies) / len(latencies)
+
+        if self.baseline is None:
+            self.baseline = mean
+
+        flat = mean <= self.baseline * self.tolerance
+        self.baseline = 0.8 * self.baseline + 0.2 * mean
+        self.good_polls = self.good_polls + 1 if flat else 0
+
+    def ready_to_grow(self) -> bool:
+        return self.good_polls >= self.grow_after and self.size < self.ceiling
+
+    def next_size(self) -> int:
+        return self.clamp(self.size + self.step)
+
+    def grow(self) -> None:
+        self.size = self.next_size()
+        self.good_polls = 0
@@ -1,4 +1,4 @@
-from marshmallow import Schema, fields, validates_schema, ValidationError
+from marshmallow import Schema, fields, validate, validates_schema, ValidationError
 
 
 class HttpConfig(Schema):
@@ -12,6 +12,22 @@ class HttpConfig(Schema):
             raise ValidationError("Password must be provided with username for HTTP")
 
 
+class ProxyConfig(Schema):
+    # A Modbus TCP server for other local clients, in front of the one connection the
+    # datalogger allows. Reads of registers the last poll got are answered from it
+    # while it is at most max_age seconds old; anything else is asked of the
+    # datalogger over the app's own connection, which is kept open for the purpose.
+    enabled = fields.Bool(required=False, load_default=False)
+    host = fields.Str(required=False, load_default="0.0.0.0")
+    port = fields.Int(required=False, load_default=5020)
+    max_age = fields.Int(
+        required=False, load_default=10, validate=validate.Range(min=0)
+    )
+    # Off serves only what the polls read, never asking the datalogger for a client,
+    # so the stick's load is the app's alone whatever is attached.
+    forward = fields.Bool(required=False, load_default=True)
+
+
 class DataLoggerConfig(Schema):
     host = fields.Str(required=True)
     port = fields.Int(required=False, load_default=502)
@@ -19,7 +35,23 @@ class DataLoggerConfig(Schema):
     poll_interval = fields.Int(required=False, load_default=60)
     poll_interval_if_off = fields.Int(required=False, load_default=600)
     poll_retries = fields.Int(required=False, load_default=10)
-    register_chunks = fields.Int(required=False, load_default=80)
+    # Start polls on the wall clock's grid of poll_interval, at :00 and :30 for 30
+    # seconds, instead of poll_interval after the last one started. Readings of every
+    # inverter then share timestamps, and a poll that overruns skips to the next slot.
+    align_polls = fields.Bool(required=False, load_default=False)
+    # The most registers one request asks for, to begin with. With adaptive_chunks
+    # the app learns the size this datalogger copes with from there, shrinking on
+    # refusals and timeouts and growing while reads stay quick, and keeps what it
+    # learned across restarts. Without it this is the size, always.
+    register_chunks = fields.Int(
+        required=False, load_default=80, validate=validate.Range(min=1, max=125)
+    )
+    adaptive_chunks = fields.Bool(required=False, load_default=False)
+    # What one more request to the datalogger is worth, in registers. Two groups of
+    # registers separated by a hole smaller than this are read together, holes and
+    # all; anything wider is skipped at the price of another round trip. A round trip
+    # to these sticks is most of a second, and a register is two bytes of an answer.
+    request_cost = fields.Int(required=False, load_default=40)
     # Keep the modbus connection open between polls instead of dialling a new one
     # every time. Off by default, and deliberately so: this datalogger accepts one
     # connection at a time, so holding it means nothing else -- Solis Cloud included
@@ -32,6 +64,17 @@ class DataLoggerConfig(Schema):
     # behaviours goes and this setting goes with it.
     persistent_connection = fields.Bool(required=False, load_default=False)
     http = fields.Nested(HttpConfig(), required=False)
+    proxy = fields.Nested(
+        ProxyConfig(),
+        required=False,
+        load_default={
+            "enabled": False,
+            "host": "0.0.0.0",
+            "port": 5020,
+            "max_age": 10,
+            "forward": True,
+        },
+    )
 
 
 class InverterConfig(Schema):
@@ -56,6 +99,28 @@ class MqttConfig(Schema):
     password = fields.Str(required=False)
     use_ssl = fields.Bool(required=False, load_default=False)
     validate_cert = fields.Bool(required=False, load_default=False)
+    # Seconds a reading may go unpublished while it is not changing. Every topic is
+    # retained, so a reading is only published when it moves, and this is the most
+    # a flat line is left alone before it is said again. 0 publishes every poll.
+    heartbeat = fields.Int(
+        required=False, load_default=300, validate=validate.Range(min=0)
+    )
+    # A directory to spool what is published while the broker is unreachable, sent
+    # in order once it is back. Without one, a broker restart loses those readings.
+    # Capped at spool_max_mb, past which the oldest are dropped. Left empty, as the
+    # example leaves it, it is None, which is no spool too.
+    spool_path = fields.Str(required=False, allow_none=True, load_default="")
+    spool_max_mb = fields.Int(
+        required=False, load_default=64, validate=validate.Range(min=1)
+    )
+    # How Home Assistant is told about the sensors: sensor, a retained config per
+    # sensor, or device, one per inverter carrying all of them. Switching to device
+    # migrates the entities over rather than removing them.
+    discovery = fields.Str(
+        required=False,
+        load_default="sensor",
+        validate=validate.OneOf(choices=["sensor", "device"]),
+    )
 
     @validates_schema()
     def validate_user_requires_password(self, data, **kwargs):
@@ -68,11 +133,147 @@ class MqttConfig(Schema):
             raise ValidationError("Host is required if MQTT is enabled")
 
 
-class AppConfig(Schema):
-    debug = fields.Bool(load_default=False)
+class StateConfig(Schema):
+    # Where the counters' state is kept between runs: the day they belong to, what
+    # each read before its last reset, and where the lifetime counter stood. mqtt
+    # keeps it in retained topics, as this app always has. sqlite keeps it in a file
+    # at path, which restores without waiting on the broker and works with MQTT off;
+    # the retained topics are still published alongside it.
+    backend = fields.Str(
+        required=False,
+        load_default="mqtt",
+        validate=validate.OneOf(choices=["mqtt", "sqlite"]),
+    )
+    path = fields.Str(required=False, load_default="state.sqlite")
+
+
+class MetricsConfig(Schema):
+    # Poll timing and datalogger health in the OpenMetrics text format, for
+    # Prometheus to scrape from http://host:port/metrics.
+    enabled = fields.Bool(required=False, load_default=False)
+    host = fields.Str(required=False, load_default="0.0.0.0")
+    port = fields.Int(required=False, load_default=9110)
+
+
+class CaptureConfig(Schema):
+    # Write every poll's raw registers and every CGI refresh to a binary log under
+    # path, one file per inverter per day, for replay.py to feed back through the
+    # decoding and the guards. For reproducing what happened on a given day.
+    enabled = fields.Bool(required=False, load_default=False)
+    path = fields.Str(required=False, load_default="captures")
+
+
+class ApiConfig(Schema):
+    # The registers each inverter's last poll read, as JSON over HTTP, for dashboards
+    # and scripts that would otherwise poll the datalogger themselves. A snapshot
+    # older than max_age seconds is refused rather than served as current.
+    enabled = fields.Bool(required=False, load_default=False)
+    host = fields.Str(required=False, load_default="0.0.0.0")
+    port = fields.Int(required=False, load_default=9111)
+    max_age = fields.Int(
+        required=False, load_default=120, validate=validate.Range(min=0)
+    )
+
+
+class DeviceConfig(Schema):
+    # One inverter of a fleet: its datalogger, its nameplate, and the prefix its
+    # topics are published under, which has to be its own.
+    topic_prefix = fields.Str(required=True)
     datalogger = fields.Nested(DataLoggerConfig(), required=True)
-    # Required, otherwise max_power_kw above is dodged by leaving the whole block
-    # out, and the app fails with a KeyError at the first reading instead of a clear
-    # message at startup.
     inverter = fields.Nested(InverterConfig(), required=True)
+
+
+class AppConfig(Schema):
+    debug = fields.Bool(load_default=False)
+    datalogger = fields.Nested(DataLoggerConfig(), required=False)
+    # Required unless there is a fleet, otherwise max_power_kw above is dodged by
+    # leaving the whole block out, and the app fails with a KeyError at the first
+    # reading instead of a clear message at startup.
+    inverter = fields.Nested(InverterConfig(), required=False)
+    # Any number of inverters polled from one process, sharing one MQTT connection
+    # and one parsed sensors.yaml. Instead of datalogger and inverter, not as well.
+    inverters = fields.List(
+        fields.Nested(DeviceConfig()), required=False, validate=validate.Length(min=1)
+    )
     mqtt = fields.Nested(MqttConfig(), required=True)
+    # Edits to config.yaml and sensors.yaml taken up between polls, rather than at
+    # the next restart. What cannot change while running is left for that restart.
+    reload = fields.Bool(required=False, load_default=True)
+    state = fields.Nested(
+        StateConfig(),
+        required=False,
+        load_default={"backend": "mqtt", "path": "state.sqlite"},
+    )
+    metrics = fields.Nested(
+        MetricsConfig(),
+        required=False,
+        load_default={"enabled": False, "host": "0.0.0.0", "port": 9110},
+    )
+    capture = fields.Nested(
+        CaptureConfig(),
+        required=False,
+        load_default={"enabled": False, "path": "captures"},
+    )
+    api = fields.Nested(
+        ApiConfig(),
+        required=False,
+        load_default={
+            "enabled": False,
+            "host": "0.0.0.0",
+            "port": 9111,
+            "max_age": 120,
+        },
+    )
+
+    @validates_schema()
+    def one_inverter_or_a_fleet(self, data, **kwargs):
+        single = "datalogger" in data or "inverter" in data
+
+        if "inverters" in data:
+            if single:
+                raise ValidationError(
+                    "inverters replaces datalogger and inverter, give one or the other"
+                )
+            return
+
+        for block in ("datalogger", "inverter"):
+            if block not in data:
+                raise ValidationError(
+                    f"{block} is required, or an inverters list for a fleet",
+                    block,
+                )
+
+    @validates_schema()
+    def every_inverter_publishes_somewhere_of_its_own(self, data, **kwargs):
+        prefixes = [device["topic_prefix"] for device in data.get("inverters", [])]
+        shared = {prefix for prefix in prefixes if prefixes.count(prefix) > 1}
+
+        if shared:
+            raise ValidationError(
+                f"topic_prefix {', '.join(sorted(shared))} is used by more than one "
+                "inverter, whose readings and stored state would overwrite each other"
+            )
+
+    @validates_schema()
+    def every_proxy_listens_somewhere_of_its_own(self, data, **kwargs):
+        # Every inverter's proxy defaults to port 5020, and the second of two that
+        # bind the same one stops the app at startup with Address already in use.
+        # One on 0.0.0.0 takes the port on every address.
+        proxies = [
+            (device["topic_prefix"], device["datalogger"]["proxy"])
+            for device in data.get("inverters", [])
+            if device["datalogger"]["proxy"]["enabled"]
+        ]
+
+        for i, (prefix, proxy) in enumerate(proxies):
+            for other_prefix, other in proxies[i + 1 :]:
+                if proxy["port"] != other["port"]:
+                    continue
+
+                hosts = {proxy["host"], other["host"]}
+
+                if len(hosts) == 1 or hosts & {"0.0.0.0", ""}:
+                    raise ValidationError(
+                        f"The proxies of {prefix} and {other_prefix} both listen on "
+                        f"port {proxy['port']}, give each inverter a port of its own"
+                    )
@@ -0,0 +1,206 @@
+import logging
+from bisect import bisect_left
+from threading import Lock, Thread
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+class Metric:
+    """One metric family, its samples kept by label values.
+
+    Just enough of a Prometheus client to say where each poll's time goes, without
+    another dependency: counters, histograms, and the OpenMetrics text format to
+    expose them in. Updated from the poll threads and read by the HTTP server's,
+    hence the lock.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.samples: dict[tuple[str, ...], object] = {}
+        self.lock = Lock()
+        REGISTRY.append(self)
+
+    def key(self, labels: dict[str, object]) -> tuple[str, ...]:
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def label_text(self, key: tuple[str, ...], **extra: str) -> str:
+        pairs = [*zip(self.labels, key), *extra.items()]
+
+        if not pairs:
+            return ""
+
+        def escape(value):
+            return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+        return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in pairs) + "}"
+
+    def render(self) -> list[str]:
+        lines = [f"# TYPE {self.name} {self.kind}", f"# HELP {self.name} {self.help}"]
+
+        with self.lock:
+            for key, sample in sorted(self.samples.items()):
+                lines += self.render_sample(key, sample)
+
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self.key(labels)
+
+        with self.lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.samples.get(self.key(labels), 0)
+
+    def render_sample(self, key, value) -> list[str]:
+        return [f"{self.name}_total{self.label_text(key)} {value}"]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels) -> None:
+        key = self.key(labels)
+
+        with self.lock:
+            # Per bucket, the observations that fell in it and no lower one, made
+            # cumulative only when rendered. Then the count and the sum.
+            sample = self.samples.setdefault(key, [[0] * len(self.buckets), 0, 0])
+            index = bisect_left(self.buckets, value)
+
+            if index < len(self.buckets):
+                sample[0][index] += 1
+
+            sample[1] += 1
+            sample[2] += value
+
+    def get(self, **labels) -> tuple[int, float]:
+        # How many observations, and their sum.
+        _, count, total = self.samples.get(self.key(labels), (None, 0, 0))
+        return count, total
+
+    def render_sample(self, key, sample) -> list[str]:
+        buckets, count, total = sample
+        lines = []
+        cumulative = 0
+
+        for bound, in_bucket in zip(self.buckets, buckets):
+            cumulative += in_bucket
+            labels = self.label_text(key, le=str(float(bound)))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+
+        return [
+            *lines,
+            f"{self.name}_bucket{self.label_text(key, le='+Inf')} {count}",
+            f"{self.name}_count{self.label_text(key)} {count}",
+            f"{self.name}_sum{self.label_text(key)} {total}",
+        ]
+
+
+REGISTRY: list[Metric] = []
+
+
+def render() -> str:
+    lines = [line for metric in REGISTRY for line in metric.render()]
+    return "\n".join([*lines, "# EOF"]) + "\n"
+
+
+def serve(host: str, port: int):
+    # http.server only for a scrape endpoint that is turned on. The metrics are
+    # kept either way, but serving them is off in most setups, and importing it
+    # was several milliseconds of every start.
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # A scrape every fifteen seconds is not worth a line in the log each.
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logging.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
+
+
+# What the app measures, labelled by inverter so a fleet is one scrape.
+READ_SECONDS = Histogram(
+    "tcpsolis2mqtt_read_seconds",
+    "Time taken by one request to the datalogger, retries included",
+    ("inverter", "function_code"),
+)
+READ_RETRIES = Counter(
+    "tcpsolis2mqtt_read_retries",
+    "Requests to the datalogger that had to be made again",
+    ("inverter",),
+)
+READ_FAILURES = Counter(
+    "tcpsolis2mqtt_read_failures",
+    "Requests to the datalogger that failed every attempt",
+    ("inverter",),
+)
+CONNECTIONS = Counter(
+    "tcpsolis2mqtt_connections_opened",
+    "Connections dialled to the datalogger",
+    ("inverter",),
+)
+POLL_SECONDS = Histogram(
+    "tcpsolis2mqtt_poll_seconds",
+    "Time from the start of a poll to its readings being published",
+    ("inverter",),
+)
+DECODE_SECONDS = Histogram(
+    "tcpsolis2mqtt_decode_seconds",
+    "Time spent decoding and publishing one poll's readings",
+    ("inverter",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+PUBLISHED = Counter(
+    "tcpsolis2mqtt_published",
+    "Messages published to MQTT",
+    ("inverter",),
+)
+REJECTED = Counter(
+    "tcpsolis2mqtt_rejected_readings",
+    "Readings held back by an energy guard",
+    ("inverter", "sensor", "guard"),
+)
+MISSED_POLLS = Counter(
+    "tcpsolis2mqtt_missed_polls",
+    "Polls that were due while the one before them was still running",
+    ("inverter",),
+)
+SLEEP_SECONDS = Counter(
+    "tcpsolis2mqtt_sleep_seconds",
+    "Time spent waiting, between polls or before a retry",
+    ("inverter", "reason"),
+)
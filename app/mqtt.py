@@ -1,8 +1,12 @@
+from datetime import datetime
 from paho.mqtt import client as mqtt_client
-from threading import Event
+from threading import Event, Lock, Thread
 from time import monotonic, sleep
+from uuid import uuid4
 import logging
 
+from outbox import Outbox
+
 ONLINE = "online"
 OFFLINE = "offline"
 
@@ -20,6 +24,7 @@ class Mqtt(mqtt_client.Client):
             self.tls_set()
         if config["use_ssl"] and not config["validate_cert"]:
             self.tls_insecure_set(True)
+        self.topic_prefix = config["topic_prefix"]
         self.availability_topic = f"{config['topic_prefix']}/availability"
 
         # The broker publishes this if the connection drops without a clean
@@ -36,12 +41,85 @@ class Mqtt(mqtt_client.Client):
         # worth relying on.
         self.on_connect = self._handle_connect
         self.on_disconnect = self._handle_disconnect
+
+        # read_retained_many borrows on_message for as long as it waits, so with a fleet
+        # sharing this connection, two inverters restoring at once would each take
+        # the other's message. One read at a time.
+        self.read_lock = Lock()
+
+        # Somewhere to put what is published while the broker is away, if there is a
+        # spool_path to put it in.
+        self.outbox = (
+            Outbox(config["spool_path"], config["spool_max_mb"] * 1024 * 1024)
+            if config.get("spool_path")
+            else None
+        )
+
         self.connect(config["host"], config["port"])
         self.loop_start()
 
     def __del__(self):
         self.disconnect()
 
+    def send(self, topic, payload, retain=False):
+        # What the app publishes through. Straight to the broker while it is there and
+        # nothing is waiting, otherwise behind whatever is, so the order they were
+        # sent in is the order they arrive in.
+        if self.outbox is None:
+            self.publish(topic, payload, retain=retain)
+            return
+
+        if self.is_connected() and not self.outbox.pending():
+            self.publish(topic, payload, retain=retain)
+            return
+
+        self.outbox.append(topic, payload, retain)
+
+        if self.is_connected():
+            self.start_draining()
+
+    def start_draining(self):
+        if self.outbox.start_draining():
+            Thread(target=self.drain_outbox, name="mqtt-outbox", daemon=True).start()
+
+    def drain_outbox(self, timeout=10):
+        # Oldest segment first, at QoS 1, and a segment is only deleted once the
+        # broker has acknowledged all of it. A connection lost half way leaves the
+        # segment for the next connect, which may send part of it twice: a retained
+        # reading published twice is harmless, one never published is not.
+        try:
+            while (segment := self.outbox.take()) is not None:
+                records = self.outbox.read(segment)
+
+                if records:
+                    since = datetime.fromtimestamp(records[0]["at"]).isoformat()
+                    logging.info(
+                        f"MQTT sending {len(records)} messages spooled since {since}"
+                    )
+
+                sent = [
+                    self.publish(
+                        record["topic"],
+                        record["payload"],
+                        qos=1,
+                        retain=record["retain"],
+                    )
+                    for record in records
+                ]
+
+                for info in sent:
+                    info.wait_for_publish(timeout)
+
+                if not all(info.is_published() for info in sent):
+                    logging.info("MQTT lost the connection sending the spool")
+                    self.outbox.stop_draining()
+                    return
+
+                self.outbox.done(segment)
+        except (RuntimeError, ValueError) as e:
+            logging.info(f"MQTT stopped sending the spool: {e}")
+            self.outbox.stop_draining()
+
     def wait_until_connected(self, timeout=5):
         deadline = monotonic() + timeout
 
@@ -52,30 +130,81 @@ class Mqtt(mqtt_client.Client):
 
     def read_retained(self, topic, timeout=5):
         # Retained topics are the only storage this app has, so they double as a place
-        # to keep state across restarts. A broker delivers a retained message as soon as
-        # we subscribe, so if nothing arrives within the timeout there is no stored state.
+        # to keep state across restarts.
+        payload = self.read_retained_many([topic], timeout).get(topic)
+
+        if payload is None:
+            logging.info("MQTT no retained message on %s", topic)
+
+        return payload
+
+    def read_retained_many(self, topics, timeout=5, quiet=0.5):
+        # Everything retained on topics, which may be wildcards, by topic, in one
+        # subscription. A broker delivers the retained messages as soon as we
+        # subscribe, but says nothing when it has none, so reading topic by topic cost
+        # the full timeout for every one that was empty: most of them on a first
+        # start, and every second of startup is a gap in active_power.
+        #
+        # So once the subscription is acknowledged, a message is sent to a topic of
+        # our own that is subscribed to as well. The broker replays the retained
+        # messages while handling the subscribe, before it gets to that one, so its
+        # arrival means there is nothing more to come. Should it never arrive, an
+        # ACL say, quiet seconds without a message after the acknowledgement ends the
+        # wait instead, and timeout bounds the lot.
         if not self.wait_until_connected(timeout):
-            logging.error("MQTT not connected, unable to read %s", topic)
-            return None
+            logging.error("MQTT not connected, unable to read %s", ", ".join(topics))
+            return {}
 
-        payload = None
-        received = Event()
+        end_marker = f"{self.topic_prefix}/_restore/{uuid4().hex}"
+        filters = [*topics, end_marker]
+        stored = {}
+        subscribed = Event()
+        finished = Event()
+        last_heard = monotonic()
 
         def on_message(client, userdata, message):
-            nonlocal payload
-            payload = message.payload.decode()
-            received.set()
+            nonlocal last_heard
 
-        self.on_message = on_message
-        self.subscribe(topic)
+            if message.topic == end_marker:
+                finished.set()
+                return
 
-        if not received.wait(timeout):
-            logging.info("MQTT no retained message on %s", topic)
+            last_heard = monotonic()
 
-        self.unsubscribe(topic)
-        self.on_message = None
+            # An empty payload is a retained message being deleted, which only ever
+            # arrives live, from someone clearing the topic while we listen.
+            if message.payload:
+                stored[message.topic] = message.payload.decode()
+            else:
+                stored.pop(message.topic, None)
 
-        return payload
+        def on_subscribe(client, userdata, mid, reason_codes, properties):
+            nonlocal last_heard
+
+            last_heard = monotonic()
+            subscribed.set()
+            client.publish(end_marker, "end")
+
+        deadline = monotonic() + timeout
+
+        with self.read_lock:
+            self.on_message = on_message
+            self.on_subscribe = on_subscribe
+            self.subscribe([(topic, 0) for topic in filters])
+
+            while not finished.wait(0.05):
+                if monotonic() >= deadline:
+                    logging.info("MQTT timed out reading %s", ", ".join(topics))
+                    break
+
+                if subscribed.is_set() and monotonic() - last_heard >= quiet:
+                    break
+
+            self.unsubscribe(filters)
+            self.on_message = None
+            self.on_subscribe = None
+
+        return stored
 
     def _handle_connect(self, client, userdata, flags, reason_code, properties):
         if reason_code != 0:
@@ -88,6 +217,10 @@ class Mqtt(mqtt_client.Client):
         # published the will, so the topic has to be put back.
         self.publish(self.availability_topic, ONLINE, retain=True)
 
+        # And send whatever was published while we were away.
+        if self.outbox is not None:
+            self.start_draining()
+
     def _handle_disconnect(self, client, userdata, flags, reason_code, properties):
         # Nothing to do but say so. loop_start runs a network thread that reconnects
         # on its own, and the broker publishes the will meanwhile.
@@ -1,5 +1,4 @@
 import json
-from copy import deepcopy
 
 # Generate MQTT discovery message for home-assistant
 # for more info: https://www.home-assistant.io/docs/mqtt/discovery/
@@ -41,8 +40,13 @@ class DiscoverMsgSensor:
         device_manufacturer,
         device_configuration_url,
         version,
+        device_identifier="tcpsolis2mqtt",
     ):
-        self.discover_msg = deepcopy(DiscoverMsgSensor.DISCOVERY_MSG)
+        # Only device is nested, and availability is replaced outright, so copying
+        # those two levels is all deepcopy was doing, at a fraction of the cost.
+        self.discover_msg = DiscoverMsgSensor.DISCOVERY_MSG | {
+            "device": dict(DiscoverMsgSensor.DISCOVERY_MSG["device"])
+        }
         self.discover_msg["name"] = description
         self.discover_msg["state_topic"] = topic_prefix + "/" + name
         self.discover_msg["unique_id"] = topic_prefix + "/" + name
@@ -52,6 +56,9 @@ class DiscoverMsgSensor:
         self.discover_msg["availability"] = [
             {"topic": topic} for topic in availability_topics
         ]
+        # Home Assistant groups entities into a device by this, so every inverter of
+        # a fleet needs its own or all of them collapse into one device.
+        self.discover_msg["device"]["identifiers"] = device_identifier
         self.discover_msg["device"]["name"] = device_name
         self.discover_msg["device"]["model"] = device_model
         self.discover_msg["device"]["manufacturer"] = device_manufacturer
@@ -96,8 +103,13 @@ class DiscoverMsgBinary:
         device_manufacturer,
         device_configuration_url,
         version,
+        device_identifier="tcpsolis2mqtt",
     ):
-        self.discover_msg = deepcopy(DiscoverMsgBinary.DISCOVERY_MSG)
+        # Only device is nested, and availability is replaced outright, so copying
+        # those two levels is all deepcopy was doing, at a fraction of the cost.
+        self.discover_msg = DiscoverMsgBinary.DISCOVERY_MSG | {
+            "device": dict(DiscoverMsgBinary.DISCOVERY_MSG["device"])
+        }
         self.discover_msg["name"] = description
         self.discover_msg["state_topic"] = topic_prefix + "/" + name
         self.discover_msg["unique_id"] = topic_prefix + "/" + name
@@ -108,6 +120,9 @@ class DiscoverMsgBinary:
         self.discover_msg["availability"] = [
             {"topic": topic} for topic in availability_topics
         ]
+        # Home Assistant groups entities into a device by this, so every inverter of
+        # a fleet needs its own or all of them collapse into one device.
+        self.discover_msg["device"]["identifiers"] = device_identifier
         self.discover_msg["device"]["name"] = device_name
         self.discover_msg["device"]["model"] = device_model
         self.discover_msg["device"]["manufacturer"] = device_manufacturer
@@ -116,3 +131,39 @@ class DiscoverMsgBinary:
 
     def __str__(self):
         return json.dumps(self.discover_msg)
+
+
+class DiscoverMsgDevice:
+    """One inverter and every sensor on it, in a single message.
+
+    Home Assistant's device discovery: the device block once, and each entity as a
+    component under it, keyed by its name. Built from the per-sensor messages, so
+    the two formats say the same about every entity.
+    """
+
+    ORIGIN = {
+        "name": "tcpsolis2mqtt",
+        "sw_version": "",
+        "support_url": "https://github.com/ahinko/tcpsolis2mqtt",
+    }
+
+    def __init__(self, components, version, removed=None):
+        # components maps each sensor's name to its platform and per-sensor message,
+        # removed the name of each component to be removed to its platform: Home
+        # Assistant removes an entity whose component is the platform alone.
+        self.discover_msg = {
+            "device": {},
+            "origin": DiscoverMsgDevice.ORIGIN | {"sw_version": str(version)},
+            "components": {},
+        }
+
+        for name, (platform, message) in components.items():
+            component = dict(message.discover_msg)
+            self.discover_msg["device"] = component.pop("device")
+            self.discover_msg["components"][name] = {"platform": platform, **component}
+
+        for name, platform in (removed or {}).items():
+            self.discover_msg["components"][name] = {"platform": platform}
+
+    def __str__(self):
+        return json.dumps(self.discover_msg)
@@ -0,0 +1,153 @@
+import json
+import logging
+import os
+from collections import deque
+from threading import Lock
+from time import time
+
+
+class Outbox:
+    """Messages that could not be published yet, spooled to disk in the order sent.
+
+    While the broker is away every publish lands here instead of in paho's queue,
+    which holds QoS 0 messages nowhere and everything else in memory without limit.
+    The spool is a directory of numbered segment files, one JSON line per message
+    with the time it was sent, so it survives the app restarting too. Writes are
+    synced to disk every sync_every messages and whenever a segment is closed, not
+    every message: a poll publishes dozens at once.
+
+    Bounded by max_bytes. An outage long enough to fill it loses its oldest
+    segments, not the newest readings, and says so.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int,
+        segment_bytes: int = 1024 * 1024,
+        sync_every: int = 50,
+    ):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.sync_every = sync_every
+        self.lock = Lock()
+
+        # Closed segments waiting to be sent, oldest first, and the one being
+        # written. A spool left by a previous run is sent like any other.
+        self.sealed = deque(
+            os.path.join(path, name)
+            for name in sorted(os.listdir(path))
+            if name.endswith(".jsonl")
+        )
+        self.sequence = (
+            int(os.path.basename(self.sealed[-1]).split(".")[0]) + 1
+            if self.sealed
+            else 0
+        )
+        self.current = None
+        self.unsynced = 0
+        self.draining = False
+
+        if self.sealed:
+            logging.info(f"MQTT {len(self.sealed)} spooled segments from before")
+
+    def pending(self) -> bool:
+        with self.lock:
+            return bool(self.sealed) or self.current is not None
+
+    def append(self, topic: str, payload, retain: bool) -> None:
+        record = {"topic": topic, "payload": payload, "retain": retain, "at": time()}
+
+        with self.lock:
+            if self.current is not None and self.current.tell() >= self.segment_bytes:
+                self.seal()
+
+            if self.current is None:
+                name = os.path.join(self.path, f"{self.sequence:012d}.jsonl")
+                self.sequence += 1
+                self.current = open(name, "a")
+
+            self.current.write(json.dumps(record) + "\n")
+            self.unsynced += 1
+
+            if self.unsynced >= self.sync_every:
+                self.sync()
+
+            self.keep_within_bounds()
+
+    def sync(self) -> None:
+        self.current.flush()
+        os.fsync(self.current.fileno())
+        self.unsynced = 0
+
+    def seal(self) -> None:
+        self.sync()
+        self.current.close()
+        self.sealed.append(self.current.name)
+        self.current = None
+
+    def keep_within_bounds(self) -> None:
+        size = sum(os.path.getsize(segment) for segment in self.sealed)
+        size += self.current.tell() if self.current else 0
+
+        while self.sealed and size > self.max_bytes:
+            oldest = self.sealed.popleft()
+            size -= os.path.getsize(oldest)
+            logging.warning(f"MQTT spool full, dropping {oldest}")
+            os.remove(oldest)
+
+    def start_draining(self) -> bool:
+        # True for the one caller that should send what is spooled. Anyone else
+        # finding messages waiting while that is going on leaves them to it.
+        with self.lock:
+            if self.draining or not (self.sealed or self.current):
+                return False
+
+            self.draining = True
+            return True
+
+    def take(self) -> str | None:
+        # The oldest segment, closing the one being written if that is all there is.
+        # None once the spool is empty, and from then on publishing goes straight to
+        # the broker again: deciding that under the same lock as append is what keeps
+        # a message from being spooled after the last segment was taken.
+        with self.lock:
+            if not self.sealed and self.current is not None:
+                self.seal()
+
+            if not self.sealed:
+                self.draining = False
+                return None
+
+            return self.sealed[0]
+
+    def read(self, segment: str) -> list[dict]:
+        records = []
+
+        # Dropped by keep_within_bounds since it was taken, nothing left to send.
+        if not os.path.exists(segment):
+            return records
+
+        with open(segment) as f:
+            for line in f:
+                # A line cut short by the app dying mid-write is the only thing lost.
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    logging.warning(f"MQTT skipping a damaged line in {segment}")
+
+        return records
+
+    def done(self, segment: str) -> None:
+        with self.lock:
+            if self.sealed and self.sealed[0] == segment:
+                self.sealed.popleft()
+
+        if os.path.exists(segment):
+            os.remove(segment)
+
+    def stop_draining(self) -> None:
+        with self.lock:
+            self.draining = False
@@ -0,0 +1,128 @@
+import logging
+import struct
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from threading import Thread
+
+# The function codes the proxy serves, the same two the app reads with.
+READ_FUNCTIONS = (3, 4)
+
+# The most registers one read may ask for, by the Modbus spec.
+MAX_COUNT = 125
+
+# Modbus exception codes the proxy answers with.
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_DATA_ADDRESS = 0x02
+ILLEGAL_DATA_VALUE = 0x03
+GATEWAY_TARGET_FAILED = 0x0B
+
+# Transaction id, protocol id, length of what follows, unit id.
+MBAP = struct.Struct(">HHHB")
+
+# What the header's length may say: the unit id and a PDU of a function code at
+# least, 253 bytes at most.
+MIN_LENGTH = 2
+MAX_LENGTH = 254
+
+
+class ProxyHandler(StreamRequestHandler):
+    """One client connection, answered a request at a time in the order they came.
+
+    Every answer carries the transaction id of the request it answers, whichever way
+    it was found. Requests from different clients reach the datalogger one at a time
+    over the app's single connection, in between the poll's own.
+    """
+
+    def handle(self):
+        while True:
+            header = self.rfile.read(MBAP.size)
+
+            if len(header) < MBAP.size:
+                return
+
+            transaction, protocol, length, unit = MBAP.unpack(header)
+
+            # Checked before reading: a length of 0 would read to the end of the
+            # stream, holding the handler until the client gave up.
+            if protocol != 0 or not MIN_LENGTH <= length <= MAX_LENGTH:
+                return
+
+            pdu = self.rfile.read(length - 1)
+
+            if len(pdu) != length - 1:
+                return
+
+            answer = self.server.answer(pdu)
+            self.wfile.write(MBAP.pack(transaction, 0, len(answer) + 1, unit) + answer)
+
+
+class ModbusProxy(ThreadingTCPServer):
+    """A Modbus TCP server in front of the one connection the datalogger accepts.
+
+    Holding the connection keeps everything else off the stick, and dialling one per
+    poll costs a handshake every time. Other local clients connect here instead, so
+    the app can hold it for all of them. A read of registers the last poll got is
+    answered from that poll while it is at most max_age seconds old, without a round
+    trip; anything else is forwarded to the datalogger. Without forward, the app's
+    polls are the only load on the stick however many clients there are, and a read
+    the last poll did not make is refused.
+
+    Reads only. Writing to the inverter is not something this app does.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self, address: tuple[str, int], app, max_age: float, forward: bool = True
+    ):
+        super().__init__(address, ProxyHandler)
+        self.app = app
+        self.max_age = max_age
+        self.forward = forward
+
+    def answer(self, pdu: bytes) -> bytes:
+        function_code = pdu[0] if pdu else 0
+
+        if function_code not in READ_FUNCTIONS:
+            return exception(function_code, ILLEGAL_FUNCTION)
+
+        # A read, but not the address and count one is made of.
+        if len(pdu) != 5:
+            return exception(function_code, ILLEGAL_DATA_VALUE)
+
+        address, count = struct.unpack(">HH", pdu[1:])
+
+        if not 1 <= count <= MAX_COUNT:
+            return exception(function_code, ILLEGAL_DATA_VALUE)
+
+        values = self.app.cached_read(function_code, address, count, self.max_age)
+
+        if values is None and self.forward:
+            values = self.app.forward_read(function_code, address, count)
+
+        if values is None:
+            # Registers no poll reads are no more there for asking again. Ones the
+            # snapshot has, too old to serve, are the datalogger not answering.
+            held = self.app.snapshot.read(function_code, address, count)
+
+            if not self.forward and held is None:
+                return exception(function_code, ILLEGAL_DATA_ADDRESS)
+
+            return exception(function_code, GATEWAY_TARGET_FAILED)
+
+        return struct.pack(
+            f">BB{len(values)}H", function_code, 2 * len(values), *values
+        )
+
+
+def exception(function_code: int, code: int) -> bytes:
+    return bytes((function_code | 0x80, code))
+
+
+def serve(
+    app, host: str, port: int, max_age: float, forward: bool = True
+) -> ModbusProxy:
+    server = ModbusProxy((host, port), app, max_age, forward)
+    Thread(target=server.serve_forever, name="proxy", daemon=True).start()
+    logging.info(f"Serving modbus on {host}:{port} for other clients")
+    return server
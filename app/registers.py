@@ -0,0 +1,103 @@
+from array import array
+from collections.abc import Iterator, Mapping
+
+
+class Registers(Mapping):
+    """The registers one poll read from one table, kept as the blocks they came in.
+
+    Each answer from the datalogger is a contiguous run of 16 bit words, and that is
+    how it is stored: one array per request, not a dict entry per register. A reading
+    is a slice of the block holding it, so a long or a datetime is taken in one step
+    rather than pulled back out one key at a time, and a poll does not build a dict of
+    seventy-odd entries only for the decoders to take it apart again.
+
+    It is still a mapping from address to value, for everything that only wants to
+    ask about one register or count them.
+    """
+
+    def __init__(self, blocks: list[tuple[int, list[int]]] = ()):
+        self.blocks: list[tuple[int, array]] = []
+
+        for address, values in blocks:
+            self.add(address, values)
+
+    @classmethod
+    def from_dict(cls, registers: dict[int, int]) -> "Registers":
+        # Runs of consecutive addresses become one block each. For tests and for
+        # anything else that has a handful of registers rather than an answer.
+        table = cls()
+        run: list[int] = []
+        start = None
+
+        for address in sorted(registers):
+            if start is not None and address != start + len(run):
+                table.add(start, run)
+                run = []
+
+            if not run:
+                start = address
+
+            run.append(registers[address])
+
+        if run:
+            table.add(start, run)
+
+        return table
+
+    def add(self, address: int, values: list[int]) -> None:
+        self.blocks.append((address, array("H", values)))
+
+    def locate(self, address: int, count: int) -> tuple[int, int] | None:
+        # Which block holds the count registers from address on, and where in it they
+        # start, or None. The read plan never splits a reading between requests, so a
+        # reading that is not inside a single block was not read. The latest block
+        # wins where two overlap, as a later update of a dict would have.
+        for index in range(len(self.blocks) - 1, -1, -1):
+            start, block = self.blocks[index]
+            offset = address - start
+
+            if offset >= 0 and offset + count <= len(block):
+                return index, offset
+
+        return None
+
+    def layout(self) -> tuple[tuple[int, int], ...]:
+        # Where each block starts and how long it is: all that locate depends on.
+        return tuple((start, len(block)) for start, block in self.blocks)
+
+    def span(self, address: int, count: int) -> array:
+        # The count registers from address on, out of the one block that holds them,
+        # found as locate finds it.
+        for start, block in reversed(self.blocks):
+            offset = address - start
+
+            if offset >= 0 and offset + count <= len(block):
+                return block[offset : offset + count]
+
+        raise KeyError(address)
+
+    def covers(self, address: int, count: int) -> bool:
+        # Whether span would find all count registers from address on.
+        return any(
+            0 <= address - start and address - start + count <= len(block)
+            for start, block in self.blocks
+        )
+
+    def __getitem__(self, address: int) -> int:
+        return self.span(address, 1)[0]
+
+    def addresses(self) -> set[int]:
+        return {
+            address
+            for start, block in self.blocks
+            for address in range(start, start + len(block))
+        }
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(sorted(self.addresses()))
+
+    def __len__(self) -> int:
+        return len(self.addresses())
+
+    def __repr__(self) -> str:
+        return f"Registers({[(start, list(block)) for start, block in self.blocks]})"
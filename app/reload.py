@@ -0,0 +1,107 @@
+import os
+from typing import Any, NamedTuple
+
+# The settings a running app cannot take up: a connection, a server or a file that
+# was opened at startup with them. A change to any of these is left for a restart,
+# and the app carries on with what it started with.
+RESTART_REQUIRED = [
+    ("mqtt",),
+    ("state",),
+    ("capture",),
+    ("metrics",),
+    ("api",),
+    ("datalogger", "proxy"),
+]
+
+
+class FileWatcher:
+    """Whether any of a few files has changed since the last look.
+
+    By modification time and size, looked at between polls. inotify would need a
+    dependency for a question asked once a poll at most, and this also sees a file
+    replaced by an editor or by a bind mount swapping in a new one. A file that is
+    missing counts as changed when it comes back.
+    """
+
+    def __init__(self, paths: list[str]):
+        self.paths = paths
+        self.seen = self.stat()
+
+    def stat(self) -> dict[str, tuple[int, int] | None]:
+        seen = {}
+
+        for path in self.paths:
+            try:
+                status = os.stat(path)
+            except OSError:
+                seen[path] = None
+            else:
+                seen[path] = (status.st_mtime_ns, status.st_size)
+
+        return seen
+
+    def changed(self) -> bool:
+        seen = self.stat()
+        changed, self.seen = seen != self.seen, seen
+        return changed
+
+
+class SensorChanges(NamedTuple):
+    """Which active sensors a new sensors.yaml adds, alters or takes away."""
+
+    added: list[dict[str, Any]]
+    changed: list[dict[str, Any]]
+    removed: list[dict[str, Any]]
+
+
+def diff_sensors(old: list[dict[str, Any]], new: list[dict[str, Any]]) -> SensorChanges:
+    # By name, active sensors only: one set to active: false is removed as far as
+    # the poll and Home Assistant are concerned, and one set back is added.
+    before = {sensor["name"]: sensor for sensor in old if sensor["active"]}
+    after = {sensor["name"]: sensor for sensor in new if sensor["active"]}
+
+    return SensorChanges(
+        added=[sensor for name, sensor in after.items() if name not in before],
+        changed=[
+            sensor
+            for name, sensor in after.items()
+            if name in before and before[name] != sensor
+        ],
+        removed=[sensor for name, sensor in before.items() if name not in after],
+    )
+
+
+def setting(config: dict[str, Any], path: tuple[str, ...]) -> Any:
+    for key in path:
+        if not isinstance(config, dict) or key not in config:
+            return None
+
+        config = config[key]
+
+    return config
+
+
+def hold_back(old: dict[str, Any], new: dict[str, Any]) -> list[str]:
+    # The new config with every setting that needs a restart put back to what the
+    # app is running with, and the names of those that had changed.
+    held = []
+
+    for path in RESTART_REQUIRED:
+        before = setting(old, path)
+
+        if before == setting(new, path):
+            continue
+
+        held.append(".".join(path))
+        *parents, key = path
+        section = new
+
+        for parent in parents:
+            section = section.setdefault(parent, {})
+
+        if before is None:
+            section.pop(key, None)
+        else:
+            section[key] = before
+
+    return held
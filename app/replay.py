@@ -0,0 +1,176 @@
+import argparse
+import json
+import logging
+from datetime import datetime
+from time import perf_counter
+from typing import Any, Iterable, NamedTuple
+
+import app as app_module
+from app import App, as_number, device_configs, load_config, load_sensors_config
+from capture import HttpRecord, PollRecord, read_capture
+from state import NoState
+
+
+class Replayed(NamedTuple):
+    """What a replay went through, and how long it took."""
+
+    polls: int
+    failed_polls: int
+    http_refreshes: int
+    published: list[tuple[float, str, Any, bool]]
+    seconds: float
+
+
+class CaptureClock:
+    # The app's clock during a replay: the time each record was captured at.
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def local_date(self) -> str:
+        return datetime.fromtimestamp(self.now).strftime("%Y-%m-%d")
+
+
+def replay_app(config: dict[str, Any], sensors_config: list[dict[str, Any]]) -> App:
+    # An App for one inverter's config that talks to nothing: no broker, no CGIs, no
+    # state store, no capture of its own. What it would have published is recorded.
+    config = config | {
+        "mqtt": config["mqtt"] | {"enabled": False},
+        "datalogger": config["datalogger"]
+        | {"http": {"enabled": False}, "proxy": {"enabled": False}},
+        "capture": {"enabled": False},
+    }
+
+    app = App(config, sensors_config, None, NoState())
+    # Nothing retained: a replay starts from an empty broker.
+    app.retained_discovery = dict
+
+    # Built without a broker, then enabled again, so that discovery and everything
+    # else publishes as it would have -- into whatever replay puts in place of send.
+    app.config["mqtt"]["enabled"] = True
+    return app
+
+
+def replay(app: App, records: Iterable[PollRecord | HttpRecord]) -> Replayed:
+    # Each record through what main and query_modbus would have done with it, in
+    # order and without a pause. The app's clocks are the capture's for the length of
+    # the replay, so the plausibility timestamps, the heartbeat and the daily resets
+    # all see the times the readings were taken at, and the result is the same on
+    # every run.
+    clock = CaptureClock()
+    published = []
+    # The replay's broker: what each retained topic was last set to.
+    retained: dict[str, Any] = {}
+    polls = failed_polls = http_refreshes = 0
+
+    app.local_date = clock.local_date
+
+    def send(topic: str, payload: Any, retain: bool = False) -> None:
+        published.append((clock.now, topic, payload, retain))
+
+        if retain:
+            retained[topic] = payload
+
+    app.send = send
+    app.published_value = lambda sensor: as_number(
+        retained.get(f"{app.config['mqtt']['topic_prefix']}/{sensor['name']}")
+    )
+    app.retained_discovery = lambda: {
+        topic: payload
+        for topic, payload in retained.items()
+        if topic.startswith("homeassistant/")
+    }
+    saved = app_module.monotonic, app_module.time
+    app_module.monotonic = app_module.time = clock
+    started = perf_counter()
+
+    try:
+        app.generate_ha_discovery_topics()
+
+        for record in records:
+            clock.now = record.at
+
+            if isinstance(record, HttpRecord):
+                http_refreshes += 1
+                app.publish_http(record.bodies)
+                continue
+
+            polls += 1
+            app.reset_counters()
+            due = app.sensors_due(record.at)
+
+            # Nothing read: a poll that failed, counted against the retry budget as
+            # read_span counts it.
+            if not record.registers:
+                failed_polls += 1
+
+                if not app.datalogger_offline:
+                    app.datalogger_is_offline(offline=True)
+
+                continue
+
+            app.datalogger_is_offline(offline=False)
+
+            if app.response_is_dead(record.registers):
+                continue
+
+            for decoding in app.publish_readings(record.registers, due):
+                app.last_polled[decoding.name] = record.at
+    finally:
+        app_module.monotonic, app_module.time = saved
+
+    return Replayed(
+        polls, failed_polls, http_refreshes, published, perf_counter() - started
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Feed captured polls back through decoding, the energy guards "
+        "and discovery, at full speed."
+    )
+    parser.add_argument("captures", nargs="+", help="capture files, in order")
+    parser.add_argument(
+        "--inverter",
+        help="topic_prefix of the inverter the capture is of, with a fleet config",
+    )
+    parser.add_argument(
+        "--output", help="write every message that would have been published here"
+    )
+    parser.add_argument("--debug", action="store_true", help="log what the app logs")
+    arguments = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if arguments.debug else logging.WARNING)
+
+    configs = {
+        config["mqtt"]["topic_prefix"]: config
+        for config in device_configs(load_config())
+    }
+    config = (
+        configs[arguments.inverter] if arguments.inverter else [*configs.values()][0]
+    )
+    app = replay_app(config, load_sensors_config())
+
+    records = (
+        record for capture in arguments.captures for record in read_capture(capture)
+    )
+    replayed = replay(app, records)
+
+    if arguments.output:
+        with open(arguments.output, "w") as output:
+            for at, topic, payload, retain in replayed.published:
+                line = {"at": at, "topic": topic, "payload": payload, "retain": retain}
+                output.write(json.dumps(line, default=str) + "\n")
+
+    print(
+        f"{replayed.polls} polls ({replayed.failed_polls} failed) and "
+        f"{replayed.http_refreshes} HTTP refreshes in {replayed.seconds:.2f}s, "
+        f"{replayed.polls / max(replayed.seconds, 1e-9):.0f} polls/s, "
+        f"{len(replayed.published)} messages published"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Any, Callable
+
+import sensors
+
+# The layout of the cache file. A change to the schemas needs no bump: their source
+# is part of the fingerprint, so the next start compiles the map again on its own.
+CACHE_VERSION = 1
+
+
+def fingerprint(source: bytes) -> str:
+    # What a compiled map was compiled from: sensors.yaml as read, and the schemas
+    # that validated it.
+    schemas = Path(sensors.__file__).read_bytes()
+    return hashlib.sha256(schemas + b"\0" + source).hexdigest()
+
+
+def read_cache(path: str, key: str) -> list[dict[str, Any]] | None:
+    # The map compiled from the same file by the same schemas, or None. Anything
+    # wrong with the cache is reason to compile again rather than to stop: it is
+    # only ever a copy of what sensors.yaml says.
+    # Here rather than at the top: with the cache turned off, nothing needs it.
+    import pickle
+
+    try:
+        with open(path, "rb") as file:
+            version, cached_key, sensors_config = pickle.load(file)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.debug(f"Ignoring the sensor map cache at {path}: {e}")
+        return None
+
+    if version != CACHE_VERSION or cached_key != key:
+        return None
+
+    return sensors_config
+
+
+def write_cache(path: str, key: str, sensors_config: list[dict[str, Any]]) -> None:
+    # Written beside and then moved over the old one, so that a start that is killed
+    # halfway leaves either cache whole.
+    import pickle
+
+    partial = f"{path}.tmp"
+
+    try:
+        with open(partial, "wb") as file:
+            pickle.dump((CACHE_VERSION, key, sensors_config), file)
+
+        os.replace(partial, path)
+    except OSError as e:
+        logging.debug(f"Unable to write the sensor map cache at {path}: {e}")
+
+
+def load_sensors(
+    source: bytes,
+    path: str | None,
+    compile: Callable[[bytes], list[dict[str, Any]]],
+) -> list[dict[str, Any]]:
+    """The sensor map for sensors.yaml's contents, compiled once per change to it.
+
+    Parsing the YAML and validating it through the nested schemas is the bulk of
+    what loading the map costs, more so for a vendor map with hundreds of entries,
+    and it gives the same result every start until the file or the schemas change.
+    The result is kept in a pickle at path, keyed by a hash of both, and reused
+    while neither has. The cache is the app's own file, read only by the app; it
+    holds nothing that sensors.yaml does not.
+    """
+
+    if not path:
+        return compile(source)
+
+    key = fingerprint(source)
+    sensors_config = read_cache(path, key)
+
+    if sensors_config is None:
+        sensors_config = compile(source)
+        write_cache(path, key, sensors_config)
+
+    return sensors_config
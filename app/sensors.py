@@ -18,7 +18,9 @@ class Modbus(Schema):
             choices=["register", "long", "bit", "alarm", "composed_datetime"]
         )
     )
-    function_code = fields.Int(required=True)
+    # 3 reads a holding register, 4 an input register. The two are separate tables
+    # on the inverter, and a poll reads each of them in requests of its own.
+    function_code = fields.Int(required=True, validate=validate.OneOf(choices=[3, 4]))
     scale = fields.Float(required=False)
     decimals = fields.Int(required=False)
     # Which period the inverter clears this register on. A statement about the
@@ -29,6 +31,9 @@ class Modbus(Schema):
         required=False, validate=validate.OneOf(choices=["daily", "monthly", "yearly"])
     )
     bit = fields.Nested(Bit(), required=False)
+    # Seconds between reads of this register, for one that changes too rarely to be
+    # worth asking for every poll. Left out, it is read every poll.
+    poll_every = fields.Int(required=False, validate=validate.Range(min=1))
 
     @validates_schema()
     def bit_required_if_read_type_bit(self, data, **kwargs):
@@ -36,6 +41,19 @@ class Modbus(Schema):
             raise ValidationError("Must specify BIT config if read type is bit")
 
 
+class Deadband(Schema):
+    # How far a reading has to move from what was last published to be published
+    # again: absolute in the sensor's own unit, relative as a fraction of the last
+    # value. The wider of the two applies.
+    absolute = fields.Float(required=False, validate=validate.Range(min=0))
+    relative = fields.Float(required=False, validate=validate.Range(min=0))
+
+    @validates_schema()
+    def a_band_is_given(self, data, **kwargs):
+        if not data:
+            raise ValidationError("deadband needs absolute, relative or both")
+
+
 class Http(Schema):
     endpoint = fields.Str(
         required=True, validate=validate.OneOf(choices=["inverter", "moniter"])
@@ -70,6 +88,7 @@ class Sensor(Schema):
     modbus = fields.Nested(Modbus(), required=False)
     http = fields.Nested(Http(), required=False)
     homeassistant = fields.Nested(HomeAssistant(), required=False)
+    deadband = fields.Nested(Deadband(), required=False)
 
     @validates_schema()
     def validate_modbus_http(self, data, **kwargs):
@@ -0,0 +1,103 @@
+import logging
+from threading import Lock
+
+from paho.mqtt.client import topic_matches_sub
+
+
+class RetainedState:
+    """Counter state kept where it is published: in retained topics on the broker.
+
+    What this app has always done. Nothing to write, the publish that goes with every
+    save is the store, and reading it back at startup is a round trip to the broker.
+    """
+
+    def __init__(self, mqtt):
+        self.mqtt = mqtt
+
+    def load(self, topics: list[str]) -> dict[str, str]:
+        return self.mqtt.read_retained_many(topics)
+
+    def save(self, topic: str, value) -> None:
+        pass
+
+
+class NoState(RetainedState):
+    """Nowhere to keep anything: MQTT is off and no local store is configured."""
+
+    def __init__(self):
+        super().__init__(None)
+
+    def load(self, topics: list[str]) -> dict[str, str]:
+        return {}
+
+
+class SqliteState:
+    """Counter state in a SQLite file next to the app, keyed by the topic it mirrors.
+
+    Restoring from retained topics waits on the broker, and with MQTT turned off there
+    was nothing to restore from at all, so a restart replayed the midnight reset and
+    left the lifetime counter without a floor. A local file answers in milliseconds
+    whatever the broker is doing. The retained topics are still published, as a
+    mirror for anyone who reads them, but nothing here waits on them.
+
+    Write-ahead logging, so a save is an append rather than a rewrite of the page,
+    and a reader never waits for a writer. One connection for every inverter in a
+    fleet, serialised by a lock, since they poll on threads of their own.
+    """
+
+    def __init__(self, path: str):
+        # Imported only for the backend that uses it: the default keeps the state
+        # on the broker and has no need of sqlite at every start.
+        import sqlite3
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = Lock()
+
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            # A save that reached the log is kept across a crash of the app, which is
+            # all that is asked of it. Only a power cut can take the last one back.
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS state (topic TEXT PRIMARY KEY, value TEXT)"
+            )
+
+        # What the file holds, so a counter that has not moved since the last poll is
+        # not written again.
+        self.saved = dict(self.connection.execute("SELECT topic, value FROM state"))
+        logging.info(f"State is kept in {path}, {len(self.saved)} entries")
+
+    def load(self, topics: list[str]) -> dict[str, str]:
+        # Topics as the broker would match them, wildcards and all, so the same
+        # filters restore the same state from either store.
+        with self.lock:
+            return {
+                topic: value
+                for topic, value in self.saved.items()
+                if any(topic_matches_sub(wanted, topic) for wanted in topics)
+            }
+
+    def save(self, topic: str, value) -> None:
+        value = str(value)
+
+        with self.lock:
+            if self.saved.get(topic) == value:
+                return
+
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO state (topic, value) VALUES (?, ?)",
+                    (topic, value),
+                )
+
+            self.saved[topic] = value
+
+
+def open_state(config: dict, mqtt) -> RetainedState | NoState | SqliteState:
+    if config["backend"] == "sqlite":
+        return SqliteState(config["path"])
+
+    if mqtt is not None:
+        return RetainedState(mqtt)
+
+    return NoState()
@@ -0,0 +1,136 @@
+"""The poll, from the request to the publish, timed stage by stage.
+
+Each stage once at the size of the shipped sensors.yaml, then the ones whose cost
+grows with the map or the fleet scaled up synthetically, so a stage that stops
+growing in a straight line shows up as one whose time per sensor does not hold.
+
+Named bench_ rather than test_ so the test run leaves it alone. Run it by name:
+
+    python -m pytest benchmarks/bench_pipeline.py
+"""
+
+import logging
+
+import pytest
+from harness import (
+    AnsweringClient,
+    load_sensors,
+    make_app,
+    poll_registers,
+    scaled,
+)
+
+from app import App
+
+SENSOR_COPIES = [1, 4, 16]
+INVERTERS = [1, 4, 16]
+
+
+@pytest.fixture(autouse=True, scope="module")
+def quiet():
+    # Timing the log handler writing to a terminal says nothing about the app.
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+@pytest.fixture(scope="module")
+def sensors_config():
+    return load_sensors()
+
+
+def test_read_span(benchmark):
+    app = make_app()
+    app.client = AnsweringClient()
+
+    registers, expected = benchmark(app.read_span)
+
+    assert sum(len(table) for table in registers.values()) == expected
+
+
+def test_decode_and_publish(benchmark):
+    app = make_app()
+    registers = poll_registers(app)
+
+    read = benchmark(app.publish_readings, registers)
+
+    assert len(read) == len(app.decodings)
+
+
+def test_decode(benchmark):
+    # Decoding alone, a block at a time, without the guards and the publish.
+    app = make_app()
+    registers = poll_registers(app)
+
+    values, missing = benchmark(app.decode_readings, registers, app.decodings)
+
+    assert missing == []
+
+
+def test_guards(benchmark, sensors_config):
+    # The plausibility check on the lifetime counter, the guard every poll runs.
+    app = make_app()
+    total_power = next(s for s in sensors_config if s["name"] == "total_power")
+    app.value_is_publishable(total_power, 39900)
+
+    assert benchmark(app.value_is_publishable, total_power, 39900)
+
+
+def test_discovery(benchmark):
+    # Every sensor announced, as to a broker that holds none of them.
+    app = make_app()
+
+    def announce():
+        app.discovery_digests = {}
+        app.generate_ha_discovery_topics()
+
+    benchmark(announce)
+
+
+def test_discovery_with_nothing_changed(benchmark):
+    # A restart: the broker already holds every sensor's config as it stands.
+    app = make_app()
+    app.generate_ha_discovery_topics()
+
+    benchmark(app.generate_ha_discovery_topics)
+
+
+def test_startup(benchmark):
+    # Parsing sensors.yaml and building the App around it, once per process.
+    benchmark(lambda: make_app(load_sensors()))
+
+
+@pytest.mark.parametrize("copies", SENSOR_COPIES)
+def test_decode_and_publish_by_sensor_count(benchmark, copies):
+    app = make_app(scaled(load_sensors(), copies))
+    registers = poll_registers(app)
+    benchmark.extra_info["sensors"] = len(app.decodings)
+
+    read = benchmark(app.publish_readings, registers)
+
+    assert len(read) == len(app.decodings)
+
+
+@pytest.mark.parametrize("copies", SENSOR_COPIES)
+def test_read_plan_by_sensor_count(benchmark, copies):
+    app = make_app(scaled(load_sensors(), copies))
+    benchmark.extra_info["sensors"] = len(app.decodings)
+
+    def plan():
+        app.read_plans.clear()
+        app.plan_reads()
+
+    benchmark(plan)
+
+
+@pytest.mark.parametrize("inverters", INVERTERS)
+def test_a_fleet_poll_by_inverter_count(benchmark, inverters):
+    # Every inverter's poll once, decode and publish, as the fleet's threads do it
+    # between them. The total is what one process has to keep up with.
+    apps: list[App] = [make_app(prefix=f"inverter{i}") for i in range(inverters)]
+    polls = [(app, poll_registers(app)) for app in apps]
+    benchmark.extra_info["inverters"] = inverters
+
+    def fleet_poll():
+        for app, registers in polls:
+            app.publish_readings(registers)
+
+    benchmark(fleet_poll)
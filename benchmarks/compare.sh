@@ -0,0 +1,27 @@
+#!/bin/sh
+# Time the pipeline and fail if any benchmark's mean is more than THRESHOLD (10%
+# unless set) slower than in a baseline: .benchmarks/baseline.json unless another
+# file is given. Timings only compare between runs on one machine and one Python,
+# so no baseline is committed; record one here, from main, before comparing.
+#
+#   benchmarks/compare.sh --record [baseline.json]
+#   benchmarks/compare.sh [baseline.json]
+set -eu
+
+cd "$(dirname "$0")/.."
+
+if [ "${1:-}" = "--record" ]; then
+    baseline="${2:-.benchmarks/baseline.json}"
+    mkdir -p "$(dirname "$baseline")"
+    storage="$(mktemp -d)"
+    trap 'rm -rf "$storage"' EXIT
+
+    python -m pytest benchmarks/bench_pipeline.py -q \
+        --benchmark-storage="file://$storage" --benchmark-save=baseline
+    mv "$storage"/*/0001_baseline.json "$baseline"
+    exit 0
+fi
+
+exec python -m pytest benchmarks/bench_pipeline.py -q \
+    --benchmark-compare="${1:-.benchmarks/baseline.json}" \
+    --benchmark-compare-fail="mean:${THRESHOLD:-10%}"
@@ -0,0 +1,104 @@
+"""What the benchmarks run on: real Apps that talk to nothing.
+
+Built through App's own constructor from a config the schema loaded, as at startup,
+rather than assembled by hand like the tests' make_app. What is timed is then the
+code that runs in production, with nothing left out.
+"""
+
+import sys
+from pathlib import Path
+
+import yaml
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT / "app"))
+
+from config import AppConfig  # noqa: E402
+from registers import Registers  # noqa: E402
+from replay import replay_app  # noqa: E402
+from sensors import Sensor  # noqa: E402
+
+CONFIG = {
+    "datalogger": {"host": "192.0.2.1", "http": {"enabled": False}},
+    "inverter": {"name": "Solis", "manufacturer": "Ginlong", "max_power_kw": 15},
+    "mqtt": {"enabled": False, "heartbeat": 0},
+}
+
+# Addresses between one copy of the sensor map and the next, when it is scaled up.
+COPY_STRIDE = 100
+
+
+def load_sensors() -> list[dict]:
+    with open(REPO_ROOT / "sensors.yaml") as file:
+        return Sensor(many=True).load(yaml.safe_load(file))
+
+
+def scaled(sensors: list[dict], copies: int) -> list[dict]:
+    # The modbus sensors copies times over, each copy further up the register space
+    # under names of its own. The HTTP ones once; nothing here reads them.
+    result = list(sensors)
+
+    for copy in range(1, copies):
+        for sensor in sensors:
+            if "modbus" not in sensor:
+                continue
+
+            modbus = sensor["modbus"]
+            result.append(
+                sensor
+                | {
+                    "name": f"{sensor['name']}_{copy}",
+                    "modbus": modbus
+                    | {"register": modbus["register"] + copy * COPY_STRIDE},
+                }
+            )
+
+    return result
+
+
+class Answer:
+    def __init__(self, registers):
+        self.registers = registers
+
+    def isError(self):
+        return False
+
+
+class AnsweringClient:
+    """A datalogger that answers every read at once, every register plausible."""
+
+    connected = True
+
+    def __init__(self):
+        self.socket = None
+
+    def read_input_registers(self, device_id, address, count):
+        values = range(address, address + count)
+        return Answer([250 if a % 100 == 41 else a % 7 for a in values])
+
+    read_holding_registers = read_input_registers
+
+    def close(self):
+        pass
+
+
+def poll_registers(app) -> dict[int, Registers]:
+    # What one poll of the app's read plan brings back from AnsweringClient.
+    client = AnsweringClient()
+    registers: dict[int, Registers] = {}
+
+    for function_code, address, count in app.read_plan:
+        answer = client.read_input_registers(1, address, count)
+        registers.setdefault(function_code, Registers()).add(address, answer.registers)
+
+    return registers
+
+
+def make_app(sensors: list[dict] | None = None, prefix: str = "tcpsolis2mqtt"):
+    config = AppConfig().load(
+        CONFIG | {"mqtt": CONFIG["mqtt"] | {"topic_prefix": prefix}}
+    )
+    app = replay_app(config, sensors or load_sensors())
+    app.send = lambda topic, payload, retain=False: None
+    app.plan_reads()
+    return app
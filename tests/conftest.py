@@ -1,15 +1,20 @@
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from threading import RLock
 
 import pytest
 import yaml
 
 REPO_ROOT = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(REPO_ROOT / "app"))
+sys.path.insert(0, str(REPO_ROOT / "tools"))
 
 import app as app_module  # noqa: E402
-from app import App  # noqa: E402
+from app import NO_SNAPSHOT, App  # noqa: E402
+from chunk_size import ChunkSize  # noqa: E402
 from sensors import Sensor  # noqa: E402
+from state import NoState  # noqa: E402
 
 
 @pytest.fixture(scope="session")
@@ -78,6 +83,8 @@ class StubClient:
     ):
         self.answers = list(answers)
         self.reads = []
+        # The subset of reads that asked for holding registers rather than input ones.
+        self.holding_reads = []
         self.closes = 0
         self.connects = 0
         self.connected = False
@@ -104,6 +111,14 @@ class StubClient:
 
     def read_input_registers(self, device_id, address, count):
         self.reads.append((address, count))
+        return self.answer()
+
+    def read_holding_registers(self, device_id, address, count):
+        self.reads.append((address, count))
+        self.holding_reads.append((address, count))
+        return self.answer()
+
+    def answer(self):
         answer = self.answers.pop(0) if self.answers else Response(error=True)
 
         if isinstance(answer, Exception):
@@ -123,7 +138,11 @@ def live_response(address=FIRST, count=SPAN):
 
 
 class Clock:
-    """Stand in for time.monotonic so tests can span days in an instant."""
+    """Stand in for time.monotonic and time.time so tests can span days in an instant.
+
+    Both read the same, which makes the wall clock start at the epoch: on the grid of
+    any poll interval.
+    """
 
     def __init__(self):
         self.now = 0.0
@@ -136,6 +155,7 @@ class Clock:
 def clock(monkeypatch):
     clock = Clock()
     monkeypatch.setattr(app_module, "monotonic", lambda: clock.now)
+    monkeypatch.setattr(app_module, "time", lambda: clock.now)
     monkeypatch.setattr(app_module, "sleep", clock.advance)
     return clock
 
@@ -153,11 +173,19 @@ def make_app(sensors_config):
         max_power_kw=15,
         poll_retries=3,
         register_chunks=80,
+        request_cost=40,
         persistent_connection=False,
+        heartbeat=0,
+        adaptive_chunks=False,
     ):
         app = App.__new__(App)
         app.config = {
-            "mqtt": {"enabled": False, "topic_prefix": "tcpsolis2mqtt"},
+            # Publishing every poll unless a test is about publishing on change.
+            "mqtt": {
+                "enabled": False,
+                "topic_prefix": "tcpsolis2mqtt",
+                "heartbeat": heartbeat,
+            },
             "inverter": {"max_power_kw": max_power_kw},
             "datalogger": {
                 "host": "192.0.2.1",
@@ -167,6 +195,8 @@ def make_app(sensors_config):
                 "poll_interval_if_off": 600,
                 "poll_retries": poll_retries,
                 "register_chunks": register_chunks,
+                "adaptive_chunks": adaptive_chunks,
+                "request_cost": request_cost,
                 "persistent_connection": persistent_connection,
                 "http": {"enabled": False},
             },
@@ -178,26 +208,43 @@ def make_app(sensors_config):
         app.awaiting_new_period = {}
         app.settled_value = {}
         app.pending_value = {}
+        app.last_published = {}
+        app.state = NoState()
 
         app.datalogger_offline = False
         app.datalogger_unreachable = True
         app.availability_published = None
         app.retries_done = 0
-        app.register_span_start = 0
-        app.register_span_end = 0
+        app.read_plan = []
+        app.read_plans = {}
+        app.chunk_size = ChunkSize(register_chunks)
+        app.last_polled = {}
+        app.poll_deadline = float("inf")
+
+        app.http_worker = ThreadPoolExecutor(max_workers=1)
+        app.http_refresh = None
 
         app.client = None
         app.connections_opened = 0
         app.connection_closed_reason = "nothing has been connected yet"
+        app.modbus_lock = RLock()
+        app.snapshot = NO_SNAPSHOT
+        app.capture = None
+        app.watcher = None
+        app.fleet = [app.config["mqtt"]["topic_prefix"]]
+        app.discovery_digests = {}
+        app.departing_components = {}
 
         app.day = day
         app.local_date = lambda: app.day
 
         app.published = []
-        app.publish = lambda topic, payload, retain=False: app.published.append(
+        app.send = lambda topic, payload, retain=False: app.published.append(
             (topic, payload)
         )
 
+        app.compile_sensors()
+
         return app
 
     return _make
@@ -210,7 +257,7 @@ def query(make_app, clock, monkeypatch):
     def _query(*answers, client=None, **config):
         client = client or StubClient(*answers)
         app = make_app(**config)
-        app.get_register_interval()
+        app.plan_reads()
 
         def build(*args, **kwargs):
             app.client_kwargs = kwargs
@@ -228,7 +275,7 @@ def polls(make_app, clock, monkeypatch):
 
     def _polls(*rounds, client=None, **config):
         app = make_app(**config)
-        app.get_register_interval()
+        app.plan_reads()
         client = client or StubClient()
         app.stub_client = client
 
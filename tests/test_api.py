@@ -0,0 +1,134 @@
+"""The registers each poll read, served as JSON to whatever wants them.
+
+Every dashboard or script that wanted inverter data either polled the stick itself,
+adding to the load on a datalogger that struggles with one client, or subscribed to
+the per-sensor topics and got only what sensors.yaml decodes. query_modbus now keeps
+what each poll read as a timestamped snapshot, and the API serves any range of it
+without a request to the datalogger.
+"""
+
+import json
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+from conftest import StubClient, live_response
+
+import api
+import app as app_module
+
+
+@pytest.fixture
+def served(make_app, clock, monkeypatch):
+    servers = []
+
+    def _served(*answers, max_age=60, prefix="tcpsolis2mqtt"):
+        app = make_app()
+        app.config["mqtt"]["topic_prefix"] = prefix
+        monkeypatch.setattr(
+            app_module, "ModbusTcpClient", lambda *a, **k: StubClient(*answers)
+        )
+        app.plan_reads()
+        app.query_modbus()
+
+        server = api.serve([app], "127.0.0.1", 0, max_age)
+        servers.append(server)
+        return app, f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield _served
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def get(url):
+    try:
+        with urlopen(url) as response:
+            return response.status, json.load(response)
+    except HTTPError as e:
+        return e.code, json.load(e)
+
+
+def test_a_range_is_served_from_the_last_poll(served):
+    app, base = served(live_response())
+
+    status, body = get(f"{base}/tcpsolis2mqtt/registers?address=3040&count=2")
+
+    assert status == 200
+    assert body["function_code"] == 4
+    assert body["values"] == [0, 250]
+    assert body["taken_at"] == app.snapshot.taken_at.isoformat()
+
+
+def test_every_block_is_served_without_a_range(served):
+    app, base = served(live_response())
+
+    status, body = get(f"{base}/tcpsolis2mqtt/registers")
+
+    assert status == 200
+    [block] = body["tables"]["4"]
+    assert block["address"] == 3004
+    assert len(block["values"]) == 74
+
+
+def test_a_range_no_poll_read_is_not_found(served):
+    app, base = served(live_response())
+
+    status, body = get(f"{base}/tcpsolis2mqtt/registers?address=3070&count=20")
+
+    assert status == 404
+    assert "not read" in body["error"]
+
+
+def test_a_stale_snapshot_is_refused(served, clock):
+    app, base = served(live_response(), max_age=60)
+    clock.advance(61)
+
+    status, body = get(f"{base}/tcpsolis2mqtt/registers?address=3041")
+
+    assert status == 503
+
+
+def test_nothing_read_yet_is_unavailable(served):
+    app, base = served()
+
+    status, body = get(f"{base}/tcpsolis2mqtt/registers")
+
+    assert status == 503
+    assert body == {"error": "Nothing has been read yet"}
+
+
+def test_an_unknown_inverter_is_not_found(served):
+    app, base = served(live_response())
+
+    status, body = get(f"{base}/elsewhere/registers")
+
+    assert status == 404
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["count=2", "address=x", "address=3004&count=126", "address=3004&function_code=6"],
+)
+def test_a_range_that_makes_no_sense_is_a_bad_request(served, query):
+    app, base = served(live_response())
+
+    status, body = get(f"{base}/tcpsolis2mqtt/registers?{query}")
+
+    assert status == 400
+
+
+def test_a_prefix_with_slashes_is_served(served):
+    app, base = served(live_response(), prefix="home/solis")
+
+    status, body = get(f"{base}/home/solis/registers?address=3040&count=2")
+
+    assert status == 200
+    assert body["inverter"] == "home/solis"
+
+
+def test_the_index_lists_the_inverters(served):
+    app, base = served(live_response())
+
+    assert get(base) == (200, {"inverters": ["tcpsolis2mqtt"]})
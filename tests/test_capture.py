@@ -0,0 +1,193 @@
+"""Capturing what the datalogger answered, and replaying it.
+
+The tests hand-craft StubClient answers, which pins a bug down once it is understood
+and is no help in finding one. A capture is each poll's raw registers and each CGI
+refresh with the time it was made, and replay feeds those back through decoding, the
+guards and discovery at full speed, the same way every time.
+"""
+
+import pytest
+from conftest import FIRST, SPAN, StubClient, live_response
+
+import app as app_module
+from capture import (
+    Capture,
+    HttpRecord,
+    PollRecord,
+    decode_registers,
+    encode_registers,
+    read_capture,
+)
+from registers import Registers
+from replay import replay, replay_app
+
+# 2026-07-28 12:00 UTC, a day well inside the capture file's.
+NOON = 1785240000.0
+
+
+def poll_registers(total_power=39900):
+    values = live_response().registers
+    values[3008 - FIRST : 3010 - FIRST] = [total_power >> 16, total_power & 0xFFFF]
+    return {4: Registers([(FIRST, values)])}
+
+
+def test_registers_survive_the_round_trip():
+    registers = {
+        3: Registers([(3200, [1, 2])]),
+        4: Registers([(3004, [0, 1200, 65535]), (3072, [26, 7])]),
+    }
+
+    decoded = decode_registers(encode_registers(registers))
+
+    assert {code: table.blocks for code, table in decoded.items()} == {
+        code: table.blocks for code, table in registers.items()
+    }
+
+
+def test_records_are_read_back_in_order(tmp_path):
+    capture = Capture(str(tmp_path), "tcpsolis2mqtt")
+    capture.poll(NOON, poll_registers())
+    capture.http(NOON + 1, {"inverter": "a;b", "moniter": "c"})
+    capture.poll(NOON + 30, {})
+    capture.close()
+
+    [file] = tmp_path.iterdir()
+    records = list(read_capture(str(file)))
+
+    assert [type(record) for record in records] == [PollRecord, HttpRecord, PollRecord]
+    assert records[1] == HttpRecord(NOON + 1, {"inverter": "a;b", "moniter": "c"})
+    assert records[2] == PollRecord(NOON + 30, {})
+
+
+def test_a_new_day_is_a_new_file(tmp_path):
+    capture = Capture(str(tmp_path), "tcpsolis2mqtt")
+    capture.poll(NOON, {})
+    capture.poll(NOON + 86400, {})
+    capture.close()
+
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_a_record_cut_short_ends_the_capture(tmp_path):
+    capture = Capture(str(tmp_path), "tcpsolis2mqtt")
+    capture.poll(NOON, poll_registers())
+    capture.poll(NOON + 30, poll_registers())
+    capture.close()
+
+    [file] = tmp_path.iterdir()
+    file.write_bytes(file.read_bytes()[:-10])
+
+    assert len(list(read_capture(str(file)))) == 1
+
+
+def test_a_file_that_is_not_a_capture_is_refused(tmp_path):
+    file = tmp_path / "state.sqlite"
+    file.write_bytes(b"SQLite format 3\x00")
+
+    with pytest.raises(ValueError):
+        list(read_capture(str(file)))
+
+
+def test_a_poll_is_captured_as_read(make_app, clock, monkeypatch, tmp_path):
+    client = StubClient(live_response())
+    monkeypatch.setattr(app_module, "ModbusTcpClient", lambda *a, **k: client)
+    app = make_app()
+    app.capture = Capture(str(tmp_path), "tcpsolis2mqtt")
+    app.plan_reads()
+    app.query_modbus()
+    app.capture.close()
+
+    [file] = tmp_path.iterdir()
+    [record] = read_capture(str(file))
+
+    assert sorted(record.registers[4]) == list(range(FIRST, FIRST + SPAN))
+
+
+def test_a_poll_that_reached_nothing_is_captured_empty(
+    make_app, clock, monkeypatch, tmp_path
+):
+    class Unreachable(StubClient):
+        def connect(self):
+            self.connects += 1
+            return False
+
+    monkeypatch.setattr(app_module, "ModbusTcpClient", lambda *a, **k: Unreachable())
+    app = make_app()
+    app.capture = Capture(str(tmp_path), "tcpsolis2mqtt")
+    app.plan_reads()
+
+    assert app.query_modbus() == {}
+    app.capture.close()
+
+    [file] = tmp_path.iterdir()
+    assert list(read_capture(str(file))) == [PollRecord(clock.now, {})]
+
+
+def test_a_prefix_with_a_slash_is_captured_under_a_name_of_its_own(tmp_path):
+    capture = Capture(str(tmp_path), "home/solis")
+    capture.poll(NOON, {})
+    capture.close()
+
+    [file] = tmp_path.iterdir()
+    assert file.name.startswith("home_solis-")
+
+
+def test_a_capture_that_cannot_be_written_leaves_the_poll_alone(tmp_path, caplog):
+    capture = Capture(str(tmp_path / "captures"), "tcpsolis2mqtt")
+    (tmp_path / "captures").rmdir()
+
+    capture.poll(NOON, poll_registers())
+
+    assert "Unable to write to the capture" in caplog.text
+
+
+@pytest.fixture
+def replayed(make_app, sensors_config):
+    def _replayed(records):
+        config = make_app().config
+        config["inverter"] |= {"name": "Solis", "manufacturer": "Ginlong", "model": ""}
+        app = replay_app(config, sensors_config)
+        return replay(app, records)
+
+    return _replayed
+
+
+def test_a_replay_publishes_what_the_polls_read(replayed):
+    result = replayed([PollRecord(NOON, poll_registers())])
+
+    topics = [topic for _, topic, _, _ in result.published]
+    assert "tcpsolis2mqtt/inverter_temp" in topics
+    assert any(topic.startswith("homeassistant/") for topic in topics)
+    assert result.polls == 1
+
+
+def test_a_replay_runs_the_guards(replayed):
+    # A lifetime total that climbs faster than the inverter can generate, thirty
+    # seconds after the last poll.
+    result = replayed(
+        [
+            PollRecord(NOON, poll_registers(39900)),
+            PollRecord(NOON + 30, poll_registers(45000)),
+        ]
+    )
+
+    totals = [p for _, topic, p, _ in result.published if topic.endswith("total_power")]
+    assert totals == [39900]
+
+
+def test_a_replay_is_the_same_every_time(replayed):
+    records = [
+        PollRecord(NOON + 30 * i, poll_registers(39900 + i)) for i in range(20)
+    ] + [PollRecord(NOON + 600, {})]
+
+    first, second = replayed(records), replayed(records)
+
+    assert first.published == second.published
+    assert first.failed_polls == 1
+
+
+def test_a_replay_gives_the_app_its_clock_back(replayed):
+    before = app_module.monotonic
+    replayed([PollRecord(NOON, poll_registers())])
+
+    assert app_module.monotonic is before
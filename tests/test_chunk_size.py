@@ -0,0 +1,176 @@
+"""How many registers one request asks for.
+
+register_chunks was a number every user guessed: too large and some sticks time out,
+too small and every poll spends round trips it did not need. It is now where the app
+starts, and the size is learned from how the datalogger answers: shrunk on a refusal
+or a timeout in a poll that read something else, grown slowly while reads go through
+on the first attempt and stay quick, and kept across restarts.
+"""
+
+import pytest
+from chunk_size import MODBUS_MAX_REGISTERS, ChunkSize
+from conftest import Response, live_response
+from state import SqliteState
+
+
+def good_polls(size, count, seconds=0.5):
+    for _ in range(count):
+        size.succeeded(seconds)
+        size.end_poll()
+
+
+def test_a_refusal_shrinks_the_size_at_once():
+    size = ChunkSize(80)
+    size.failed(80)
+    size.succeeded(0.5)
+    size.end_poll()
+
+    assert size.size == 60
+
+
+def test_it_never_shrinks_below_the_floor():
+    size = ChunkSize(12)
+
+    for _ in range(5):
+        size.failed(12)
+        size.succeeded(0.5)
+        size.end_poll()
+
+    assert size.size == 10
+
+
+def test_a_refused_request_no_wider_than_the_floor_says_nothing():
+    size = ChunkSize(80)
+    size.failed(6)
+    size.succeeded(0.5)
+    size.end_poll()
+
+    assert size.size == 80
+
+
+def test_growing_has_to_be_earned():
+    size = ChunkSize(40)
+    good_polls(size, 9)
+
+    assert not size.ready_to_grow()
+
+    good_polls(size, 1)
+
+    assert size.ready_to_grow()
+    size.grow()
+    assert size.size == 50
+    assert not size.ready_to_grow()
+
+
+def test_reads_getting_slower_is_not_a_good_poll():
+    size = ChunkSize(40)
+    good_polls(size, 9, seconds=0.5)
+    good_polls(size, 1, seconds=2)
+
+    assert not size.ready_to_grow()
+
+
+def test_a_poll_that_read_nothing_is_no_verdict():
+    size = ChunkSize(40)
+    good_polls(size, 9)
+    size.end_poll()
+    good_polls(size, 1)
+
+    assert size.ready_to_grow()
+
+
+def test_a_night_of_refused_polls_leaves_the_size_alone():
+    size = ChunkSize(80)
+    good_polls(size, 5)
+
+    for _ in range(100):
+        size.failed(74)
+        size.end_poll()
+
+    assert size.size == 80
+    good_polls(size, 5)
+    assert size.ready_to_grow()
+
+
+def test_a_request_answered_only_on_a_retry_still_shrinks():
+    size = ChunkSize(80)
+    size.failed(74)
+    size.succeeded(3.0, first_attempt=False)
+    size.end_poll()
+
+    assert size.size == 60
+
+
+def test_it_never_asks_for_more_than_modbus_allows():
+    size = ChunkSize(120)
+    good_polls(size, 10)
+    size.grow()
+
+    assert size.size == MODBUS_MAX_REGISTERS
+    assert not size.ready_to_grow()
+
+
+def test_a_timeout_replans_the_next_poll(query):
+    app, client, registers = query(
+        OSError("timed out"), live_response(), adaptive_chunks=True
+    )
+
+    assert app.chunk_size.size == 60
+    assert app.read_plans == {}
+
+    app.plan_reads()
+    assert [read.count for read in app.read_plan] == [39, 12]
+
+
+def test_a_sleeping_inverter_leaves_the_size_alone(query):
+    refused = [Response(error=True)] * 12
+    app, client, registers = query(*refused, adaptive_chunks=True)
+
+    assert registers == {}
+    assert app.chunk_size.size == 80
+
+
+def test_the_size_is_left_alone_unless_adaptive(query):
+    app, client, registers = query(Response(error=True), live_response())
+
+    assert app.chunk_size.size == 80
+
+
+def test_it_only_grows_when_that_saves_a_request(make_app):
+    # The shipped map is one request of 74 at 80 already, nothing to gain.
+    app = make_app(adaptive_chunks=True)
+    good_polls(app.chunk_size, 9)
+    app.chunk_size.succeeded(0.5)
+    app.adapt_chunk_size()
+
+    assert app.chunk_size.size == 80
+
+
+def test_it_grows_while_there_are_requests_to_save(make_app):
+    # 40 and 50 both read the shipped map in two requests, 80 in one. The step to
+    # 50 saves nothing by itself, but it is on the way.
+    app = make_app(register_chunks=40, adaptive_chunks=True)
+    good_polls(app.chunk_size, 9)
+    app.chunk_size.succeeded(0.5)
+    app.adapt_chunk_size()
+
+    assert app.chunk_size.size == 50
+
+
+@pytest.fixture
+def state(tmp_path):
+    return SqliteState(str(tmp_path / "state.sqlite"))
+
+
+def test_what_was_learned_survives_a_restart(make_app, clock, state):
+    app = make_app(adaptive_chunks=True)
+    app.state = state
+    app.chunk_size.failed(74)
+    app.chunk_size.succeeded(0.5, first_attempt=False)
+    app.adapt_chunk_size()
+
+    restarted = make_app(adaptive_chunks=True)
+    restarted.state = state
+    restarted.load_state()
+
+    assert restarted.chunk_size.size == 60
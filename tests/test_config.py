@@ -83,3 +83,13 @@ def test_the_shipped_example_names_a_rating():
     example = yaml.safe_load(open("config.example.yaml"))
 
     assert example["inverter"]["max_power_kw"]
+
+
+def test_an_unchanged_reading_is_repeated_every_five_minutes_by_default():
+    assert AppConfig().load(config())["mqtt"]["heartbeat"] == 300
+
+
+def test_a_spool_path_left_empty_is_no_spool():
+    mqtt = {"enabled": True, "host": "192.0.2.2", "spool_path": None}
+
+    assert not AppConfig().load(config() | {"mqtt": mqtt})["mqtt"]["spool_path"]
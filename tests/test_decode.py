@@ -9,6 +9,7 @@ what those functions do with the registers they are handed.
 import pytest
 
 from app import READ_TYPES
+from registers import Registers
 from sensors import Modbus
 
 TIMEZONE_OFFSET = "+02:00"
@@ -41,7 +42,7 @@ def modbus_sensor(**modbus):
         "name": "made_up",
         "description": "Made up",
         "active": True,
-        "modbus": modbus,
+        "modbus": {"function_code": 4} | modbus,
     }
 
 
@@ -138,3 +139,39 @@ def test_the_schema_and_the_read_type_table_agree():
     }
 
     assert choices == set(READ_TYPES)
+
+
+def test_a_long_is_not_scaled(decode, sensor):
+    # total_power carries scale: 1, and scaling would publish every integer as a
+    # float. Only a plain register has ever been scaled.
+    value = decode(sensor("total_power"), {3008: 0, 3009: 5})
+
+    assert value == 5
+    assert isinstance(value, int)
+
+
+def test_every_active_modbus_sensor_is_compiled_once(make_app, sensors_config):
+    app = make_app()
+    active = [s["name"] for s in sensors_config if s["active"] and "modbus" in s]
+
+    assert [decoding.name for decoding in app.decodings] == active
+
+
+def test_a_compiled_sensor_carries_what_a_poll_needs(make_app):
+    app = make_app()
+    temperature = next(d for d in app.decodings if d.name == "inverter_temp")
+
+    assert temperature.topic == "tcpsolis2mqtt/inverter_temp"
+    assert (temperature.register, temperature.width) == (3041, 1)
+    assert (temperature.scale, temperature.decimals) == (0.1, 1)
+
+
+def test_a_poll_publishes_from_the_compiled_plan(make_app):
+    # Nothing in the poll goes back to the sensor dicts to work out what to read.
+    app = make_app()
+    temperature = next(d for d in app.decodings if d.name == "inverter_temp")
+    app.sensors_config = []
+
+    app.publish_readings({4: Registers([(3041, [253])])}, [temperature])
+
+    assert app.published == [("tcpsolis2mqtt/inverter_temp", 25.3)]
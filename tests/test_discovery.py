@@ -75,3 +75,27 @@ def test_messages_do_not_share_state():
 
     assert first["availability"] == [{"topic": APP}, {"topic": DATALOGGER}]
     assert second["availability"] == [{"topic": APP}]
+
+
+def test_a_sensor_belongs_to_the_one_device_by_default():
+    assert sensor_msg([APP])["device"]["identifiers"] == "tcpsolis2mqtt"
+
+
+def test_each_inverter_of_a_fleet_is_its_own_device():
+    message = DiscoverMsgSensor(
+        "roof",
+        "Active Power",
+        "active_power",
+        "W",
+        "power",
+        "measurement",
+        [APP],
+        "Solis",
+        "S5-GR3P15K",
+        "Ginlong Technologies",
+        "http://192.0.2.10",
+        "2.0.0",
+        "roof",
+    )
+
+    assert json.loads(str(message))["device"]["identifiers"] == "roof"
@@ -0,0 +1,192 @@
+"""Which discovery configs a start publishes.
+
+Every start used to publish every active sensor's config, retained, and Home
+Assistant processes each as if the entity were new. They are now read back from the
+broker in one go and only the ones that differ go out, and a config the broker holds
+for a sensor that is no longer active is cleared.
+
+With mqtt.discovery: device the inverter and all of its sensors are one config, and
+an install that announced them one by one is migrated to it.
+"""
+
+import json
+
+import pytest
+
+from app import MIGRATE_DISCOVERY
+from mqtt_discovery import DiscoverMsgSensor
+
+DEVICE = "homeassistant/device/tcpsolis2mqtt/config"
+
+
+@pytest.fixture
+def announcing(make_app):
+    def _announcing(retained=None, discovery="sensor"):
+        app = make_app()
+        app.config["mqtt"] |= {"enabled": True, "discovery": discovery}
+        app.config["inverter"] |= {
+            "name": "Solis",
+            "manufacturer": "Ginlong",
+            "model": "",
+        }
+        app.discovery_digests = None
+        app.retained_discovery = lambda: dict(retained or {})
+        return app
+
+    return _announcing
+
+
+def announced(announcing, retained=None, discovery="sensor"):
+    app = announcing(retained, discovery)
+    app.generate_ha_discovery_topics()
+    return app, dict(app.published)
+
+
+def test_a_first_start_announces_every_sensor(announcing, sensors_config):
+    app, published = announced(announcing)
+
+    assert len(published) == sum(
+        1 for s in sensors_config if s["active"] and "homeassistant" in s
+    )
+
+
+def test_a_restart_with_nothing_changed_publishes_nothing(announcing):
+    _, retained = announced(announcing)
+
+    _, published = announced(announcing, retained)
+
+    assert published == {}
+
+
+def test_only_a_config_that_differs_is_published_again(announcing):
+    _, retained = announced(announcing)
+    topic = "homeassistant/sensor/tcpsolis2mqtt/active_power/config"
+    retained[topic] = retained[topic].replace("3.0.0", "2.9.0")
+
+    _, published = announced(announcing, retained)
+
+    assert list(published) == [topic]
+
+
+def test_a_config_for_a_sensor_no_longer_active_is_cleared(announcing):
+    _, retained = announced(announcing)
+    gone = "homeassistant/sensor/tcpsolis2mqtt/battery_power/config"
+    retained[gone] = "{}"
+
+    _, published = announced(announcing, retained)
+
+    assert published == {gone: ""}
+
+
+def test_announcing_again_publishes_nothing_new(announcing):
+    app, _ = announced(announcing)
+    app.published.clear()
+
+    app.generate_ha_discovery_topics()
+
+    assert app.published == []
+
+
+def test_building_a_message_leaves_the_template_alone():
+    before = repr(DiscoverMsgSensor.DISCOVERY_MSG)
+
+    for name in ("roof", "barn"):
+        DiscoverMsgSensor(
+            name,
+            "Power",
+            "power",
+            "W",
+            "power",
+            "measurement",
+            [f"{name}/a"],
+            name,
+            "",
+            "",
+            "",
+            "3.0.0",
+            name,
+        )
+
+    assert repr(DiscoverMsgSensor.DISCOVERY_MSG) == before
+
+
+def test_a_device_is_announced_in_one_message(announcing, sensors_config):
+    _, sensors = announced(announcing)
+    _, published = announced(announcing, discovery="device")
+
+    assert list(published) == [DEVICE]
+    device = json.loads(published[DEVICE])
+    assert device["device"]["identifiers"] == "tcpsolis2mqtt"
+    assert len(device["components"]) == len(sensors)
+
+    component = device["components"]["active_power"]
+    as_a_sensor = json.loads(
+        sensors["homeassistant/sensor/tcpsolis2mqtt/active_power/config"]
+    )
+    del as_a_sensor["device"]
+    assert component == {"platform": "sensor", **as_a_sensor}
+
+
+def test_a_device_restarted_unchanged_publishes_nothing(announcing):
+    _, retained = announced(announcing, discovery="device")
+
+    _, published = announced(announcing, retained, discovery="device")
+
+    assert published == {}
+
+
+def test_sensors_announced_one_by_one_are_migrated_into_the_device(announcing):
+    _, retained = announced(announcing)
+
+    app, _ = announced(announcing, retained, discovery="device")
+
+    # Every old config marked as migrating, then the device, then the old ones
+    # cleared: in that order, or Home Assistant removes the entities.
+    topics = [topic for topic, _ in app.published]
+    first_cleared = next(i for i, (_, p) in enumerate(app.published) if p == "")
+    assert topics.index(DEVICE) < first_cleared
+    assert all(
+        payload == MIGRATE_DISCOVERY for _, payload in app.published[: len(retained)]
+    )
+    assert {topic for topic, p in app.published if p == ""} == set(retained)
+
+
+def test_a_sensor_removed_on_reload_leaves_the_device(announcing, sensors_config):
+    app, _ = announced(announcing, discovery="device")
+    app.published.clear()
+
+    app.reload(
+        app.config,
+        [
+            sensor | {"active": False} if sensor["name"] == "inverter_temp" else sensor
+            for sensor in sensors_config
+        ],
+    )
+
+    # Announced once as the platform alone, which removes the entity, and then
+    # left out of the device for good.
+    assert [topic for topic, _ in app.published] == [DEVICE]
+    components = json.loads(app.published[0][1])["components"]
+    assert components["inverter_temp"] == {"platform": "sensor"}
+    assert components["active_power"]["platform"] == "sensor"
+    app.published.clear()
+
+    app.generate_ha_discovery_topics()
+
+    assert "inverter_temp" not in json.loads(app.published[0][1])["components"]
+
+
+def test_a_sensor_removed_while_down_leaves_the_device(announcing):
+    _, retained = announced(announcing, discovery="device")
+    device = json.loads(retained[DEVICE])
+    device["components"]["battery_power"] = {"platform": "sensor", "name": "Battery"}
+    retained[DEVICE] = json.dumps(device)
+
+    _, published = announced(announcing, retained, discovery="device")
+
+    components = json.loads(published[DEVICE])["components"]
+    assert components["battery_power"] == {"platform": "sensor"}
+
+    _, published = announced(announcing, published, discovery="device")
+
+    assert "battery_power" not in json.loads(published[DEVICE])["components"]
@@ -0,0 +1,173 @@
+"""Several inverters polled from one process.
+
+App was built around exactly one datalogger and one inverter, so a site with nine
+of them ran nine containers, nine broker connections and nine copies of the parsed
+sensors.yaml. A config can list them instead, and each gets an App of its own that
+shares the sensor map and the MQTT connection with the rest.
+"""
+
+import pytest
+from marshmallow import ValidationError
+
+import app as app_module
+from app import App, device_configs, run_fleet
+from config import AppConfig
+
+MQTT = {"enabled": False, "host": "192.0.2.2", "topic_prefix": "solis"}
+
+
+def device(prefix, host, max_power_kw=15):
+    return {
+        "topic_prefix": prefix,
+        "datalogger": {"host": host},
+        "inverter": {"max_power_kw": max_power_kw},
+    }
+
+
+def fleet(*devices):
+    return AppConfig().load({"inverters": list(devices), "mqtt": MQTT})
+
+
+def test_a_fleet_loads():
+    config = fleet(device("roof", "192.0.2.10"), device("barn", "192.0.2.11", 5))
+
+    assert [d["inverter"]["max_power_kw"] for d in config["inverters"]] == [15, 5]
+
+
+def test_each_inverter_keeps_the_datalogger_defaults():
+    config = fleet(device("roof", "192.0.2.10"))
+
+    assert config["inverters"][0]["datalogger"]["register_chunks"] == 80
+
+
+def test_a_fleet_inverter_still_needs_its_rating():
+    incomplete = device("roof", "192.0.2.10")
+    del incomplete["inverter"]["max_power_kw"]
+
+    with pytest.raises(ValidationError, match="max_power_kw"):
+        fleet(incomplete)
+
+
+def test_a_fleet_and_a_single_inverter_do_not_mix():
+    with pytest.raises(ValidationError, match="one or the other"):
+        AppConfig().load(
+            {
+                "datalogger": {"host": "192.0.2.1"},
+                "inverter": {"max_power_kw": 15},
+                "inverters": [device("roof", "192.0.2.10")],
+                "mqtt": MQTT,
+            }
+        )
+
+
+def test_two_inverters_cannot_share_a_prefix():
+    # Their readings would overwrite each other, and so would the counter state
+    # kept under the prefix.
+    with pytest.raises(ValidationError, match="roof"):
+        fleet(device("roof", "192.0.2.10"), device("roof", "192.0.2.11"))
+
+
+def proxied(prefix, host, port=5020, bind="0.0.0.0"):
+    config = device(prefix, host)
+    config["datalogger"]["proxy"] = {"enabled": True, "host": bind, "port": port}
+    return config
+
+
+def test_two_proxies_cannot_share_a_port():
+    # Each inverter's proxy defaults to 5020, and the second to bind it would stop
+    # the app at startup.
+    with pytest.raises(ValidationError, match="roof and barn"):
+        fleet(proxied("roof", "192.0.2.10"), proxied("barn", "192.0.2.11"))
+
+
+def test_proxies_on_ports_or_addresses_of_their_own_load():
+    fleet(proxied("roof", "192.0.2.10"), proxied("barn", "192.0.2.11", 5021))
+    fleet(
+        proxied("roof", "192.0.2.10", bind="192.0.2.1"),
+        proxied("barn", "192.0.2.11", bind="192.0.2.2"),
+    )
+
+
+def test_a_proxy_on_every_address_shares_its_port_with_none():
+    with pytest.raises(ValidationError, match="port 5020"):
+        fleet(
+            proxied("roof", "192.0.2.10"),
+            proxied("barn", "192.0.2.11", bind="192.0.2.2"),
+        )
+
+
+def test_an_empty_fleet_is_refused():
+    with pytest.raises(ValidationError):
+        AppConfig().load({"inverters": [], "mqtt": MQTT})
+
+
+def test_a_single_inverter_config_is_passed_through_untouched():
+    config = AppConfig().load(
+        {
+            "datalogger": {"host": "192.0.2.1"},
+            "inverter": {"max_power_kw": 15},
+            "mqtt": MQTT,
+        }
+    )
+
+    assert device_configs(config) == [config]
+
+
+def test_each_inverter_publishes_under_its_own_prefix():
+    configs = device_configs(
+        fleet(device("roof", "192.0.2.10"), device("barn", "192.0.2.11"))
+    )
+
+    assert [c["mqtt"]["topic_prefix"] for c in configs] == ["roof", "barn"]
+    assert [c["datalogger"]["host"] for c in configs] == ["192.0.2.10", "192.0.2.11"]
+
+
+def test_every_inverter_depends_on_the_one_will():
+    # One connection has one will, so the app's availability is the same topic for
+    # every inverter while the datalogger's is each inverter's own.
+    configs = device_configs(fleet(device("roof", "192.0.2.10")))
+    app = App(configs[0], [])
+    voltage = {"homeassistant": {"device_class": "voltage"}}
+
+    assert app.availability_topics(voltage) == [
+        "solis/availability",
+        "roof/datalogger_availability",
+    ]
+
+
+def test_every_inverter_is_a_device_of_its_own():
+    configs = device_configs(
+        fleet(device("roof", "192.0.2.10"), device("barn", "192.0.2.11"))
+    )
+
+    assert [App(c, []).device_identifier() for c in configs] == ["roof", "barn"]
+
+
+def test_a_single_inverter_keeps_the_device_it_always_had(make_app):
+    assert make_app().device_identifier() == "tcpsolis2mqtt"
+
+
+def test_the_sensor_map_is_shared(sensors_config):
+    configs = device_configs(
+        fleet(device("roof", "192.0.2.10"), device("barn", "192.0.2.11"))
+    )
+    apps = [App(c, sensors_config) for c in configs]
+
+    assert apps[0].sensors_config is apps[1].sensors_config
+
+
+class Crashing:
+    def __init__(self, prefix):
+        self.config = {"mqtt": {"topic_prefix": prefix}}
+
+    def main(self):
+        raise RuntimeError("boom")
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_an_inverter_whose_loop_dies_takes_the_process_with_it(monkeypatch):
+    # Otherwise the will never fires and that inverter just goes quiet.
+    monkeypatch.setattr(app_module, "sleep", lambda seconds: None)
+
+    with pytest.raises(SystemExit):
+        run_fleet([Crashing("roof")])
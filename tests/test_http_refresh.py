@@ -0,0 +1,99 @@
+"""The CGIs are read on a thread of their own.
+
+query_http used to run inline, in the middle of the register loop, on the poll that
+noticed the datalogger come back. That is the moment it is slowest to answer HTTP,
+so a dawdling inverter.cgi held up the rest of the span and the poll after it for
+up to both HTTP_TIMEOUTs in full, for values that have nothing to do with the
+registers.
+"""
+
+import threading
+
+import pytest
+
+import app as app_module
+from conftest import StubClient, live_response
+from test_http_values import INVERTER_CGI, MONITER_CGI, Response
+
+
+@pytest.fixture
+def slow_http(monkeypatch):
+    """CGIs that do not answer until the test says so."""
+    release = threading.Event()
+    requested = []
+
+    def get(url, **kwargs):
+        requested.append(url)
+        assert release.wait(5), "the test never released the CGIs"
+        body = INVERTER_CGI if url.endswith("inverter.cgi") else MONITER_CGI
+        return Response(body)
+
+    monkeypatch.setattr(app_module.requests, "get", get)
+    return release, requested
+
+
+def enable_http(app):
+    app.config["datalogger"]["http"] = {
+        "enabled": True,
+        "user": "admin",
+        "password": "123456789",
+    }
+
+
+def test_a_slow_cgi_does_not_hold_up_the_poll(make_app, slow_http, clock, monkeypatch):
+    release, requested = slow_http
+    app = make_app()
+    enable_http(app)
+    app.plan_reads()
+
+    client = StubClient(live_response())
+    monkeypatch.setattr(app_module, "ModbusTcpClient", lambda *a, **kw: client)
+
+    registers = app.query_modbus()
+
+    assert len(registers[4]) == 74, "the poll finished while the CGIs were pending"
+    assert not app.http_refresh.done()
+
+    release.set()
+    app.http_refresh.result(5)
+
+    assert "tcpsolis2mqtt/inverter_firmware" in dict(app.published)
+
+
+def test_only_one_refresh_runs_at_a_time(make_app, slow_http):
+    release, requested = slow_http
+    app = make_app()
+    enable_http(app)
+
+    app.refresh_http()
+    first = app.http_refresh
+    app.refresh_http()
+
+    release.set()
+    first.result(5)
+
+    assert app.http_refresh is first
+    assert len(requested) == 2, "inverter.cgi and moniter.cgi, once"
+
+
+def test_nothing_is_started_when_http_is_off(make_app):
+    app = make_app()
+
+    app.refresh_http()
+
+    assert app.http_refresh is None
+
+
+def test_a_refresh_that_raises_is_logged(make_app, monkeypatch, caplog):
+    app = make_app()
+    enable_http(app)
+    monkeypatch.setattr(app, "query_http", lambda: 1 / 0)
+
+    app.refresh_http()
+
+    with pytest.raises(ZeroDivisionError):
+        app.http_refresh.result(5)
+
+    app.http_worker.shutdown(wait=True)
+
+    assert "Reading the HTTP endpoints failed" in caplog.text
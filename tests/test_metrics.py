@@ -0,0 +1,128 @@
+"""Where each poll's time goes, in a form Prometheus can scrape.
+
+The only record used to be the log: a line per connection, a line per retry. Tuning
+register_chunks and poll_interval for a site needs the distribution, not the
+anecdotes, so the poll is measured into an in-process registry and served as
+OpenMetrics text.
+"""
+
+from urllib.request import urlopen
+
+import pytest
+from conftest import Response, live_response
+
+import app as app_module
+import metrics
+
+INVERTER = {"inverter": "tcpsolis2mqtt"}
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry():
+    for metric in metrics.REGISTRY:
+        metric.samples.clear()
+
+
+def test_a_counter_renders_with_its_total_suffix():
+    counter = metrics.Counter("test_things", "Things", ("inverter",))
+    counter.inc(**INVERTER)
+    counter.inc(2, **INVERTER)
+
+    try:
+        assert counter.render() == [
+            "# TYPE test_things counter",
+            "# HELP test_things Things",
+            'test_things_total{inverter="tcpsolis2mqtt"} 3',
+        ]
+    finally:
+        metrics.REGISTRY.remove(counter)
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("test_seconds", "Seconds", buckets=(1, 5))
+
+    for value in (0.5, 1, 3, 10):
+        histogram.observe(value)
+
+    try:
+        assert histogram.render()[2:] == [
+            'test_seconds_bucket{le="1.0"} 2',
+            'test_seconds_bucket{le="5.0"} 3',
+            'test_seconds_bucket{le="+Inf"} 4',
+            "test_seconds_count 4",
+            "test_seconds_sum 14.5",
+        ]
+    finally:
+        metrics.REGISTRY.remove(histogram)
+
+
+def test_label_values_are_escaped():
+    counter = metrics.Counter("test_escaped", "Escaped", ("sensor",))
+    counter.inc(sensor='say "hi"\n')
+
+    try:
+        assert counter.render()[2] == r'test_escaped_total{sensor="say \"hi\"\n"} 1'
+    finally:
+        metrics.REGISTRY.remove(counter)
+
+
+def test_the_exposition_ends_with_eof():
+    assert metrics.render().endswith("# EOF\n")
+
+
+def test_the_endpoint_serves_the_registry():
+    metrics.PUBLISHED.inc(**INVERTER)
+    server = metrics.serve("127.0.0.1", 0)
+
+    try:
+        with urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as r:
+            body = r.read().decode()
+            content_type = r.headers["Content-Type"]
+    finally:
+        server.shutdown()
+
+    assert content_type.startswith("application/openmetrics-text")
+    assert 'tcpsolis2mqtt_published_total{inverter="tcpsolis2mqtt"} 1' in body
+
+
+def test_a_read_is_timed_with_its_retries(query):
+    query(Response(error=True), live_response())
+
+    count, total = metrics.READ_SECONDS.get(**INVERTER, function_code=4)
+
+    assert count == 1
+    assert total == app_module.CHUNK_RETRY_DELAY
+    assert metrics.READ_RETRIES.get(**INVERTER) == 1
+    assert metrics.SLEEP_SECONDS.get(**INVERTER, reason="retry") == (
+        app_module.CHUNK_RETRY_DELAY
+    )
+
+
+def test_a_read_that_never_answers_is_a_failure(query):
+    query()
+
+    assert metrics.READ_FAILURES.get(**INVERTER) == 1
+
+
+def test_each_dial_is_counted(query):
+    query(live_response())
+
+    assert metrics.CONNECTIONS.get(**INVERTER) == 1
+
+
+def test_publishes_are_counted(make_app):
+    app = make_app()
+    app.publish("tcpsolis2mqtt/active_power", 1200, retain=True)
+
+    assert metrics.PUBLISHED.get(**INVERTER) == 1
+
+
+def test_a_reading_held_back_is_counted_by_guard(make_app, clock, sensors_config):
+    total_power = next(s for s in sensors_config if s["name"] == "total_power")
+    app = make_app()
+    app.last_accepted_value["total_power"] = (39901, clock.now)
+
+    assert not app.value_is_publishable(total_power, 39000)
+    assert (
+        metrics.REJECTED.get(**INVERTER, sensor="total_power", guard="plausible") == 1
+    )
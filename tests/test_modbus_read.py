@@ -21,7 +21,7 @@ def test_a_chunk_is_read_once_when_it_answers(query):
     app, client, registers = query(live_response())
 
     assert len(client.reads) == 1
-    assert len(registers) == SPAN
+    assert len(registers[4]) == SPAN
 
 
 def test_a_failing_chunk_is_not_retried_forever(query):
@@ -52,7 +52,7 @@ def test_a_complete_response_after_a_retry_is_kept(query):
     app, client, registers = query(Response(error=True), live_response())
 
     assert len(client.reads) == 2
-    assert len(registers) == SPAN
+    assert len(registers[4]) == SPAN
 
 
 def test_a_chunk_that_never_answers_takes_the_datalogger_offline(query):
@@ -65,8 +65,8 @@ def test_a_chunk_that_never_answers_takes_the_datalogger_offline(query):
 def test_registers_are_numbered_from_the_address_they_were_read_at(query):
     app, client, registers = query(live_response())
 
-    assert min(registers) == 3004
-    assert registers[3041] == 250
+    assert min(registers[4]) == 3004
+    assert registers[4][3041] == 250
 
 
 def test_an_all_zero_response_is_discarded(query):
@@ -149,7 +149,7 @@ def test_a_broken_pipe_is_recovered_from_instead_of_killing_the_process(query):
     # be tested, because the exit would have taken the test runner down too.
     app, client, registers = query(OSError("[Errno 32] Broken pipe"), live_response())
 
-    assert len(registers) == SPAN
+    assert len(registers[4]) == SPAN
     assert len(client.reads) == 2, "retried, and the retry worked"
 
 
@@ -181,7 +181,7 @@ def test_only_the_registers_that_are_wanted_are_asked_for(query):
     app, client, registers = query(live_response())
 
     assert client.reads == [(FIRST, SPAN)]
-    assert max(registers) == LAST
+    assert max(registers[4]) == LAST
 
 
 def test_a_chunk_size_that_lands_on_the_end_still_reads_the_last_register(
@@ -191,14 +191,17 @@ def test_a_chunk_size_that_lands_on_the_end_still_reads_the_last_register(
     # read 3004 to 3076 and stopped: the length check passed, because 73 were asked
     # for and 73 arrived, so the poll was kept and only the sensor needing 3077
     # failed, as a KeyError logged once a poll forever.
+    #
+    # Requests end on a reading now rather than on a multiple of the chunk size, so
+    # the six registers of system_datetime at 3072 move to a request of their own.
     app = make_app(register_chunks=73)
-    app.get_register_interval()
+    app.plan_reads()
 
-    client = StubClient(live_response(count=73), live_response(address=3077, count=1))
+    client = StubClient(live_response(count=68), live_response(address=3072, count=6))
     monkeypatch.setattr(app_module, "ModbusTcpClient", lambda *a, **kw: client)
 
     registers = app.query_modbus()
 
-    assert client.reads == [(FIRST, 73), (LAST, 1)]
-    assert LAST in registers
-    assert len(registers) == SPAN
+    assert client.reads == [(FIRST, 68), (3072, 6)]
+    assert LAST in registers[4]
+    assert len(registers[4]) == SPAN
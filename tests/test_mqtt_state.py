@@ -2,8 +2,9 @@
 where the daily counter state survives a restart.
 
 These tests run against a real broker rather than a mock, because the behaviour
-being relied on is the broker's: a retained message is delivered on subscribe, and
-an empty topic is only detectable by timing out.
+being relied on is the broker's: a retained message is delivered on subscribe, ahead
+of anything published afterwards, and an empty topic is otherwise only detectable by
+timing out.
 """
 
 import asyncio
@@ -19,6 +20,8 @@ pytest.importorskip("amqtt", reason="amqtt provides the in-process test broker")
 from amqtt.broker import Broker  # noqa: E402
 from app import App  # noqa: E402
 from mqtt import Mqtt  # noqa: E402
+from outbox import Outbox  # noqa: E402
+from state import RetainedState  # noqa: E402
 
 PORT = 11883
 PREFIX = "tcpsolis2mqtt"
@@ -133,11 +136,13 @@ def build_app(client, mqtt_config, sensors_config, day):
     app.current_day = None
     app.previous_period_total = {}
     app.awaiting_new_period = {}
-    # An empty topic is only detectable by timing out and load_state reads up to five
-    # of them, so the default five seconds each dominates the whole suite. One second
-    # is generous against a broker in this same process.
+    # An empty topic read on its own is only detectable by timing out, and the
+    # midnight fallback to the published value reads one, so the default five
+    # seconds would dominate the whole suite. One second is generous against a broker
+    # in this same process.
     app.mqtt = client
     app.mqtt.read_retained = partial(Mqtt.read_retained, client, timeout=1)
+    app.state = RetainedState(client)
     app.local_date = lambda: day
     return app
 
@@ -222,6 +227,91 @@ def test_reading_twice_works(connect, store, clean):
     assert client.read_retained(f"{PREFIX}/_state/current_day") == "2026-07-28"
 
 
+def test_many_topics_are_read_in_one_go(connect, store, clean):
+    store(f"{PREFIX}/_state/current_day", "2026-07-28")
+    store(f"{PREFIX}/_state/generation_today/previous_total", "40.0")
+    store(LIFETIME_TOPIC, "39901")
+
+    stored = connect().read_retained_many([f"{PREFIX}/_state/#", LIFETIME_TOPIC])
+
+    assert stored == {
+        f"{PREFIX}/_state/current_day": "2026-07-28",
+        f"{PREFIX}/_state/generation_today/previous_total": "40.0",
+        LIFETIME_TOPIC: "39901",
+    }
+
+
+def test_nothing_retained_does_not_wait_for_the_timeout(connect, clean):
+    # Every empty topic used to cost the whole timeout. The end marker says when the
+    # broker has replayed all it had.
+    client = connect()
+    started = monotonic()
+
+    assert client.read_retained_many([f"{PREFIX}/_state/#"], timeout=5) == {}
+    assert monotonic() - started < 2
+
+
+def test_the_quiet_period_ends_the_wait_without_the_marker(connect, clean):
+    # Where the marker cannot come back, a broker ACL say, silence has to do.
+    client = connect()
+    client.publish = lambda *args, **kwargs: None
+    started = monotonic()
+
+    assert client.read_retained_many([VALUE_TOPIC], timeout=5, quiet=0.3) == {}
+    assert monotonic() - started < 2
+
+
+def test_what_was_spooled_is_sent_on_connect(
+    broker, mqtt_config, connect, clean, tmp_path
+):
+    # The broker was away when these were published, and the app was restarted
+    # before it came back. Connecting sends them, in order, so the last one is what
+    # the topic holds.
+    spool = Outbox(str(tmp_path), max_bytes=1 << 20)
+    spool.append(VALUE_TOPIC, 39.5, True)
+    spool.append(VALUE_TOPIC, 40.0, True)
+    spool.seal()
+
+    client = Mqtt(
+        {**mqtt_config, "client_id": "spool-test", "spool_path": str(tmp_path)}
+        | {"spool_max_mb": 1}
+    )
+
+    try:
+        assert wait_for(lambda: not client.outbox.pending())
+        assert connect().read_retained(VALUE_TOPIC) == "40.0"
+    finally:
+        client.loop_stop()
+        client.disconnect()
+
+
+def test_a_broker_outage_loses_nothing(broker, mqtt_config, connect, clean, tmp_path):
+    client = Mqtt(
+        {**mqtt_config, "client_id": "outage-test"}
+        | {"spool_path": str(tmp_path), "spool_max_mb": 1}
+    )
+
+    try:
+        assert client.wait_until_connected(10), "client did not connect"
+        # Down, and with the network loop stopped so nothing reconnects behind our
+        # back before the publish has been made.
+        client.disconnect()
+        client.loop_stop()
+        assert not client.is_connected()
+
+        client.send(VALUE_TOPIC, 41.5, retain=True)
+        assert client.outbox.pending()
+
+        client.reconnect()
+        client.loop_start()
+
+        assert wait_for(lambda: not client.outbox.pending())
+        assert connect().read_retained(VALUE_TOPIC) == "41.5"
+    finally:
+        client.loop_stop()
+        client.disconnect()
+
+
 def test_publishing_still_works_after_a_read(connect, store, clean):
     client = connect()
     client.read_retained(f"{PREFIX}/_state/current_day", timeout=2)
@@ -246,6 +336,26 @@ def test_state_is_restored_after_a_restart(
     assert app.awaiting_new_period["generation_today"] is True
 
 
+def test_state_is_restored_in_one_subscription(
+    connect, store, clean, mqtt_config, sensors_config
+):
+    store(f"{PREFIX}/_state/current_day", "2026-07-29")
+    store(LIFETIME_TOPIC, "39901")
+    client = connect()
+    subscribes = []
+    subscribe = client.subscribe
+    client.subscribe = lambda topics, *a, **kw: (
+        subscribes.append(topics) or subscribe(topics, *a, **kw)
+    )
+
+    app = build_app(client, mqtt_config, sensors_config, "2026-07-29")
+    app.load_state()
+
+    assert len(subscribes) == 1
+    assert app.current_day == "2026-07-29"
+    assert app.last_accepted_value["total_power"] == (39901.0, None)
+
+
 def test_first_ever_start_assumes_today(connect, clean, mqtt_config, sensors_config):
     app = build_app(connect(), mqtt_config, sensors_config, "2026-07-29")
     app.load_state()
@@ -0,0 +1,124 @@
+"""What is published while the broker is away.
+
+Publishes made during a broker outage went into paho's queue, which keeps QoS 0
+messages nowhere and the rest in memory without bound, so a broker restart lost
+readings and a long outage grew the process. With mqtt.spool_path they are spooled to
+disk instead, in order, and sent once the broker is back.
+"""
+
+import os
+
+import pytest
+from outbox import Outbox
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    def _outbox(**kwargs):
+        return Outbox(str(tmp_path / "spool"), **({"max_bytes": 1 << 20} | kwargs))
+
+    return _outbox
+
+
+def drain(outbox):
+    messages = []
+
+    while (segment := outbox.take()) is not None:
+        messages += [
+            (record["topic"], record["payload"]) for record in outbox.read(segment)
+        ]
+        outbox.done(segment)
+
+    return messages
+
+
+def test_messages_come_out_in_the_order_they_went_in(outbox):
+    spool = outbox(segment_bytes=200)
+
+    for value in range(10):
+        spool.append("tcpsolis2mqtt/active_power", value, True)
+
+    assert drain(spool) == [("tcpsolis2mqtt/active_power", v) for v in range(10)]
+    assert not spool.pending()
+
+
+def test_each_message_keeps_when_it_was_sent(outbox):
+    spool = outbox()
+    spool.append("tcpsolis2mqtt/active_power", 1200, True)
+
+    (record,) = spool.read(spool.take())
+
+    assert record["retain"] is True
+    assert record["at"] > 0
+
+
+def test_a_spool_survives_the_app_restarting(outbox):
+    spool = outbox()
+    spool.append("tcpsolis2mqtt/active_power", 1200, True)
+    spool.seal()
+
+    assert drain(outbox()) == [("tcpsolis2mqtt/active_power", 1200)]
+
+
+def test_a_restarted_spool_numbers_on_from_what_is_left(outbox):
+    spool = outbox()
+    spool.append("a", 1, True)
+    spool.seal()
+
+    restarted = outbox()
+    restarted.append("b", 2, True)
+
+    assert drain(restarted) == [("a", 1), ("b", 2)]
+
+
+def test_a_full_spool_drops_its_oldest_segments(outbox):
+    spool = outbox(max_bytes=1000, segment_bytes=200)
+
+    for value in range(100):
+        spool.append("tcpsolis2mqtt/active_power", value, True)
+
+    messages = drain(spool)
+    size = sum(len(repr(m)) for m in messages)
+
+    assert messages[-1] == ("tcpsolis2mqtt/active_power", 99)
+    assert messages[0] != ("tcpsolis2mqtt/active_power", 0)
+    assert size < 2000
+
+
+def test_a_line_cut_short_is_skipped(outbox, tmp_path):
+    spool = outbox()
+    spool.append("a", 1, True)
+    spool.seal()
+
+    with open(spool.sealed[0], "a") as f:
+        f.write('{"topic": "b", "pay')
+
+    assert drain(outbox()) == [("a", 1)]
+
+
+def test_only_one_caller_drains_at_a_time(outbox):
+    spool = outbox()
+    spool.append("a", 1, True)
+
+    assert spool.start_draining()
+    assert not spool.start_draining()
+
+    drain(spool)
+
+    spool.append("b", 2, True)
+    assert spool.start_draining()
+
+
+def test_an_empty_spool_has_nothing_to_drain(outbox):
+    assert not outbox().start_draining()
+
+
+def test_writes_are_synced_in_batches(outbox, monkeypatch):
+    synced = []
+    monkeypatch.setattr(os, "fsync", synced.append)
+    spool = outbox(sync_every=10)
+
+    for value in range(25):
+        spool.append("a", value, True)
+
+    assert len(synced) == 2
@@ -0,0 +1,96 @@
+"""A poll that read part of what it asked for.
+
+One failed request used to throw the whole poll away: the received count did not
+match the expected one and query_modbus returned nothing, so a flaky chunk near 3070
+cost active_power at 3004 as well. Whatever arrived is now kept, every sensor whose
+registers are all in it is published, and only the rest wait for the next poll.
+"""
+
+import app as app_module
+from conftest import FIRST, Response, StubClient, live_response
+from registers import Registers
+
+FAILED = [Response(error=True)] * app_module.CHUNK_ATTEMPTS
+
+
+def test_the_rest_of_the_span_is_read_after_a_failed_request(query):
+    # At 73 registers a request, 3004 to 3071 and then 3072 to 3077: the clock.
+    clock = Response([26, 10, 18, 12, 30, 0])
+    app, client, registers = query(*FAILED, clock, register_chunks=73)
+
+    assert client.reads[-1] == (3072, 6)
+    assert sorted(registers[4]) == list(range(3072, 3078))
+
+
+def test_what_was_read_is_kept_when_a_later_request_fails(query):
+    app, client, registers = query(
+        live_response(FIRST, 68), *FAILED, register_chunks=73
+    )
+
+    assert sorted(registers[4]) == list(range(FIRST, FIRST + 68))
+
+
+def test_a_datalogger_that_answered_part_of_the_poll_is_online(query):
+    app, client, registers = query(
+        live_response(FIRST, 68), *FAILED, register_chunks=73
+    )
+
+    assert not app.datalogger_offline
+    assert app.datalogger_unreachable is False
+
+
+def test_a_poll_that_read_nothing_is_still_a_failed_poll(query):
+    app, client, registers = query(register_chunks=73)
+
+    assert registers == {}
+    assert app.retries_done == 1
+
+
+class HangsUpForGood(StubClient):
+    # Answers nothing, and after the first request cannot be dialled either.
+    def connect(self):
+        if self.reads:
+            return False
+
+        return super().connect()
+
+
+def test_asking_on_stops_once_the_datalogger_cannot_be_dialled(query):
+    client = HangsUpForGood(*[OSError("Connection reset by peer")] * 3)
+    app, client, registers = query(client=client, register_chunks=73)
+
+    assert all(address == FIRST for address, _ in client.reads)
+    assert registers == {}
+
+
+def test_only_sensors_with_every_register_read_are_published(make_app, clock):
+    app = make_app()
+
+    # active_power is a long at 3004 and 3005, the temperature is at 3041.
+    read = app.publish_readings({4: Registers([(3004, [0, 1200]), (3041, [250])])})
+
+    names = [decoding.name for decoding in read]
+    assert "active_power" in names
+    assert "inverter_temp" in names
+    assert "total_power" not in names
+    assert [topic for topic, _ in app.published] == [
+        f"tcpsolis2mqtt/{name}" for name in names
+    ]
+
+
+def test_a_long_with_only_one_word_read_is_not_published(make_app, clock):
+    app = make_app()
+
+    read = app.publish_readings({4: Registers([(3005, [1200])])})
+
+    assert "active_power" not in [decoding.name for decoding in read]
+    assert app.published == []
+
+
+def test_a_reading_is_covered_only_by_one_block():
+    registers = Registers([(3004, [1, 2]), (3006, [3, 4])])
+
+    assert registers.covers(3004, 2)
+    assert registers.covers(3006, 2)
+    assert not registers.covers(3005, 2)
+    assert not registers.covers(3007, 2)
@@ -0,0 +1,152 @@
+"""Polls on a fixed grid, each with a deadline.
+
+seconds_until_next_poll keeps one poll's length out of the next one's start, but a
+poll that spent its retries still finished late, and the one after it started late
+with it. With align_polls a poll starts on the wall clock's grid of poll_interval, so
+every inverter reads at the same instants; a poll has until the next slot to finish,
+retries included, and the slots it ran past are reported rather than made up for.
+"""
+
+import pytest
+from conftest import Response, StubClient, live_response
+
+import app as app_module
+import metrics
+
+
+@pytest.fixture
+def aligned(make_app, clock):
+    app = make_app()
+    app.config["datalogger"]["align_polls"] = True
+    return app
+
+
+def test_an_aligned_poll_waits_for_the_next_slot(aligned, clock):
+    clock.advance(67)
+
+    assert aligned.seconds_until_next_poll(60) == 23
+
+
+def test_the_slot_does_not_depend_on_when_the_poll_started(aligned, clock):
+    # Started off the grid, say right after the app came up, and still back on it.
+    clock.advance(67)
+
+    assert aligned.seconds_until_next_poll(66) == 23
+
+
+def test_a_poll_that_overran_waits_for_the_next_slot(aligned, clock):
+    clock.advance(47)
+
+    assert aligned.seconds_until_next_poll(0) == 13
+    assert aligned.missed_slots(0) == 1
+
+
+def test_a_poll_that_finished_in_its_slot_missed_nothing(aligned, clock):
+    clock.advance(29)
+
+    assert aligned.missed_slots(0) == 0
+
+
+def test_a_poll_woken_a_hair_early_has_its_whole_slot(aligned, clock):
+    clock.advance(59.999)
+    slot = aligned.poll_slot()
+
+    assert slot == 60
+    assert aligned.seconds_until_next_poll(59.999, slot) == pytest.approx(30.001)
+
+    clock.advance(1.001)
+
+    assert aligned.missed_slots(59.999, slot) == 0
+    assert aligned.seconds_until_next_poll(59.999, slot) == pytest.approx(29)
+
+
+def test_an_offline_datalogger_is_polled_on_the_longer_grid(aligned, clock):
+    aligned.datalogger_offline = True
+    clock.advance(610)
+
+    assert aligned.seconds_until_next_poll(600) == 590
+
+
+def test_an_overrun_counts_the_intervals_it_ran_past(make_app, clock):
+    app = make_app()
+    clock.advance(70)
+
+    assert app.missed_slots(0) == 2
+
+
+class SlowClient(StubClient):
+    # Each request takes a while to answer.
+
+    def __init__(self, clock, seconds, *answers):
+        super().__init__(*answers)
+        self.clock = clock
+        self.seconds = seconds
+
+    def answer(self):
+        self.clock.advance(self.seconds)
+        return super().answer()
+
+
+@pytest.fixture
+def poll(make_app, clock, monkeypatch):
+    def _poll(client, deadline, **config):
+        app = make_app(**config)
+        app.plan_reads()
+        app.poll_deadline = deadline
+        monkeypatch.setattr(app_module, "ModbusTcpClient", lambda *a, **k: client)
+        return app, app.query_modbus()
+
+    return _poll
+
+
+def test_a_retry_is_not_made_past_the_deadline(poll):
+    client = StubClient(Response(error=True), live_response())
+    app, registers = poll(client, deadline=1)
+
+    assert len(client.reads) == 1
+    assert registers == {}
+
+
+def test_a_retry_within_the_deadline_is_still_made(poll):
+    client = StubClient(Response(error=True), live_response())
+    app, registers = poll(client, deadline=30)
+
+    assert len(client.reads) == 2
+    assert registers
+
+
+def test_requests_past_the_deadline_are_left_for_the_next_poll(poll, clock):
+    # 40 registers a request reads the shipped map in two, and the first takes
+    # longer than the poll has.
+    client = SlowClient(clock, 31, live_response(3004, 39), live_response())
+    app, registers = poll(client, deadline=30, register_chunks=40)
+
+    assert len(client.reads) == 1
+    assert sorted(registers[4]) == list(range(3004, 3043))
+
+
+def test_a_missed_slot_is_counted(make_app, clock, monkeypatch):
+    for metric in metrics.REGISTRY:
+        metric.samples.clear()
+
+    app = make_app()
+    app.config["datalogger"]["align_polls"] = True
+
+    def one_poll():
+        clock.advance(65)
+        return {}
+
+    class Stop(Exception):
+        pass
+
+    def stop(seconds):
+        raise Stop
+
+    monkeypatch.setattr(app, "generate_ha_discovery_topics", lambda: None)
+    monkeypatch.setattr(app, "query_modbus", one_poll)
+    monkeypatch.setattr(app_module, "sleep", stop)
+
+    with pytest.raises(Stop):
+        app.main()
+
+    assert metrics.MISSED_POLLS.get(inverter="tcpsolis2mqtt") == 2
@@ -0,0 +1,119 @@
+"""Which sensors a poll reads.
+
+Every active register used to be read every poll_interval, so serial numbers, the
+inverter's clock and last year's total were asked for as often as active_power. A
+sensor with modbus.poll_every is read only once that many seconds have passed since
+a poll last read it, and each poll's requests are planned from the sensors due. One
+whose registers are fetched anyway, inside a request for the others, is decoded.
+"""
+
+import pytest
+from app import Read
+from registers import Registers
+
+
+def sensor(name, register, poll_every=None):
+    modbus = {"register": register, "read_type": "register", "function_code": 4}
+
+    if poll_every is not None:
+        modbus["poll_every"] = poll_every
+
+    return {"name": name, "description": name, "active": True, "modbus": modbus}
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app()
+    app.sensors_config = [
+        sensor("fast", 3004),
+        sensor("slow", 3100, poll_every=300),
+    ]
+    app.compile_sensors()
+    return app
+
+
+def names(decodings):
+    return [decoding.name for decoding in decodings]
+
+
+def test_everything_is_due_on_the_first_poll(app):
+    assert names(app.sensors_due(0)) == ["fast", "slow"]
+
+
+def test_a_sensor_without_poll_every_is_read_every_poll(app):
+    app.last_polled = {"fast": 0, "slow": 0}
+
+    assert names(app.sensors_due(30)) == ["fast"]
+
+
+def test_a_slow_sensor_comes_due_after_its_interval(app):
+    app.last_polled = {"fast": 0, "slow": 0}
+
+    assert "slow" not in names(app.sensors_due(270))
+    assert "slow" in names(app.sensors_due(300))
+
+
+def test_a_poll_that_starts_a_little_early_still_reads_it(app):
+    # Polls start on the poll_interval grid, not on the second, so every tenth poll
+    # at 30 seconds has to count as 300 even when it came a fraction early.
+    app.last_polled = {"fast": 0, "slow": 0}
+
+    assert "slow" in names(app.sensors_due(299.5))
+
+
+def test_only_the_registers_due_are_asked_for(app):
+    app.last_polled = {"fast": 0, "slow": 0}
+
+    app.plan_reads(app.sensors_due(30))
+
+    assert app.read_plan == [Read(4, 3004, 1)]
+
+
+def test_a_poll_with_everything_due_asks_for_both(app):
+    app.plan_reads(app.sensors_due(0))
+
+    assert app.read_plan == [Read(4, 3004, 1), Read(4, 3100, 1)]
+
+
+def test_a_plan_is_worked_out_once_per_set_of_sensors(app):
+    due = app.sensors_due(0)
+    app.plan_reads(due)
+    first = app.read_plan
+
+    app.plan_reads(list(due))
+
+    assert app.read_plan is first
+
+
+def test_only_the_sensors_read_are_published(app):
+    app.publish_readings({4: Registers([(3004, [1])])}, app.decodings[:1])
+
+    assert app.published == [("tcpsolis2mqtt/fast", 1)]
+
+
+def test_a_slow_sensor_inside_a_request_made_anyway_is_decoded(make_app):
+    app = make_app()
+    app.sensors_config = [
+        sensor("fast", 3004),
+        sensor("between", 3005, poll_every=300),
+        sensor("after", 3006),
+        sensor("apart", 3100, poll_every=300),
+    ]
+    app.compile_sensors()
+    app.last_polled = {"fast": 0, "between": 0, "after": 0, "apart": 0}
+
+    due = app.sensors_due(30)
+    app.plan_reads(due)
+
+    assert app.read_plan == [Read(4, 3004, 3)]
+    assert names(app.sensors_covered(due)) == ["fast", "between", "after"]
+
+
+def test_the_shipped_map_decodes_everything_it_reads(make_app):
+    app = make_app()
+    app.last_polled = {decoding.name: 0 for decoding in app.decodings}
+
+    due = app.sensors_due(30)
+    app.plan_reads(due)
+
+    assert names(app.sensors_covered(due)) == names(app.decodings)
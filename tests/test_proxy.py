@@ -0,0 +1,195 @@
+"""Other Modbus clients, served through the app's one connection to the datalogger.
+
+The stick accepts a single connection. Holding it keeps everything else off, and
+hanging up after every poll costs a handshake each time. With the proxy on, the app
+holds the connection and other local clients connect to the app instead: reads the
+last poll already answered come from it, the rest are forwarded in between the poll's
+own requests, and each answer carries its own request's transaction id.
+"""
+
+import socket
+import struct
+
+import pytest
+from conftest import Response, StubClient, live_response
+from pymodbus.client import ModbusTcpClient
+
+import app as app_module
+import proxy
+
+PROXY = {"enabled": True, "host": "127.0.0.1", "port": 0, "max_age": 10}
+
+
+@pytest.fixture
+def served(make_app, clock, monkeypatch):
+    """An App with the proxy on, polled once, and a raw socket to the proxy."""
+    servers, sockets = [], []
+
+    def _served(*answers, poll=(live_response(),)):
+        client = StubClient(*poll, *answers)
+        app = make_app()
+        app.config["datalogger"]["proxy"] = PROXY
+        monkeypatch.setattr(app_module, "ModbusTcpClient", lambda *a, **k: client)
+        app.plan_reads()
+        app.query_modbus()
+
+        server = proxy.serve(app, "127.0.0.1", 0, PROXY["max_age"])
+        servers.append(server)
+        connection = socket.create_connection(server.server_address, timeout=5)
+        sockets.append(connection)
+        return app, client, connection
+
+    yield _served
+
+    for connection in sockets:
+        connection.close()
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def request(transaction, function_code, address, count, unit=1):
+    return struct.pack(
+        ">HHHBBHH", transaction, 0, 6, unit, function_code, address, count
+    )
+
+
+def receive(connection):
+    header = b""
+
+    while len(header) < 7:
+        header += connection.recv(7 - len(header))
+
+    transaction, _, length, _ = struct.unpack(">HHHB", header)
+    pdu = b""
+
+    while len(pdu) < length - 1:
+        pdu += connection.recv(length - 1 - len(pdu))
+
+    return transaction, pdu
+
+
+def registers(pdu):
+    return list(struct.unpack(f">{pdu[1] // 2}H", pdu[2:]))
+
+
+def test_a_read_the_poll_answered_comes_from_the_snapshot(served):
+    app, client, connection = served()
+    connection.sendall(request(1, 4, 3040, 2))
+
+    transaction, pdu = receive(connection)
+
+    assert registers(pdu) == [0, 250]
+    assert client.reads == [(3004, 74)], "nothing asked of the datalogger"
+
+
+def test_a_read_outside_the_snapshot_is_forwarded(served):
+    app, client, connection = served(Response([7, 8]))
+    connection.sendall(request(1, 3, 3200, 2))
+
+    transaction, pdu = receive(connection)
+
+    assert registers(pdu) == [7, 8]
+    assert client.holding_reads == [(3200, 2)]
+
+
+def test_a_stale_snapshot_is_not_served(served, clock):
+    app, client, connection = served(Response([1, 2]))
+    clock.advance(11)
+    connection.sendall(request(1, 4, 3040, 2))
+
+    transaction, pdu = receive(connection)
+
+    assert registers(pdu) == [1, 2]
+    assert client.reads[-1] == (3040, 2)
+
+
+def test_every_answer_carries_its_own_transaction_id(served):
+    app, client, connection = served(Response([7]))
+    connection.sendall(request(41, 4, 3041, 1) + request(42, 3, 3200, 1))
+
+    assert [receive(connection)[0] for _ in range(2)] == [41, 42]
+
+
+def test_a_read_the_datalogger_refused_is_a_gateway_failure(served):
+    app, client, connection = served(Response(error=True))
+    connection.sendall(request(1, 3, 3200, 2))
+
+    assert receive(connection)[1] == bytes((0x83, proxy.GATEWAY_TARGET_FAILED))
+
+
+def test_anything_but_a_read_is_refused(served):
+    app, client, connection = served()
+    # Write single register, 3200 to 1.
+    connection.sendall(struct.pack(">HHHBBHH", 1, 0, 6, 1, 6, 3200, 1))
+
+    assert receive(connection)[1] == bytes((0x86, proxy.ILLEGAL_FUNCTION))
+
+
+def test_a_read_of_the_wrong_length_is_a_bad_value(served):
+    app, client, connection = served()
+    # Read input registers with the count left off.
+    connection.sendall(struct.pack(">HHHBBH", 1, 0, 4, 1, 4, 3004))
+
+    assert receive(connection)[1] == bytes((0x84, proxy.ILLEGAL_DATA_VALUE))
+
+
+def test_a_read_wider_than_modbus_allows_is_refused(served):
+    app, client, connection = served()
+    connection.sendall(request(1, 4, 3004, 126))
+
+    assert receive(connection)[1] == bytes((0x84, proxy.ILLEGAL_DATA_VALUE))
+
+
+@pytest.mark.parametrize("length", [0, 1, 255])
+def test_a_header_with_an_impossible_length_closes_the_connection(served, length):
+    _, _, connection = served()
+
+    connection.sendall(struct.pack(">HHHB", 1, 0, length, 1))
+
+    assert connection.recv(64) == b""
+
+
+def test_the_connection_is_kept_for_the_proxy(served):
+    app, client, connection = served()
+
+    assert app.client is client
+    assert client.closes == 0
+
+
+def test_a_pymodbus_client_reads_through_it(served):
+    app, client, connection = served()
+    host, port = connection.getpeername()
+    downstream = ModbusTcpClient(host, port=port, timeout=5, retries=0)
+
+    try:
+        assert downstream.connect()
+        result = downstream.read_input_registers(3040, count=2, device_id=1)
+    finally:
+        downstream.close()
+
+    assert result.registers == [0, 250]
+
+
+def test_without_forwarding_the_datalogger_is_never_asked(make_app, clock, monkeypatch):
+    client = StubClient(live_response(), Response([7, 8]))
+    app = make_app()
+    app.config["datalogger"]["proxy"] = PROXY | {"forward": False}
+    monkeypatch.setattr(app_module, "ModbusTcpClient", lambda *a, **k: client)
+    app.plan_reads()
+    app.query_modbus()
+    server = proxy.serve(app, "127.0.0.1", 0, 10, forward=False)
+
+    try:
+        with socket.create_connection(server.server_address, timeout=5) as connection:
+            connection.sendall(request(1, 3, 3200, 2) + request(2, 4, 3040, 2))
+            refused, served = receive(connection)[1], receive(connection)[1]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert refused == bytes((0x83, proxy.ILLEGAL_DATA_ADDRESS))
+    assert registers(served) == [0, 250]
+    assert client.reads == [(3004, 74)]
+    assert app.client is None, "nothing to keep the connection for"
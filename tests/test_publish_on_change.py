@@ -0,0 +1,154 @@
+"""When a reading is published.
+
+Every sensor used to be published, retained, on every poll, whether it had moved or
+not: some seventy writes a minute per inverter for the broker to persist and fan
+out, nearly all of them the value the topic already held. A reading now goes out
+when it changes, by more than its deadband if it has one, or when the topic has been
+quiet for mqtt.heartbeat seconds.
+"""
+
+import pytest
+from registers import Registers
+
+TOPIC = "tcpsolis2mqtt/power"
+
+
+def sensor(deadband=None):
+    sensor = {
+        "name": "power",
+        "description": "power",
+        "active": True,
+        "modbus": {"register": 3004, "read_type": "register", "function_code": 4},
+    }
+
+    if deadband is not None:
+        sensor["deadband"] = deadband
+
+    return sensor
+
+
+@pytest.fixture
+def app(make_app, clock):
+    def _app(heartbeat=300, deadband=None):
+        app = make_app(heartbeat=heartbeat)
+        app.sensors_config = [sensor(deadband)]
+        app.compile_sensors()
+        return app
+
+    return _app
+
+
+def poll(app, value):
+    app.published.clear()
+    app.publish_readings({4: Registers([(3004, [value])])})
+    return app.published
+
+
+def test_the_first_reading_is_published(app):
+    assert poll(app(), 100) == [(TOPIC, 100)]
+
+
+def test_the_same_reading_again_is_not(app):
+    app = app()
+    poll(app, 100)
+
+    assert poll(app, 100) == []
+
+
+def test_a_changed_reading_is(app):
+    app = app()
+    poll(app, 100)
+
+    assert poll(app, 101) == [(TOPIC, 101)]
+
+
+def test_an_unchanged_reading_is_repeated_after_the_heartbeat(app, clock):
+    app = app(heartbeat=300)
+    poll(app, 100)
+
+    clock.now += 299
+    assert poll(app, 100) == []
+
+    clock.now += 1
+    assert poll(app, 100) == [(TOPIC, 100)]
+
+
+def test_the_heartbeat_counts_from_the_last_publish(app, clock):
+    app = app(heartbeat=300)
+    poll(app, 100)
+    clock.now += 200
+    poll(app, 101)
+
+    clock.now += 200
+    assert poll(app, 101) == []
+
+
+def test_a_heartbeat_of_zero_publishes_every_poll(app):
+    app = app(heartbeat=0)
+    poll(app, 100)
+
+    assert poll(app, 100) == [(TOPIC, 100)]
+
+
+def test_a_move_inside_the_absolute_deadband_is_not_published(app):
+    app = app(deadband={"absolute": 5})
+    poll(app, 100)
+
+    assert poll(app, 105) == []
+    assert poll(app, 106) == [(TOPIC, 106)]
+
+
+def test_the_deadband_is_measured_from_what_was_published(app):
+    # Not from the previous reading, or a slow drift of four a poll would never be
+    # published at all.
+    app = app(deadband={"absolute": 5})
+    poll(app, 100)
+    poll(app, 104)
+
+    assert poll(app, 108) == [(TOPIC, 108)]
+
+
+def test_a_relative_deadband_scales_with_the_reading(app):
+    app = app(deadband={"relative": 0.02})
+    poll(app, 1000)
+
+    assert poll(app, 1020) == []
+    assert poll(app, 1021) == [(TOPIC, 1021)]
+
+
+def test_the_wider_of_the_two_bands_applies(app):
+    app = app(deadband={"absolute": 5, "relative": 0.02})
+    poll(app, 100)
+
+    # Two percent of 100 is 2, the absolute band of 5 is wider.
+    assert poll(app, 104) == []
+    assert poll(app, 106) == [(TOPIC, 106)]
+
+
+def test_a_reading_in_the_deadband_still_goes_out_on_the_heartbeat(app, clock):
+    app = app(deadband={"absolute": 5})
+    poll(app, 100)
+    clock.now += 300
+
+    assert poll(app, 103) == [(TOPIC, 103)]
+
+
+def test_a_reading_is_compared_with_what_anything_else_published(app):
+    # The datalogger went away and power was zeroed. When it comes back with the
+    # reading it had before, that has to go out again.
+    app = app()
+    poll(app, 100)
+    app.publish(TOPIC, 0, retain=True)
+
+    assert poll(app, 100) == [(TOPIC, 100)]
+
+
+def test_a_bit_map_that_changed_is_published_regardless_of_the_deadband(
+    make_app, clock
+):
+    app = make_app(heartbeat=300)
+    app.last_published[TOPIC] = ("Normal", 0)
+    decoding = app.decodings[0]._replace(topic=TOPIC, absolute_deadband=1000)
+
+    assert app.value_changed(decoding, "Grid overvoltage")
+    assert not app.value_changed(decoding, "Normal")
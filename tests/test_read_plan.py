@@ -0,0 +1,154 @@
+"""Which requests a poll makes.
+
+The span used to run from the lowest active register to the highest and was read in
+fixed chunks of register_chunks, so a map with registers at 3004 and 3300 asked for
+nearly three hundred that nothing reads, every poll. Every request saved is most of a
+second the datalogger is not busy with us.
+"""
+
+import app as app_module
+from app import Read, plan_requests
+from conftest import Response, StubClient, live_response
+from registers import Registers
+
+INPUT, HOLDING = 4, 3
+
+
+def test_neighbouring_readings_share_a_request():
+    assert plan_requests([(INPUT, 3004, 3005), (INPUT, 3006, 3007)], 80, 40) == [
+        Read(INPUT, 3004, 4)
+    ]
+
+
+def test_a_hole_cheaper_than_a_request_is_read_through():
+    assert plan_requests([(INPUT, 3004, 3005), (INPUT, 3020, 3020)], 80, 40) == [
+        Read(INPUT, 3004, 17)
+    ]
+
+
+def test_a_hole_dearer_than_a_request_is_skipped():
+    # The case in the request: two registers, three hundred apart.
+    assert plan_requests([(INPUT, 3004, 3005), (INPUT, 3300, 3300)], 80, 40) == [
+        Read(INPUT, 3004, 2),
+        Read(INPUT, 3300, 1),
+    ]
+
+
+def test_the_price_of_a_request_is_configurable():
+    readings = [(INPUT, 3004, 3004), (INPUT, 3010, 3010)]
+
+    assert plan_requests(readings, 80, 5) == [
+        Read(INPUT, 3004, 1),
+        Read(INPUT, 3010, 1),
+    ]
+    assert plan_requests(readings, 80, 6) == [Read(INPUT, 3004, 7)]
+
+
+def test_a_request_never_grows_past_the_chunk_size():
+    readings = [(INPUT, address, address) for address in range(3000, 3010)]
+
+    assert plan_requests(readings, 4, 40) == [
+        Read(INPUT, 3000, 4),
+        Read(INPUT, 3004, 4),
+        Read(INPUT, 3008, 2),
+    ]
+
+
+def test_a_reading_is_never_split_between_requests():
+    # A long that arrived in halves from two answers could pair a fresh high word
+    # with a low word from a request that failed.
+    plan = plan_requests([(INPUT, 3000, 3002), (INPUT, 3003, 3008)], 5, 40)
+
+    assert plan == [Read(INPUT, 3000, 3), Read(INPUT, 3003, 6)]
+
+
+def test_readings_need_not_arrive_in_order():
+    assert plan_requests([(INPUT, 3300, 3300), (INPUT, 3004, 3005)], 80, 40) == [
+        Read(INPUT, 3004, 2),
+        Read(INPUT, 3300, 1),
+    ]
+
+
+def test_a_reading_inside_another_adds_nothing():
+    # alarm spans 3066 to 3069, and each fault code is one of those registers.
+    assert plan_requests([(INPUT, 3066, 3069), (INPUT, 3067, 3067)], 80, 40) == [
+        Read(INPUT, 3066, 4)
+    ]
+
+
+def test_nothing_active_is_no_requests():
+    assert plan_requests([], 80, 40) == []
+
+
+def test_holding_and_input_registers_never_share_a_request():
+    # Same addresses, different tables: one request cannot ask for both.
+    plan = plan_requests([(INPUT, 3004, 3005), (HOLDING, 3006, 3006)], 80, 40)
+
+    assert plan == [Read(HOLDING, 3006, 1), Read(INPUT, 3004, 2)]
+
+
+def test_each_function_code_is_batched_on_its_own():
+    readings = [
+        (INPUT, 3004, 3005),
+        (HOLDING, 3000, 3000),
+        (INPUT, 3010, 3010),
+        (HOLDING, 3002, 3003),
+    ]
+
+    assert plan_requests(readings, 80, 40) == [
+        Read(HOLDING, 3000, 4),
+        Read(INPUT, 3004, 7),
+    ]
+
+
+def test_the_shipped_map_is_one_request(make_app):
+    # 3043 to 3065 is a hole of 23, cheaper than another round trip.
+    app = make_app()
+    app.plan_reads()
+
+    assert app.read_plan == [Read(INPUT, 3004, 74)]
+
+
+def holding_sensor(name, register):
+    return {
+        "name": name,
+        "description": name,
+        "active": True,
+        "modbus": {"register": register, "read_type": "register", "function_code": 3},
+    }
+
+
+def test_holding_registers_are_read_in_the_same_poll(
+    make_app, sensors_config, clock, monkeypatch
+):
+    # Over the same connection, so nothing else has to be run against a datalogger
+    # that takes one connection at a time.
+    app = make_app()
+    app.sensors_config = [*sensors_config, holding_sensor("held", 3004)]
+    app.compile_sensors()
+    app.plan_reads()
+
+    client = StubClient(Response([7]), live_response())
+    monkeypatch.setattr(app_module, "ModbusTcpClient", lambda *a, **kw: client)
+
+    registers = app.query_modbus()
+
+    assert client.holding_reads == [(3004, 1)]
+    assert client.connects == 1
+    assert registers[HOLDING] == {3004: 7}
+    assert len(registers[INPUT]) == 74
+
+
+def test_a_holding_register_is_decoded_from_its_own_table(
+    make_app, sensors_config, clock
+):
+    app = make_app()
+    held = holding_sensor("held", 3004)
+    app.sensors_config = [held]
+    app.compile_sensors()
+
+    app.publish_readings(
+        {HOLDING: Registers([(3004, [7])]), INPUT: Registers([(3004, [99])])}
+    )
+
+    assert app.published == [("tcpsolis2mqtt/held", 7)]
@@ -0,0 +1,164 @@
+"""The register buffer a poll decodes from.
+
+Each answer is kept as the block of words it arrived in, and a reading is a slice of
+that block. It has to answer the same as the dict of address to value it replaced,
+including for a reading that was never read. A poll decodes a block at a time, and
+has to give what decoding each sensor on its own gives.
+"""
+
+import copy
+from array import array
+
+import pytest
+from conftest import Response, StubClient, live_response
+from registers import Registers
+
+import app as app_module
+
+
+def test_a_reading_is_a_slice_of_its_block():
+    registers = Registers([(3004, [1, 2, 3, 4])])
+
+    assert registers.span(3005, 2) == array("H", [2, 3])
+
+
+def test_a_reading_past_the_end_of_a_block_was_not_read():
+    registers = Registers([(3004, [1, 2])])
+
+    with pytest.raises(KeyError):
+        registers.span(3005, 2)
+
+
+def test_a_reading_across_two_blocks_was_not_read():
+    # The read plan never splits a reading, so two halves from two answers cannot
+    # be one reading: one of the answers could be from a request that failed.
+    registers = Registers([(3004, [1, 2]), (3006, [3, 4])])
+
+    with pytest.raises(KeyError):
+        registers.span(3005, 2)
+
+
+def test_it_answers_as_the_dict_it_replaced():
+    registers = Registers([(3004, [1, 2]), (3010, [3])])
+
+    assert registers == {3004: 1, 3005: 2, 3010: 3}
+    assert len(registers) == 3
+    assert 3006 not in registers
+
+
+def test_the_later_of_two_overlapping_blocks_wins():
+    registers = Registers([(3004, [1, 2]), (3005, [9])])
+
+    assert registers[3005] == 9
+    assert len(registers) == 2
+
+
+def test_a_reading_is_located_in_the_latest_block_that_holds_it():
+    registers = Registers([(3004, [1, 2]), (3005, [9])])
+
+    assert registers.locate(3005, 1) == (1, 0)
+    assert registers.locate(3004, 2) == (0, 0)
+    assert registers.locate(3004, 3) is None
+
+
+def test_a_dict_becomes_one_block_per_run():
+    registers = Registers.from_dict({3010: 3, 3004: 1, 3005: 2})
+
+    assert [(start, list(block)) for start, block in registers.blocks] == [
+        (3004, [1, 2]),
+        (3010, [3]),
+    ]
+
+
+def test_a_poll_keeps_each_answer_as_one_block(make_app, clock, monkeypatch):
+    app = make_app(register_chunks=73)
+    app.plan_reads()
+    client = StubClient(live_response(3004, 68), live_response(3072, 6))
+    monkeypatch.setattr(app_module, "ModbusTcpClient", lambda *a, **kw: client)
+
+    registers = app.query_modbus()
+
+    assert [(start, len(block)) for start, block in registers[4].blocks] == [
+        (3004, 68),
+        (3072, 6),
+    ]
+
+
+def test_a_long_is_signed_high_word_first(make_app):
+    app = make_app()
+
+    assert app.decode_long({}, Registers([(0, [1, 4464])]).span(0, 2)) == 70000
+    assert app.decode_long({}, [0xFFFF, 0xFFFF]) == -1
+    assert app.decode_long({}, [0x8000, 0]) == -(2**31)
+    assert app.decode_long({}, [0x7FFF, 0xFFFF]) == 2**31 - 1
+
+
+def test_an_empty_answer_is_still_a_block(make_app):
+    registers = Registers([(3004, Response([]).registers)])
+
+    assert len(registers) == 0
+
+
+def poll_registers():
+    # Words that differ from register to register, small enough for a datetime.
+    return {
+        4: Registers(
+            [
+                (3004, [(3004 + i) * 7 % 60 for i in range(68)]),
+                (3072, [(3072 + i) * 7 % 60 for i in range(6)]),
+            ]
+        )
+    }
+
+
+def test_a_block_at_a_time_decodes_as_each_sensor_alone(make_app):
+    app = make_app()
+    registers = poll_registers()
+
+    values, missing = app.decode_readings(registers, app.decodings)
+
+    assert missing == []
+    assert values == [
+        app.decode_reading(decoding, registers[4]) for decoding in app.decodings
+    ]
+
+
+def test_a_reading_no_block_holds_is_missing(make_app):
+    app = make_app()
+    registers = {4: Registers([(3004, live_response(3004, 68).registers)])}
+
+    values, missing = app.decode_readings(registers, app.decodings)
+
+    assert [app.decodings[position].name for position in missing] == ["system_datetime"]
+    assert values[missing[0]] is None
+
+
+def test_the_plan_is_kept_for_the_same_sensors_and_blocks(make_app):
+    app = make_app()
+    registers = poll_registers()
+
+    first = app.decode_plan(registers, app.decodings)
+
+    assert app.decode_plan(poll_registers(), list(app.decodings)) is first
+    assert app.decode_plan(registers, app.decodings[:3]) is not first
+
+
+def test_a_sensor_compiled_again_is_planned_again(make_app):
+    app = make_app()
+    registers = poll_registers()
+    app.decode_readings(registers, app.decodings)
+    position = next(
+        i for i, decoding in enumerate(app.decodings) if decoding.scale == 0.1
+    )
+
+    app.sensors_config = copy.deepcopy(app.sensors_config)
+
+    for sensor in app.sensors_config:
+        if sensor["name"] == app.decodings[position].name:
+            sensor["modbus"]["scale"] = 1
+
+    before = app.decode_readings(registers, app.decodings)[0][position]
+    app.compile_sensors()
+    after = app.decode_readings(registers, app.decodings)[0][position]
+
+    assert after == pytest.approx(before * 10)
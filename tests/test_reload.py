@@ -0,0 +1,257 @@
+"""Taking up edits to config.yaml and sensors.yaml between polls.
+
+A restart to turn on one sensor replays discovery for every sensor and the state
+restore, and redials a datalogger that takes one connection at a time. A reload
+redoes only what the edit touched, and leaves what cannot change while running for
+the next restart.
+"""
+
+import copy
+import os
+
+import pytest
+from conftest import StubClient
+
+import app as app_module
+from reload import FileWatcher, diff_sensors, hold_back
+
+
+@pytest.fixture
+def reloadable(make_app):
+    def _reloadable(**config):
+        app = make_app(**config)
+        app.config["mqtt"]["enabled"] = True
+        app.config["inverter"] |= {
+            "name": "Solis",
+            "manufacturer": "Ginlong",
+            "model": "",
+        }
+        app.plan_reads()
+        return app
+
+    return _reloadable
+
+
+def edited(sensors_config, name, **changes):
+    return [
+        sensor | changes if sensor["name"] == name else sensor
+        for sensor in copy.deepcopy(sensors_config)
+    ]
+
+
+def discovery(app):
+    return {
+        topic: payload
+        for topic, payload in app.published
+        if topic.startswith("homeassistant/")
+    }
+
+
+def test_a_touched_file_is_seen_once(tmp_path):
+    path = tmp_path / "sensors.yaml"
+    path.write_text("[]")
+    watcher = FileWatcher([str(path)])
+
+    assert not watcher.changed()
+
+    os.utime(path, ns=(0, 10**18))
+
+    assert watcher.changed()
+    assert not watcher.changed()
+
+
+def test_a_file_that_comes_back_is_changed(tmp_path):
+    path = tmp_path / "config.yaml"
+    watcher = FileWatcher([str(path)])
+    path.write_text("debug: true")
+
+    assert watcher.changed()
+
+
+def test_sensors_are_compared_by_name_and_only_while_active(sensors_config):
+    new = edited(sensors_config, "inverter_temp", active=False)
+    new = edited(new, "active_power", unit="kW")
+
+    changes = diff_sensors(sensors_config, new)
+
+    assert [s["name"] for s in changes.removed] == ["inverter_temp"]
+    assert [s["name"] for s in changes.changed] == ["active_power"]
+    assert changes.added == []
+
+
+def test_a_deactivated_sensor_leaves_the_poll_and_home_assistant(
+    reloadable, sensors_config
+):
+    app = reloadable()
+
+    app.reload(
+        copy.deepcopy(app.config), edited(sensors_config, "inverter_temp", active=False)
+    )
+
+    assert "inverter_temp" not in [d.name for d in app.decodings]
+    assert discovery(app) == {
+        "homeassistant/sensor/tcpsolis2mqtt/inverter_temp/config": ""
+    }
+
+
+def test_only_the_sensors_that_changed_are_announced_again(reloadable, sensors_config):
+    app = reloadable()
+
+    app.reload(
+        copy.deepcopy(app.config),
+        edited(sensors_config, "active_power", description="AC power"),
+    )
+
+    assert list(discovery(app)) == [
+        "homeassistant/sensor/tcpsolis2mqtt/active_power/config"
+    ]
+    assert (
+        "AC power"
+        in discovery(app)["homeassistant/sensor/tcpsolis2mqtt/active_power/config"]
+    )
+
+
+def test_a_renamed_inverter_announces_every_sensor_again(reloadable, sensors_config):
+    app = reloadable()
+    config = copy.deepcopy(app.config)
+    config["inverter"]["name"] = "Roof"
+
+    app.reload(config, sensors_config)
+
+    announced = len(discovery(app))
+    assert announced == sum(
+        1 for s in sensors_config if s["active"] and "homeassistant" in s
+    )
+
+
+def test_a_changed_sensor_is_read_on_the_next_poll(reloadable, sensors_config):
+    app = reloadable()
+    app.last_polled = {"inverter_temp": 100.0, "active_power": 100.0}
+
+    app.reload(copy.deepcopy(app.config), edited(sensors_config, "inverter_temp"))
+    assert app.last_polled == {"inverter_temp": 100.0, "active_power": 100.0}
+
+    app.reload(
+        copy.deepcopy(app.config),
+        edited(sensors_config, "inverter_temp", description="Heatsink"),
+    )
+    assert app.last_polled == {"active_power": 100.0}
+
+
+def test_new_register_chunks_plan_the_reads_again(reloadable, sensors_config):
+    app = reloadable(register_chunks=80)
+    config = copy.deepcopy(app.config)
+    config["datalogger"]["register_chunks"] = 40
+
+    app.reload(config, sensors_config)
+    app.plan_reads()
+
+    assert app.chunk_size.size == 40
+    assert [read.count for read in app.read_plan] == [39, 12]
+
+
+def test_new_register_chunks_keep_the_size_learned_so_far(reloadable, sensors_config):
+    app = reloadable(register_chunks=80, adaptive_chunks=True)
+    app.chunk_size.restore(50)
+    config = copy.deepcopy(app.config)
+    config["datalogger"]["register_chunks"] = 100
+
+    app.reload(config, sensors_config)
+
+    assert app.chunk_size.size == 50
+
+
+def test_adaptive_chunks_turned_off_reads_register_chunks(reloadable, sensors_config):
+    app = reloadable(register_chunks=80, adaptive_chunks=True)
+    app.chunk_size.restore(50)
+    config = copy.deepcopy(app.config)
+    config["datalogger"]["adaptive_chunks"] = False
+
+    app.reload(config, sensors_config)
+
+    assert app.chunk_size.size == 80
+
+
+def test_a_new_datalogger_address_is_dialled(reloadable, sensors_config):
+    app = reloadable(persistent_connection=True)
+    client = app.client = StubClient()
+    config = copy.deepcopy(app.config)
+    config["datalogger"]["host"] = "192.0.2.9"
+
+    app.reload(config, sensors_config)
+
+    assert app.client is None
+    assert client.closes == 1
+
+
+def test_what_needs_a_restart_is_left_as_it_was(reloadable, sensors_config, caplog):
+    app = reloadable()
+    config = copy.deepcopy(app.config)
+    config["mqtt"]["host"] = "192.0.2.7"
+    config["datalogger"]["poll_interval"] = 10
+
+    app.reload(config, sensors_config)
+
+    assert "host" not in app.config["mqtt"]
+    assert app.config["datalogger"]["poll_interval"] == 10
+    assert "mqtt changed" in caplog.text
+
+
+def test_hold_back_restores_a_section_that_appeared():
+    new = {"datalogger": {"proxy": {"enabled": True}}}
+
+    assert hold_back({"datalogger": {}}, new) == ["datalogger.proxy"]
+    assert new == {"datalogger": {}}
+
+
+def test_files_that_do_not_load_leave_the_app_as_it_was(
+    reloadable, monkeypatch, caplog
+):
+    app = reloadable()
+    decodings = app.decodings
+
+    class Changed:
+        def changed(self):
+            return True
+
+    def broken():
+        raise ValueError("mapping values are not allowed here")
+
+    app.watcher = Changed()
+    monkeypatch.setattr(app_module, "load_config", broken)
+
+    app.reload_if_changed()
+
+    assert app.decodings is decodings
+    assert "Not reloading" in caplog.text
+
+
+def test_an_inverter_added_to_the_fleet_waits_for_a_restart(
+    reloadable, sensors_config, monkeypatch, caplog
+):
+    app = reloadable()
+
+    class Changed:
+        def changed(self):
+            return True
+
+    roof = {
+        "topic_prefix": "roof",
+        "datalogger": app.config["datalogger"],
+        "inverter": app.config["inverter"],
+    }
+    fleet = {
+        "debug": False,
+        "capture": {},
+        "mqtt": app.config["mqtt"],
+        "inverters": [roof | {"topic_prefix": "tcpsolis2mqtt"}, roof],
+    }
+    app.watcher = Changed()
+    monkeypatch.setattr(app_module, "load_config", lambda: copy.deepcopy(fleet))
+    monkeypatch.setattr(app_module, "load_sensors_config", lambda: sensors_config)
+
+    app.reload_if_changed()
+    app.reload_if_changed()
+
+    assert caplog.text.count("inverters changed") == 1
+    assert app.fleet == ["tcpsolis2mqtt", "roof"]
@@ -0,0 +1,104 @@
+"""The compiled sensor map, kept between starts.
+
+Parsing sensors.yaml and validating it gives the same map every start until the
+file or the schemas change, so the map is kept in a cache keyed by both and only
+compiled again when one of them has.
+"""
+
+import pickle
+
+import pytest
+from conftest import REPO_ROOT
+
+import app as app_module
+import sensor_cache
+from sensor_cache import CACHE_VERSION, fingerprint, load_sensors
+
+SOURCE = (REPO_ROOT / "sensors.yaml").read_bytes()
+
+
+@pytest.fixture
+def compiles():
+    calls = []
+
+    def compile(source):
+        calls.append(source)
+        return app_module.parse_sensors_config(source)
+
+    compile.calls = calls
+    return compile
+
+
+def test_a_second_start_reuses_the_map(tmp_path, compiles):
+    path = str(tmp_path / "sensors.cache")
+
+    first = load_sensors(SOURCE, path, compiles)
+    second = load_sensors(SOURCE, path, compiles)
+
+    assert second == first
+    assert len(compiles.calls) == 1
+
+
+def test_an_edited_file_is_compiled_again(tmp_path, compiles):
+    path = str(tmp_path / "sensors.cache")
+    load_sensors(SOURCE, path, compiles)
+
+    edited = SOURCE.replace(b"active: true", b"active: false", 1)
+    sensors = load_sensors(edited, path, compiles)
+
+    assert len(compiles.calls) == 2
+    assert sensors == app_module.parse_sensors_config(edited)
+
+
+def test_a_change_to_the_schemas_is_compiled_again(tmp_path, compiles, monkeypatch):
+    path = str(tmp_path / "sensors.cache")
+    load_sensors(SOURCE, path, compiles)
+
+    monkeypatch.setattr(
+        sensor_cache, "fingerprint", lambda source: fingerprint(source) + "changed"
+    )
+    load_sensors(SOURCE, path, compiles)
+
+    assert len(compiles.calls) == 2
+
+
+def test_a_cache_of_another_layout_is_compiled_again(tmp_path, compiles):
+    path = tmp_path / "sensors.cache"
+    path.write_bytes(pickle.dumps((CACHE_VERSION + 1, fingerprint(SOURCE), [])))
+
+    assert load_sensors(SOURCE, str(path), compiles)
+    assert len(compiles.calls) == 1
+
+
+def test_a_damaged_cache_is_compiled_again(tmp_path, compiles):
+    path = tmp_path / "sensors.cache"
+    path.write_bytes(b"\x80\x05 not a pickle")
+
+    assert load_sensors(SOURCE, str(path), compiles)
+    assert pickle.loads(path.read_bytes())[1] == fingerprint(SOURCE)
+
+
+def test_a_cache_that_cannot_be_written_is_not_an_error(tmp_path, compiles):
+    path = str(tmp_path / "missing" / "sensors.cache")
+
+    assert load_sensors(SOURCE, path, compiles)
+    assert load_sensors(SOURCE, path, compiles)
+    assert len(compiles.calls) == 2
+
+
+def test_without_a_path_nothing_is_kept(tmp_path, compiles, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    load_sensors(SOURCE, "", compiles)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_the_app_loads_its_map_through_the_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("SENSORS_FILE", str(REPO_ROOT / "sensors.yaml"))
+    monkeypatch.setenv("SENSORS_CACHE", str(tmp_path / "sensors.cache"))
+
+    first = app_module.load_sensors_config()
+    monkeypatch.setattr(app_module, "parse_sensors_config", None)
+
+    assert app_module.load_sensors_config() == first
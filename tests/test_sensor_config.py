@@ -121,3 +121,33 @@ def test_an_energy_sensor_may_not_claim_any_other_state_class(state_class):
 @pytest.mark.parametrize("state_class", ["total_increasing", None])
 def test_an_energy_sensor_may_be_a_counter_or_a_finished_total(state_class):
     assert Sensor().load(energy_definition(state_class))
+
+
+@pytest.mark.parametrize("function_code", [3, 4])
+def test_holding_and_input_registers_are_both_readable(function_code):
+    sensor = Sensor().load(definition(function_code=function_code))
+
+    assert sensor["modbus"]["function_code"] == function_code
+
+
+def test_a_function_code_that_cannot_be_polled_is_rejected():
+    # 6 writes a register. Nothing in the poll knows how to make that request, so
+    # say so at startup rather than with a KeyError in the first poll.
+    with pytest.raises(ValidationError, match="function_code"):
+        Sensor().load(definition(function_code=6))
+
+
+def test_poll_every_is_a_positive_number_of_seconds():
+    assert Sensor().load(definition(poll_every=300))["modbus"]["poll_every"] == 300
+
+    with pytest.raises(ValidationError, match="poll_every"):
+        Sensor().load(definition(poll_every=0))
+
+
+def test_a_deadband_is_absolute_relative_or_both():
+    loaded = Sensor().load(definition() | {"deadband": {"relative": 0.02}})
+
+    assert loaded["deadband"] == {"relative": 0.02}
+
+    with pytest.raises(ValidationError, match="deadband"):
+        Sensor().load(definition() | {"deadband": {}})
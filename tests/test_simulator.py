@@ -0,0 +1,166 @@
+"""The app against a simulated datalogger, over real sockets.
+
+Everything else here talks to stubs in-process, so none of it exercises TCP: the
+timeouts, keepalive, a stick that refuses a second connection or hangs up on an idle
+one. The simulator does, with those habits adjustable, and these tests hold it to
+what the app expects of the real thing.
+"""
+
+import socket
+from datetime import datetime
+
+import pytest
+import requests
+
+import app as app_module
+from simulator import (
+    CGI_LENGTH,
+    Behaviour,
+    SimulatedCgis,
+    SimulatedDatalogger,
+    SimulatedInverter,
+    serve,
+)
+
+NOON = datetime(2026, 7, 28, 12, 0, 0)
+MIDNIGHT = datetime(2026, 7, 28, 0, 0, 0)
+QUICK = Behaviour(latency=0, jitter=0)
+
+
+@pytest.fixture
+def simulator():
+    servers = []
+
+    def _simulator(behaviour=QUICK, at=NOON):
+        inverter = SimulatedInverter(now=lambda: at)
+        server = serve(SimulatedDatalogger(("127.0.0.1", 0), inverter, behaviour, 1))
+        servers.append(server)
+        return server
+
+    yield _simulator
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def poll(make_app, simulator, monkeypatch):
+    # Waiting out a retry is the one thing left to the test's own clock.
+    monkeypatch.setattr(app_module, "sleep", lambda seconds: None)
+    monkeypatch.setattr(app_module, "MODBUS_TIMEOUT", 0.5)
+
+    def _poll(behaviour=QUICK, at=NOON, **config):
+        server = simulator(behaviour, at)
+        app = make_app(**config)
+        app.config["datalogger"]["host"], app.config["datalogger"]["port"] = (
+            server.server_address
+        )
+        app.plan_reads()
+        return app, server, app.query_modbus()
+
+    return _poll
+
+
+def test_a_poll_reads_the_whole_map(poll):
+    app, server, registers = poll()
+
+    assert len(registers[4]) == 74
+    assert app.publish_readings(registers)
+    published = dict(app.published)
+    assert published["tcpsolis2mqtt/active_power"] == 5000
+    assert published["tcpsolis2mqtt/inverter_temp"] == 45.0
+
+
+def test_the_inverter_sleeps_at_night(poll):
+    app, server, registers = poll(at=MIDNIGHT)
+
+    assert registers == {}
+    assert server.counts["requests"] == app_module.CHUNK_ATTEMPTS
+
+
+def test_a_request_wider_than_the_stick_takes_shrinks_the_chunks(poll):
+    # 39 registers and then 12: the first refused, the second read.
+    app, server, registers = poll(
+        QUICK._replace(max_count=30), adaptive_chunks=True, register_chunks=40
+    )
+
+    assert len(registers[4]) == 12
+    assert app.chunk_size.size == 30
+
+
+def test_a_poll_refused_throughout_leaves_the_chunks_alone(poll):
+    app, server, registers = poll(
+        QUICK._replace(max_count=60), adaptive_chunks=True, register_chunks=80
+    )
+
+    assert registers == {}
+    assert app.chunk_size.size == 80
+
+
+def test_an_unanswered_request_times_out_and_redials(poll):
+    # Shared, or a redial can beat the stick to noticing the last connection went.
+    app, server, registers = poll(QUICK._replace(drop=1.0, exclusive=False))
+
+    assert registers == {}
+    assert server.counts["connections"] == app_module.CHUNK_ATTEMPTS
+
+
+def test_a_second_connection_is_turned_away(simulator):
+    server = simulator()
+
+    with socket.create_connection(server.server_address, timeout=2) as first:
+        # A request answered on the first proves it holds the line.
+        first.sendall(bytes.fromhex("0001000000060104 0bd7 0001".replace(" ", "")))
+        assert first.recv(64)
+
+        with socket.create_connection(server.server_address, timeout=2) as second:
+            assert second.recv(64) == b""
+
+    assert server.counts["refused_connections"] == 1
+
+
+def test_a_header_with_a_length_of_nothing_closes_the_connection(simulator):
+    server = simulator()
+
+    with socket.create_connection(server.server_address, timeout=2) as connection:
+        connection.sendall(bytes.fromhex("00010000000001"))
+
+        assert connection.recv(64) == b""
+
+    assert "requests" not in server.counts
+
+
+def test_a_read_of_the_wrong_length_is_a_bad_value(simulator):
+    server = simulator()
+
+    with socket.create_connection(server.server_address, timeout=2) as connection:
+        # Read input registers from 3031, the count left off.
+        connection.sendall(bytes.fromhex("00010000000401040bd7"))
+
+        assert connection.recv(64)[7:] == bytes((0x84, 0x03))
+
+
+def test_an_idle_connection_is_closed(simulator):
+    server = simulator(QUICK._replace(idle_timeout=0.2))
+
+    with socket.create_connection(server.server_address, timeout=2) as connection:
+        assert connection.recv(64) == b""
+
+
+def test_the_cgis_are_padded_as_the_stick_pads_them():
+    server = serve(SimulatedCgis(("127.0.0.1", 0), SimulatedInverter(now=lambda: NOON)))
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    try:
+        refused = requests.get(f"{base}/inverter.cgi", timeout=2)
+        answer = requests.get(
+            f"{base}/inverter.cgi", auth=("admin", "123456789"), timeout=2
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert refused.status_code == 401
+    assert len(answer.content) == CGI_LENGTH
+    assert answer.text.strip("\x00").startswith("1805090232050086;83003A;509;")
@@ -0,0 +1,152 @@
+"""What a restart costs before the first poll.
+
+Every image update restarts the container, and each restart is a gap in the
+readings. What startup does that a poll never needs is put off or done once: the
+HTTP client, the servers and the storage backends are loaded on first use, the .env
+file is looked for once, and the local date and timezone come from the standard
+library rather than from arrow.
+"""
+
+import subprocess
+import sys
+import time
+
+import arrow
+import pytest
+import yaml
+from conftest import REPO_ROOT
+
+import app as app_module
+from app import Stopwatch
+
+
+def test_importing_the_app_leaves_the_http_client_unloaded():
+    # In a process of its own: this one has long since loaded requests for the
+    # simulator's tests.
+    loaded = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys; import app; print('urllib3' in sys.modules)",
+        ],
+        cwd=REPO_ROOT / "app",
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert loaded.stdout.strip() == "False"
+
+
+def test_importing_the_app_leaves_the_servers_and_backends_unloaded():
+    # Each is behind a setting that is off by default, or in sensor_cache's case,
+    # only needed once the cache file is read.
+    modules = ["http.server", "socketserver", "sqlite3", "pickle"]
+    loaded = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys; import app; "
+            f"print([m for m in {modules} if m in sys.modules])",
+        ],
+        cwd=REPO_ROOT / "app",
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert loaded.stdout.strip() == "[]"
+
+
+def test_the_http_client_loads_when_it_is_used():
+    assert app_module.requests.get is not None
+    assert app_module.requests.exceptions.Timeout
+
+
+def test_the_environment_is_read_once(monkeypatch, tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        yaml.safe_dump(
+            {
+                "datalogger": {"host": "192.0.2.1"},
+                "inverter": {"name": "Solis", "max_power_kw": 15},
+                "mqtt": {"enabled": True, "host": "192.0.2.2"},
+            }
+        )
+    )
+    reads = []
+    monkeypatch.setattr(app_module.Env, "read_env", lambda self: reads.append(self))
+    monkeypatch.setenv("CONFIG_FILE", str(config_file))
+    monkeypatch.setenv("SENSORS_FILE", str(REPO_ROOT / "sensors.yaml"))
+    app_module.environment.cache_clear()
+
+    try:
+        app_module.load_config()
+        app_module.load_sensors_config()
+    finally:
+        app_module.environment.cache_clear()
+
+    assert len(reads) == 1
+
+
+@pytest.mark.parametrize("zone", ["Europe/Stockholm", "America/St_Johns", "UTC"])
+def test_the_timezone_offset_is_written_as_arrow_wrote_it(monkeypatch, zone):
+    monkeypatch.setenv("TZ", zone)
+    time.tzset()
+
+    try:
+        offset = app_module.local_timezone_offset()
+        expected = arrow.now("local").format("ZZ")
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+    assert offset == expected
+
+
+def test_the_startup_report_names_each_step(monkeypatch):
+    ticks = iter([10.0, 10.25, 11.0])
+    monkeypatch.setattr(app_module, "perf_counter", lambda: next(ticks))
+    monkeypatch.setattr(app_module, "process_age", lambda: 0.4)
+
+    stopwatch = Stopwatch()
+    stopwatch.lap("config")
+    stopwatch.lap("inverters")
+
+    assert stopwatch.report() == (
+        "Started in 1000 ms after 400 ms of interpreter start-up and imports: "
+        "config 250 ms, inverters 750 ms"
+    )
+
+
+def test_without_a_process_start_time_the_report_leaves_it_out(monkeypatch):
+    ticks = iter([10.0, 10.25])
+    monkeypatch.setattr(app_module, "perf_counter", lambda: next(ticks))
+    monkeypatch.setattr(app_module, "process_age", lambda: None)
+
+    stopwatch = Stopwatch()
+    stopwatch.lap("config")
+
+    assert stopwatch.report() == "Started in 250 ms: config 250 ms"
+
+
+@pytest.mark.skipif(
+    not sys.platform.startswith("linux"), reason="the process start time is Linux's"
+)
+def test_the_process_age_is_wall_time_not_cpu_time():
+    # A child that sleeps half a second before asking: CPU time would be a fraction
+    # of that.
+    age = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, time; time.sleep(0.5); sys.path.insert(0, 'app'); "
+            "import app; print(app.process_age())",
+        ],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+    assert float(age) >= 0.45
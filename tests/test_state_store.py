@@ -0,0 +1,116 @@
+"""Where the counters' state is kept between runs.
+
+It used to live only in retained topics, so restoring it waited on the broker and
+with MQTT off there was nothing to restore: a restart replayed the midnight reset and
+left the lifetime counter without a floor. state.backend: sqlite keeps it in a local
+file as well, written through as it changes and read back without the network.
+"""
+
+import sqlite3
+
+import pytest
+from config import AppConfig
+from state import NoState, SqliteState, open_state
+
+DAY_TOPIC = "tcpsolis2mqtt/_state/current_day"
+PREVIOUS_TOPIC = "tcpsolis2mqtt/_state/generation_today/previous_total"
+LIFETIME_TOPIC = "tcpsolis2mqtt/total_power"
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "state.sqlite")
+
+
+def test_what_is_saved_is_there_after_a_restart(path):
+    SqliteState(path).save(DAY_TOPIC, "2026-07-28")
+
+    assert SqliteState(path).load([DAY_TOPIC]) == {DAY_TOPIC: "2026-07-28"}
+
+
+def test_topics_are_matched_as_the_broker_would(path):
+    store = SqliteState(path)
+    store.save(DAY_TOPIC, "2026-07-28")
+    store.save(PREVIOUS_TOPIC, 40.0)
+    store.save(LIFETIME_TOPIC, 39901)
+    store.save("other/_state/current_day", "2026-07-28")
+
+    assert store.load(["tcpsolis2mqtt/_state/#"]) == {
+        DAY_TOPIC: "2026-07-28",
+        PREVIOUS_TOPIC: "40.0",
+    }
+
+
+def test_the_file_is_write_ahead_logged(path):
+    SqliteState(path)
+
+    assert sqlite3.connect(path).execute("PRAGMA journal_mode").fetchone() == ("wal",)
+
+
+def test_an_unchanged_value_is_not_written_again(path):
+    store = SqliteState(path)
+    store.save(LIFETIME_TOPIC, 39901)
+    writes = store.connection.total_changes
+
+    store.save(LIFETIME_TOPIC, 39901)
+
+    assert store.connection.total_changes == writes
+
+
+def test_mqtt_is_the_default_backend():
+    config = AppConfig().load(
+        {
+            "datalogger": {"host": "192.0.2.1"},
+            "inverter": {"max_power_kw": 15},
+            "mqtt": {"enabled": True, "host": "192.0.2.2"},
+        }
+    )
+
+    assert config["state"]["backend"] == "mqtt"
+
+
+def test_without_mqtt_or_a_file_there_is_nothing_to_restore():
+    store = open_state({"backend": "mqtt"}, None)
+
+    assert isinstance(store, NoState)
+    assert store.load([DAY_TOPIC]) == {}
+
+
+def test_a_restart_with_mqtt_off_remembers_the_day(make_app, clock, path):
+    app = make_app(day="2026-07-29")
+    app.state = SqliteState(path)
+    app.current_day = "2026-07-28"
+    app.last_accepted_value["generation_today"] = (103.2, clock.now)
+    app.reset_counters()
+
+    restarted = make_app(day="2026-07-29")
+    restarted.state = SqliteState(path)
+    restarted.load_state()
+
+    # Not replaying the reset, and still recognising yesterday's total on sight.
+    assert restarted.current_day == "2026-07-29"
+    assert restarted.previous_period_total["generation_today"] == 103.2
+    assert restarted.awaiting_new_period["generation_today"] is True
+
+
+def test_the_lifetime_floor_is_written_through(make_app, clock, sensors_config, path):
+    total_power = next(s for s in sensors_config if s["name"] == "total_power")
+    app = make_app()
+    app.state = SqliteState(path)
+    app.value_is_plausible(total_power, 39901)
+
+    restarted = make_app()
+    restarted.state = SqliteState(path)
+    restarted.load_state()
+
+    assert restarted.last_accepted_value["total_power"] == (39901.0, None)
+
+
+def test_the_retained_topics_are_still_published(make_app, clock, path):
+    app = make_app(day="2026-07-29")
+    app.state = SqliteState(path)
+    app.current_day = "2026-07-28"
+
+    app.reset_counters()
+
+    assert (DAY_TOPIC, "2026-07-29") in app.published
@@ -0,0 +1,399 @@
+import argparse
+import base64
+import logging
+import math
+import random
+import struct
+import sys
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from threading import Lock, Thread
+from time import sleep
+from typing import Callable, NamedTuple
+
+# Beside the app rather than in it, so that it stays out of the image, and speaking
+# Modbus with the proxy's own framing.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from proxy import (  # noqa: E402
+    GATEWAY_TARGET_FAILED,
+    ILLEGAL_DATA_ADDRESS,
+    ILLEGAL_DATA_VALUE,
+    ILLEGAL_FUNCTION,
+    MAX_LENGTH,
+    MBAP,
+    MIN_LENGTH,
+    READ_FUNCTIONS,
+    exception,
+)
+
+# The registers the simulated inverter has, in either table. Outside them a read is
+# refused, as the stick refuses it.
+REGISTERS = range(3000, 3300)
+
+# Both CGIs answer with a fixed buffer: NULs, the fields, and NULs to the end. See
+# HTTP_PADDING in app.py.
+CGI_LENGTH = 1313
+CGI_LEADING_PADDING = 33
+
+
+class Behaviour(NamedTuple):
+    """How the simulated datalogger treats its clients."""
+
+    # Seconds each request takes to answer, give or take up to jitter.
+    latency: float = 0.3
+    jitter: float = 0.1
+    # The chance a request is never answered, and the chance the datalogger hangs
+    # up instead of answering.
+    drop: float = 0.0
+    reset: float = 0.0
+    # Seconds a connection may sit without a request before it is closed. 0 never.
+    idle_timeout: float = 120
+    # The widest request answered. Wider ones are refused.
+    max_count: int = 125
+    # One connection at a time: another one is closed as soon as it is accepted.
+    exclusive: bool = True
+
+
+def daylight(now: datetime) -> float:
+    # 0 at night, rising to 1 at noon: a clear day from 06:00 to 18:00.
+    hours = now.hour + now.minute / 60 + now.second / 3600
+
+    if not 6 <= hours < 18:
+        return 0.0
+
+    return math.sin(math.pi * (hours - 6) / 12)
+
+
+class SimulatedInverter:
+    """Register values of an inverter on a clear day, computed from the clock.
+
+    Enough of one for the shipped sensors.yaml to decode every reading to something
+    plausible: power that follows the sun, today's energy that is its integral, a
+    lifetime total that grows with it, and the inverter's own clock. Asleep between
+    sunset and sunrise, when the datalogger refuses every read as the real one does.
+    """
+
+    def __init__(
+        self,
+        max_power_kw: float = 5.0,
+        total_kwh: int = 40000,
+        sleeps: bool = True,
+        now: Callable[[], datetime] = datetime.now,
+    ):
+        self.max_power_kw = max_power_kw
+        self.total_kwh = total_kwh
+        self.sleeps = sleeps
+        self.now = now
+
+    def asleep(self) -> bool:
+        return self.sleeps and daylight(self.now()) == 0
+
+    def generated_today(self, now: datetime) -> float:
+        # kWh since sunrise, the integral of the power curve.
+        hours = min(max(now.hour + now.minute / 60 - 6, 0), 12)
+        return self.max_power_kw * 12 / math.pi * (1 - math.cos(math.pi * hours / 12))
+
+    def input_registers(self) -> dict[int, int]:
+        now = self.now()
+        sun = daylight(now)
+        power = round(self.max_power_kw * 1000 * sun)
+        today = self.generated_today(now)
+        total = self.total_kwh + int(today)
+
+        registers = {address: 0 for address in REGISTERS}
+        registers.update(
+            {
+                3004: power >> 16,
+                3005: power & 0xFFFF,
+                3006: round(power * 1.03) >> 16,
+                3007: round(power * 1.03) & 0xFFFF,
+                3008: total >> 16,
+                3009: total & 0xFFFF,
+                3014: round(today * 10),
+                3015: round(self.max_power_kw * 76),
+                3021: round(3500 * sun),
+                3022: round(self.max_power_kw * 100 * sun / 3.5),
+                3033: 2300 + now.second % 7,
+                3036: round(power / 23),
+                3041: round(250 + 200 * sun),
+                3042: 5000,
+                3072: now.year % 100,
+                3073: now.month,
+                3074: now.day,
+                3075: now.hour,
+                3076: now.minute,
+                3077: now.second,
+            }
+        )
+        return registers
+
+    def cgi(self, name: str) -> str:
+        # The fields of inverter.cgi or moniter.cgi. Asleep, the inverter's own page
+        # answers with nothing in the fields the app reads, as on 2026-08-19.
+        if name == "inverter":
+            fields = (
+                ";000000;0;0.0;0;0.0;0;NO;\r\n"
+                if self.asleep()
+                else "1805090232050086;83003A;509;29.2;240;50.599998;41298;NO;\r\n"
+            )
+        else:
+            fields = (
+                ";3;7A123208131058AB;10010125;Disabled;null;null;Enabled;Simulated;"
+                "24;127.0.0.1;92:78:48:DA:27:75;Connected;null;"
+            )
+
+        return ("\x00" * CGI_LEADING_PADDING + fields).ljust(CGI_LENGTH, "\x00")
+
+
+class DataloggerHandler(StreamRequestHandler):
+    """One Modbus TCP connection to the simulated datalogger."""
+
+    def handle(self):
+        server = self.server
+
+        # The one connection is taken: accepted, then closed at once.
+        if server.behaviour.exclusive and not server.line.acquire(blocking=False):
+            server.count("refused_connections")
+            return
+
+        server.count("connections")
+
+        try:
+            self.connection.settimeout(server.behaviour.idle_timeout or None)
+            self.serve_requests()
+        except TimeoutError:
+            server.count("idle_disconnects")
+        finally:
+            if server.behaviour.exclusive:
+                server.line.release()
+
+    def serve_requests(self):
+        server = self.server
+
+        while True:
+            header = self.rfile.read(MBAP.size)
+
+            if len(header) < MBAP.size:
+                return
+
+            transaction, protocol, length, unit = MBAP.unpack(header)
+
+            if protocol != 0 or not MIN_LENGTH <= length <= MAX_LENGTH:
+                return
+
+            pdu = self.rfile.read(length - 1)
+
+            if len(pdu) != length - 1:
+                return
+
+            server.count("requests")
+            fate = server.fate()
+            sleep(server.delay())
+
+            if fate == "reset":
+                server.count("resets")
+                return
+
+            if fate == "drop":
+                server.count("drops")
+                continue
+
+            answer = server.answer(pdu)
+            self.wfile.write(MBAP.pack(transaction, 0, len(answer) + 1, unit) + answer)
+
+
+class SimulatedDatalogger(ThreadingTCPServer):
+    """The Modbus TCP side of an S2-WL-ST, with its habits made adjustable.
+
+    The test suite talks to stubs in-process, so nothing there exercises real TCP:
+    the timeouts, keepalive, a stick that hangs up on an idle connection or refuses a
+    second one. This does, locally, for benchmarking polling strategies and fleets
+    without touching a real datalogger. Random with a seed, so a run can be repeated.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        inverter: SimulatedInverter,
+        behaviour: Behaviour = Behaviour(),
+        seed: int | None = None,
+    ):
+        super().__init__(address, DataloggerHandler)
+        self.inverter = inverter
+        self.behaviour = behaviour
+        self.random = random.Random(seed)
+        self.line = Lock()
+        self.lock = Lock()
+        self.counts: dict[str, int] = {}
+
+    def count(self, what: str) -> None:
+        with self.lock:
+            self.counts[what] = self.counts.get(what, 0) + 1
+
+    def fate(self) -> str:
+        with self.lock:
+            roll = self.random.random()
+
+        if roll < self.behaviour.reset:
+            return "reset"
+
+        if roll < self.behaviour.reset + self.behaviour.drop:
+            return "drop"
+
+        return "answer"
+
+    def delay(self) -> float:
+        with self.lock:
+            jitter = self.random.uniform(-1, 1) * self.behaviour.jitter
+
+        return max(0, self.behaviour.latency + jitter)
+
+    def answer(self, pdu: bytes) -> bytes:
+        function_code = pdu[0] if pdu else 0
+
+        if function_code not in READ_FUNCTIONS:
+            return exception(function_code, ILLEGAL_FUNCTION)
+
+        # A read, but not the address and count one is made of.
+        if len(pdu) != 5:
+            return exception(function_code, ILLEGAL_DATA_VALUE)
+
+        address, count = struct.unpack(">HH", pdu[1:])
+
+        if not 1 <= count <= self.behaviour.max_count:
+            return exception(function_code, ILLEGAL_DATA_VALUE)
+
+        if address not in REGISTERS or address + count - 1 not in REGISTERS:
+            return exception(function_code, ILLEGAL_DATA_ADDRESS)
+
+        # The datalogger is up while the inverter sleeps, and declines every read.
+        if self.inverter.asleep():
+            return exception(function_code, GATEWAY_TARGET_FAILED)
+
+        # Holding registers are there to be asked for, and hold nothing.
+        registers = self.inverter.input_registers() if function_code == 4 else {}
+        values = [registers.get(a, 0) for a in range(address, address + count)]
+
+        return struct.pack(f">BB{count}H", function_code, 2 * count, *values)
+
+
+class CgiHandler(BaseHTTPRequestHandler):
+    """inverter.cgi and moniter.cgi, behind the stick's basic auth."""
+
+    def do_GET(self):
+        name = self.path.strip("/").removesuffix(".cgi")
+
+        if name not in ("inverter", "moniter"):
+            self.send_error(404)
+            return
+
+        expected = base64.b64encode(self.server.credentials.encode()).decode()
+
+        if self.headers.get("Authorization") != f"Basic {expected}":
+            self.send_response(401)
+            self.send_header("WWW-Authenticate", 'Basic realm="USER LOGIN"')
+            self.end_headers()
+            return
+
+        body = self.server.inverter.cgi(name).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SimulatedCgis(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        inverter: SimulatedInverter,
+        user: str = "admin",
+        password: str = "123456789",
+    ):
+        super().__init__(address, CgiHandler)
+        self.inverter = inverter
+        self.credentials = f"{user}:{password}"
+
+
+def serve(server):
+    Thread(target=server.serve_forever, name="simulator", daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="A simulated Solis S2-WL-ST datalogger: Modbus TCP and the CGIs."
+    )
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=502, help="Modbus TCP port")
+    parser.add_argument(
+        "--http-port",
+        type=int,
+        default=80,
+        help="port for the CGIs, which the app always asks on 80. 0 turns them off",
+    )
+    parser.add_argument("--max-power-kw", type=float, default=5.0)
+    parser.add_argument(
+        "--awake", action="store_true", help="generate at night rather than sleep"
+    )
+    defaults = Behaviour()
+    parser.add_argument("--latency", type=float, default=defaults.latency)
+    parser.add_argument("--jitter", type=float, default=defaults.jitter)
+    parser.add_argument("--drop", type=float, default=defaults.drop)
+    parser.add_argument("--reset", type=float, default=defaults.reset)
+    parser.add_argument("--idle-timeout", type=float, default=defaults.idle_timeout)
+    parser.add_argument("--max-count", type=int, default=defaults.max_count)
+    parser.add_argument(
+        "--shared",
+        action="store_true",
+        help="accept any number of connections rather than one at a time",
+    )
+    parser.add_argument("--seed", type=int)
+    arguments = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+
+    inverter = SimulatedInverter(arguments.max_power_kw, sleeps=not arguments.awake)
+    behaviour = Behaviour(
+        arguments.latency,
+        arguments.jitter,
+        arguments.drop,
+        arguments.reset,
+        arguments.idle_timeout,
+        arguments.max_count,
+        not arguments.shared,
+    )
+    modbus = serve(
+        SimulatedDatalogger(
+            (arguments.host, arguments.port), inverter, behaviour, arguments.seed
+        )
+    )
+    logging.info(f"Simulating a datalogger on {arguments.host}:{arguments.port}")
+
+    if arguments.http_port:
+        serve(SimulatedCgis((arguments.host, arguments.http_port), inverter))
+        logging.info(f"Serving the CGIs on {arguments.host}:{arguments.http_port}")
+
+    # What it has seen so far, once a minute, until interrupted.
+    try:
+        while True:
+            sleep(60)
+            logging.info(f"So far: {modbus.counts}")
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()